@@ -0,0 +1,125 @@
+"""
+Differenzieller Lauf gegen ein früheres Ergebnis (--baseline).
+
+Als Baseline taugt die JSONL-Ergebnisdatei eines früheren Laufs
+(--results, enthält Status pro Stream-Hash) oder einfach die frühere
+Ausgabe-Playlist (alle Streams darin gelten als funktionierend).
+
+Getestet werden neue Streams, früher übersprungene und eine Stichprobe
+aller übrigen (funktionierende wie tote — so wird über mehrere Läufe
+jeder Stream irgendwann erneut geprüft); der Rest wird mit dem alten
+Status übernommen. Am Ende gibt es einen Delta-Bericht: neu, entfernt,
+neu tot, wieder da.
+"""
+import json
+import random
+
+from result_stream import stream_hash
+
+# Status, die nichts über den Stream sagen — nie übernehmen, immer testen
+NEVER_CARRY = ('skipped', 'cancelled')
+
+
+class Baseline:
+
+    def __init__(self, path, statuses: dict, urls: dict):
+        self.path = path
+        self.statuses = statuses  # hash -> status
+        self.urls = urls          # hash -> url
+
+    @classmethod
+    def load(cls, path):
+        """JSONL-Ergebnisse (letzter Status pro Hash zählt) oder M3U-Playlist"""
+        statuses, urls = {}, {}
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            first = ''
+            for line in f:
+                if line.strip():
+                    first = line.strip()
+                    break
+            f.seek(0)
+            if first.startswith('{'):
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # abgebrochene letzte Zeile eines laufenden Laufs
+                    if record.get('type') != 'result' or not record.get('url'):
+                        continue
+                    h = record.get('hash') or stream_hash(record['url'])
+                    statuses[h] = record.get('status')
+                    urls[h] = record['url']
+            else:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#') and '://' in line:
+                        h = stream_hash(line)
+                        statuses[h] = 'working'
+                        urls[h] = line
+        return cls(path, statuses, urls)
+
+    @property
+    def working(self):
+        return sum(1 for s in self.statuses.values() if s == 'working')
+
+    def plan(self, streams, sample: float = 0.1, rng=None):
+        """
+        Aufteilen in (zu testen, übernommen). übernommen ist eine Liste
+        von (stream, alter_status). Von den bekannten Streams wird der
+        Anteil sample erneut getestet, unabhängig vom alten Status.
+        """
+        rng = rng or random.Random()
+        probe, carried = [], []
+        for s in streams:
+            old = self.statuses.get(s.get('hash') or stream_hash(s['url']))
+            if old is None or old in NEVER_CARRY or rng.random() < sample:
+                probe.append(s)
+            else:
+                carried.append((s, old))
+        return probe, carried
+
+    def delta(self, current_hashes: set, probed: dict, limit: int = 50) -> dict:
+        """
+        Delta-Bericht. probed: hash -> neuer Status der in diesem Lauf
+        getesteten Streams.
+        """
+        added = current_hashes - self.statuses.keys()
+        removed = self.statuses.keys() - current_hashes
+        newly_dead = [
+            h for h, status in probed.items()
+            if self.statuses.get(h) == 'working' and status not in ('working',) + NEVER_CARRY
+        ]
+        revived = [
+            h for h, status in probed.items()
+            if status == 'working' and self.statuses.get(h) not in (None, 'working')
+        ]
+        added_working = [h for h in added if probed.get(h) == 'working']
+        rechecked = [h for h in probed if self.statuses.get(h) == 'working']
+        return {
+            'baseline': str(self.path),
+            'added': len(added),
+            'added_working': len(added_working),
+            'removed': len(removed),
+            'removed_working': sum(1 for h in removed if self.statuses[h] == 'working'),
+            'rechecked': len(rechecked),
+            'newly_dead': len(newly_dead),
+            'revived': len(revived),
+            'newly_dead_urls': sorted(self.urls.get(h, h) for h in newly_dead)[:limit],
+            'removed_urls': sorted(self.urls.get(h, h) for h in removed)[:limit],
+        }
+
+
+def print_delta(delta: dict, limit: int = 10):
+    print(f"\n🔀 Delta zur Baseline ({delta['baseline']}):")
+    print(f"   ➕ Neu:        {delta['added']} (davon funktionierend: {delta['added_working']})")
+    print(f"   ➖ Entfernt:   {delta['removed']} (davon funktionierend: {delta['removed_working']})")
+    print(f"   🔁 Stichprobe: {delta['rechecked']} früher funktionierende erneut getestet")
+    print(f"   💀 Neu tot:    {delta['newly_dead']}")
+    if delta.get('revived'):
+        print(f"   🩹 Wieder da:  {delta['revived']} früher nicht funktionierende")
+    for url in delta['newly_dead_urls'][:limit]:
+        print(f"      {url}")
+    if delta['rechecked'] and delta['newly_dead']:
+        rate = delta['newly_dead'] / delta['rechecked'] * 100
+        # Hohe Ausfallquote in der Stichprobe -> übernommene Streams sind vermutlich auch veraltet
+        print(f"   Ausfallquote der Stichprobe: {rate:.1f}%")
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Reproduzierbarer Durchsatz-Benchmark für check_iptv_pro.py und
+m3u_combiner_fixed.py — ohne echte IPTV-Server.
+
+Ein lokaler HTTP-Server liefert per ffmpeg erzeugte Test-Streams
+(MPEG-TS und HLS) mit einstellbarer Mischung aus gesunden, langsamen,
+hängenden, 403-, Standbild-, stummen und Paywall-Streams. Gemessen
+werden Streams/s, p50/p99-Latenz pro Stream, CPU-Zeit und RSS; das
+Ergebnis landet als JSON und kann mit einem früheren Lauf verglichen
+werden (--compare).
+
+Beispiel:
+  python bench_streams.py -n 100 --mix healthy=50,slow=10,stall=5,forbidden=10,static=10,silent=10,paywall=5
+  python bench_streams.py --target combiner -o neu.json --compare alt.json
+"""
+import io
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+from pathlib import Path
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+try:
+    import resource  # nur POSIX
+except ImportError:
+    resource = None
+
+if sys.platform.startswith('win'):
+    sys.stdout.reconfigure(encoding='utf-8')
+
+KINDS = ('healthy', 'hls', 'slow', 'stall', 'forbidden', 'static', 'silent', 'paywall')
+DEFAULT_MIX = 'healthy=40,hls=10,slow=10,stall=5,forbidden=10,static=10,silent=10,paywall=5'
+
+FIXTURE_SECONDS = 12      # reicht für grab_frame(-ss 5) und den astats-Durchlauf
+SLOW_RATE = 24 * 1024     # Bytes/s für "slow" — langsamer als Echtzeit
+STALL_AFTER = 64 * 1024   # "stall" liefert so viele Bytes und hängt dann
+CHUNK = 16 * 1024
+
+VIDEO = ['-c:v', 'mpeg2video', '-b:v', '400k', '-g', '25']
+AUDIO = ['-c:a', 'mp2', '-b:a', '64k']
+MOVING = ['-f', 'lavfi', '-i', 'testsrc2=size=320x240:rate=25']
+TONE = ['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100']
+SILENCE = ['-f', 'lavfi', '-i', 'anullsrc=channel_layout=stereo:sample_rate=44100']
+
+
+# ---------- Test-Streams erzeugen ----------
+
+def _ffmpeg(ffmpeg, args, out):
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', *args, '-t', str(FIXTURE_SECONDS), *out]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def build_fixtures(ffmpeg, directory: Path):
+    """Erzeugt die Test-Streams einmalig (vorhandene werden wiederverwendet)"""
+    directory.mkdir(parents=True, exist_ok=True)
+    ts = ['-f', 'mpegts']
+    recipes = {
+        # healthy/slow/stall teilen sich dieselbe Datei, unterscheiden sich nur im Server
+        'healthy.ts': (MOVING + TONE + VIDEO + AUDIO, ts),
+        'silent.ts': (MOVING + SILENCE + VIDEO + AUDIO, ts),
+        'static.ts': (['-f', 'lavfi', '-i', 'color=c=0x336699:size=320x240:rate=25'] + VIDEO + ['-an'], ts),
+    }
+    for name, (args, fmt) in recipes.items():
+        target = directory / name
+        if not target.exists():
+            print(f"  🎬 Erzeuge {name}")
+            _ffmpeg(ffmpeg, args, fmt + [str(target)])
+
+    paywall = directory / 'paywall.ts'
+    if not paywall.exists():
+        print("  🎬 Erzeuge paywall.ts")
+        slate = ('color=c=0x202040:size=640x360:rate=25,'
+                 'drawtext=text=\'SUBSCRIBE - PAYMENT EXPIRED\':fontcolor=white:fontsize=36:'
+                 'x=(w-text_w)/2:y=(h-text_h)/2')
+        try:
+            _ffmpeg(ffmpeg, ['-f', 'lavfi', '-i', slate] + TONE + VIDEO + AUDIO, ts + [str(paywall)])
+        except subprocess.CalledProcessError:
+            # ffmpeg ohne drawtext (fontconfig) — Standbild ohne Text, OCR findet dann nichts
+            print("  ⚠️ drawtext nicht verfügbar, Paywall-Slate ohne Text")
+            plain = 'color=c=0x202040:size=640x360:rate=25'
+            _ffmpeg(ffmpeg, ['-f', 'lavfi', '-i', plain] + TONE + VIDEO + AUDIO, ts + [str(paywall)])
+
+    hls = directory / 'hls'
+    if not (hls / 'index.m3u8').exists():
+        print("  🎬 Erzeuge hls/index.m3u8")
+        hls.mkdir(exist_ok=True)
+        _ffmpeg(ffmpeg, MOVING + TONE + VIDEO + AUDIO,
+                ['-f', 'hls', '-hls_time', '2', '-hls_list_size', '0',
+                 '-hls_segment_filename', str(hls / 'seg%03d.ts'), str(hls / 'index.m3u8')])
+
+
+# ---------- Lokaler Stream-Server ----------
+
+class StreamFarmHandler(BaseHTTPRequestHandler):
+    fixtures: Path = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        # /s/<art>/<nr>.ts  bzw.  /s/hls/<nr>/<datei>
+        parts = self.path.split('?', 1)[0].strip('/').split('/')
+        if len(parts) < 3 or parts[0] != 's' or parts[1] not in KINDS:
+            self.send_error(404)
+            return
+        kind = parts[1]
+        try:
+            if kind == 'forbidden':
+                self.send_error(403, 'Forbidden')
+            elif kind == 'hls':
+                self._send_file(self.fixtures / 'hls' / Path(parts[-1]).name)
+            elif kind in ('healthy', 'slow', 'stall'):
+                self._send_file(self.fixtures / 'healthy.ts', kind)
+            else:
+                self._send_file(self.fixtures / f'{kind}.ts')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_file(self, path: Path, behaviour='healthy'):
+        if not path.is_file():
+            self.send_error(404)
+            return
+        size = path.stat().st_size
+        ctype = 'application/vnd.apple.mpegurl' if path.suffix == '.m3u8' else 'video/mp2t'
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+
+        sent = 0
+        with open(path, 'rb') as f:
+            while chunk := f.read(CHUNK):
+                if behaviour == 'stall' and sent >= STALL_AFTER:
+                    # Verbindung offen halten, bis der Client aufgibt
+                    time.sleep(120)
+                    return
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if behaviour == 'slow':
+                    time.sleep(len(chunk) / SLOW_RATE)
+
+
+def start_server(fixtures: Path):
+    handler = type('Handler', (StreamFarmHandler,), {'fixtures': fixtures})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise SystemExit(f"❌ Unbekannte Stream-Art: {kind} (erlaubt: {', '.join(KINDS)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def write_playlist(path: Path, base_url: str, mix: dict, count: int, seed: int):
+    """Playlist mit count Streams nach Gewichten in mix; gibt [(url, art)] zurück"""
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    entries = []
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('#EXTM3U\n')
+        for i, kind in enumerate(kinds):
+            url = f"{base_url}/s/hls/{i}/index.m3u8" if kind == 'hls' else f"{base_url}/s/{kind}/{i}.ts"
+            f.write(f'#EXTINF:-1 group-title="{kind}",{kind} {i}\n{url}\n')
+            entries.append((url, kind))
+    return entries
+
+
+# ---------- Messung ----------
+
+def percentile(values, p):
+    """Nearest-Rank-Perzentil"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(p / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def latency_summary(values):
+    return {
+        'n': len(values),
+        'p50_ms': _ms(percentile(values, 50)),
+        'p90_ms': _ms(percentile(values, 90)),
+        'p99_ms': _ms(percentile(values, 99)),
+        'max_ms': _ms(max(values) if values else None),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def _usage():
+    if resource is None:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'cpu_s': own.ru_utime + own.ru_stime,
+        'child_cpu_s': children.ru_utime + children.ru_stime,
+        'max_rss_kb': own.ru_maxrss,
+        'child_max_rss_kb': children.ru_maxrss,
+    }
+
+
+class Timed:
+    """Ersetzt test_stream einer Instanz und misst jeden Aufruf"""
+
+    def __init__(self, fn, outcome):
+        self.fn = fn
+        self.outcome = outcome
+        self.samples = []  # (url, sekunden, ergebnis)
+        self._lock = threading.Lock()
+
+    def __call__(self, stream, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.fn(stream, *args, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples.append((stream['url'], elapsed, self.outcome(result)))
+        return result
+
+
+def run_filter(playlist: Path, workdir: Path, args):
+    import check_iptv_pro
+    flt = check_iptv_pro.IPTVFilter(args.timeout, args.workers, args.mode,
+                                    use_ocr=args.ocr, verbose=False)
+    flt.test_stream = Timed(flt.test_stream, lambda r: 'working' if r else 'rejected')
+    flt.run(str(playlist), str(workdir / 'filter_out.m3u'))
+    return flt.test_stream.samples
+
+
+def run_combiner(playlist: Path, workdir: Path, args):
+    from m3u_combiner_fixed import M3UCombiner
+    combiner = M3UCombiner(timeout=args.timeout, max_workers=args.workers)
+    combiner.test_stream = Timed(combiner.test_stream, lambda r: r.get('status', 'error'))
+    combiner.process_playlists([playlist])
+    return combiner.test_stream.samples
+
+
+TARGETS = {'filter': run_filter, 'combiner': run_combiner}
+
+
+def measure(target, playlist, kinds_by_url, workdir, args):
+    before = _usage()
+    started = time.perf_counter()
+    sink = io.StringIO()
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(sink)
+    with quiet, (contextlib.nullcontext() if args.verbose else contextlib.redirect_stderr(sink)):
+        samples = TARGETS[target](playlist, workdir, args)
+    wall = time.perf_counter() - started
+    after = _usage()
+
+    by_kind = {}
+    for url, elapsed, outcome in samples:
+        entry = by_kind.setdefault(kinds_by_url.get(url, '?'), {'latencies': [], 'outcomes': {}})
+        entry['latencies'].append(elapsed)
+        entry['outcomes'][outcome] = entry['outcomes'].get(outcome, 0) + 1
+
+    outcomes = {}
+    for entry in by_kind.values():
+        for outcome, n in entry['outcomes'].items():
+            outcomes[outcome] = outcomes.get(outcome, 0) + n
+
+    result = {
+        'streams': len(samples),
+        'wall_s': round(wall, 3),
+        'streams_per_s': round(len(samples) / wall, 3) if wall else None,
+        'latency': latency_summary([s[1] for s in samples]),
+        'outcomes': outcomes,
+        'by_kind': {
+            kind: {**latency_summary(entry['latencies']), 'outcomes': entry['outcomes']}
+            for kind, entry in sorted(by_kind.items())
+        },
+    }
+    if before and after:
+        result.update({
+            'cpu_s': round(after['cpu_s'] - before['cpu_s'], 3),
+            'child_cpu_s': round(after['child_cpu_s'] - before['child_cpu_s'], 3),
+            # ru_maxrss ist ein Spitzenwert seit Prozessstart, kein Delta
+            'max_rss_kb': after['max_rss_kb'],
+            'child_max_rss_kb': after['child_max_rss_kb'],
+        })
+    return result
+
+
+# ---------- Vergleich ----------
+
+# Metrik -> True, wenn größer besser ist
+COMPARE_METRICS = {
+    'streams_per_s': True,
+    'latency.p50_ms': False,
+    'latency.p99_ms': False,
+    'cpu_s': False,
+    'child_cpu_s': False,
+    'max_rss_kb': False,
+}
+
+
+def _get(result, dotted):
+    for key in dotted.split('.'):
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+
+def compare(old: dict, new: dict, threshold: float) -> bool:
+    """Druckt die Veränderungen; True, wenn eine Metrik um mehr als threshold schlechter wurde"""
+    regressed = False
+    print(f"\n📊 Vergleich mit {old.get('git') or old.get('timestamp')}:")
+    for target, result in new['results'].items():
+        base = old.get('results', {}).get(target)
+        if not base:
+            print(f"  {target}: kein Vergleichswert")
+            continue
+        print(f"  {target}:")
+        for metric, higher_is_better in COMPARE_METRICS.items():
+            a, b = _get(base, metric), _get(result, metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            worse = -change if higher_is_better else change
+            mark = '❌' if worse > threshold else ('✅' if worse < -threshold else '  ')
+            regressed |= worse > threshold
+            print(f"    {mark} {metric:<16} {a:>10} → {b:<10} ({change:+.1%})")
+    return regressed
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _ffmpeg_version(ffmpeg):
+    try:
+        out = subprocess.run([ffmpeg, '-version'], capture_output=True, text=True).stdout
+        return out.splitlines()[0] if out else None
+    except OSError:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description='Durchsatz-Benchmark mit lokalem Test-Stream-Server',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split('Beispiel:', 1)[1] if 'Beispiel:' in __doc__ else None)
+    ap.add_argument('-n', '--count', type=int, default=60, help='Anzahl Streams (default: 60)')
+    ap.add_argument('--mix', default=DEFAULT_MIX, help=f'Gewichte pro Stream-Art (default: {DEFAULT_MIX})')
+    ap.add_argument('--target', choices=['filter', 'combiner', 'both'], default='both',
+                    help='Was gemessen wird (default: both)')
+    ap.add_argument('-w', '--workers', type=int, default=8, help='Worker (default: 8)')
+    ap.add_argument('-t', '--timeout', type=int, default=6, help='Timeout pro Stream in s (default: 6)')
+    ap.add_argument('--mode', choices=['normal', 'safe', 'aggressive'], default='safe',
+                    help='Modus für check_iptv_pro (default: safe)')
+    ap.add_argument('--ocr', action='store_true', help='OCR in check_iptv_pro aktivieren')
+    ap.add_argument('--seed', type=int, default=42, help='Zufalls-Seed für die Mischung (default: 42)')
+    ap.add_argument('--fixtures', default='.bench_fixtures', help='Verzeichnis für erzeugte Test-Streams')
+    ap.add_argument('-o', '--output', default=None, help='JSON-Ergebnis (default: bench_<zeit>.json)')
+    ap.add_argument('--compare', metavar='JSON', help='Mit früherem Ergebnis vergleichen')
+    ap.add_argument('--threshold', type=float, default=0.10,
+                    help='Erlaubte Verschlechterung beim Vergleich (default: 0.10 = 10%%)')
+    ap.add_argument('-v', '--verbose', action='store_true', help='Ausgabe der Tools nicht unterdrücken')
+    args = ap.parse_args()
+
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        sys.exit("❌ ffmpeg nicht im PATH — wird für die Test-Streams gebraucht")
+
+    mix = parse_mix(args.mix)
+    fixtures = Path(args.fixtures)
+    print(f"🎬 Test-Streams in {fixtures}")
+    build_fixtures(ffmpeg, fixtures)
+
+    server = start_server(fixtures)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"🌐 Stream-Server auf {base_url}")
+
+    targets = ['filter', 'combiner'] if args.target == 'both' else [args.target]
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'ffmpeg': _ffmpeg_version(ffmpeg),
+        'config': {
+            'count': args.count, 'mix': mix, 'workers': args.workers, 'timeout': args.timeout,
+            'mode': args.mode, 'ocr': args.ocr, 'seed': args.seed,
+        },
+        'results': {},
+    }
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            workdir = Path(tmp)
+            playlist = workdir / 'bench.m3u'
+            entries = write_playlist(playlist, base_url, mix, args.count, args.seed)
+            kinds_by_url = dict(entries)
+            for target in targets:
+                print(f"⏱️ Messe {target} ({args.count} Streams, {args.workers} Worker)...")
+                result = measure(target, playlist, kinds_by_url, workdir, args)
+                report['results'][target] = result
+                lat = result['latency']
+                print(f"   {result['streams_per_s']} Streams/s | p50 {lat['p50_ms']} ms | "
+                      f"p99 {lat['p99_ms']} ms | CPU {result.get('cpu_s', '?')}s "
+                      f"(+{result.get('child_cpu_s', '?')}s ffmpeg)")
+    finally:
+        server.shutdown()
+
+    output = args.output or f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"💾 Ergebnis: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+        if compare(old, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,16 @@
 """
 IPTV Domain Blocker - Entfernt Streams mit bestimmten Domains/URLs
 """
+import os
+import re
 import sys
+import glob
+import shutil
 import argparse
+import tempfile
+from pathlib import Path
 from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 if sys.platform.startswith('win'):
     sys.stdout.reconfigure(encoding='utf-8')
@@ -17,6 +24,7 @@ class M3UDomainBlocker:
         self.output_file = output_file
         self.blocked_domains = set()
         self.blocked_patterns = set()
+        self._pattern_re = None
     
     def normalize_domain(self, url):
         """Extrahiert Domain aus URL"""
@@ -40,20 +48,29 @@ class M3UDomainBlocker:
         """Fügt eine URL/Domain zur Blockliste hinzu"""
         # Als Pattern (für direkte Suche in URL)
         self.blocked_patterns.add(entry.lower())
+        self._pattern_re = None
         
         # Als Domain
         domain = self.normalize_domain(entry)
         if domain:
             self.blocked_domains.add(domain)
     
+    def compile(self):
+        """Kompiliert alle Patterns einmalig zu einem Regex (ein Durchlauf pro URL)"""
+        if self._pattern_re is None and self.blocked_patterns:
+            # Längste zuerst, damit die Alternation deterministisch bleibt
+            alternation = '|'.join(re.escape(p) for p in sorted(self.blocked_patterns, key=len, reverse=True))
+            self._pattern_re = re.compile(alternation)
+        return self._pattern_re
+    
     def is_blocked(self, url):
         """Prüft ob URL geblockt werden soll"""
         url_lower = url.lower()
         
         # 1. Prüfe exakte Pattern-Matches
-        for pattern in self.blocked_patterns:
-            if pattern in url_lower:
-                return True
+        pattern_re = self.compile()
+        if pattern_re is not None and pattern_re.search(url_lower):
+            return True
         
         # 2. Prüfe Domain-Matches
         domain = self.normalize_domain(url)
@@ -99,15 +116,8 @@ class M3UDomainBlocker:
             print(f"     - {domain}")
         print()
     
-    def filter_m3u(self):
-        """Filtert die M3U Datei"""
-        try:
-            with open(self.input_file, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
-        except FileNotFoundError:
-            print(f"❌ Fehler: Datei '{self.input_file}' nicht gefunden!")
-            sys.exit(1)
-        
+    def filter_lines(self, lines, on_blocked=None):
+        """Filtert M3U-Zeilen, liefert (gefilterte Zeilen, Statistik)"""
         filtered = []
         current_extinf = None
         
@@ -117,8 +127,6 @@ class M3UDomainBlocker:
             'kept': 0
         }
         
-        print("🔍 Filtere M3U Datei...")
-        
         for line in lines:
             line_stripped = line.strip()
             
@@ -149,7 +157,8 @@ class M3UDomainBlocker:
                 if self.is_blocked(line_stripped):
                     # Stream blocken - EXTINF + URL werden nicht hinzugefügt
                     stats['blocked'] += 1
-                    print(f"🚫 Geblockt: {line_stripped[:70]}...")
+                    if on_blocked:
+                        on_blocked(line_stripped)
                     current_extinf = None
                 else:
                     # Stream behalten
@@ -159,6 +168,23 @@ class M3UDomainBlocker:
                     filtered.append(line)
                     current_extinf = None
         
+        return filtered, stats
+    
+    def filter_m3u(self):
+        """Filtert die M3U Datei"""
+        try:
+            with open(self.input_file, 'r', encoding='utf-8', errors='ignore') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            print(f"❌ Fehler: Datei '{self.input_file}' nicht gefunden!")
+            sys.exit(1)
+        
+        print("🔍 Filtere M3U Datei...")
+        
+        filtered, stats = self.filter_lines(
+            lines, on_blocked=lambda url: print(f"🚫 Geblockt: {url[:70]}...")
+        )
+        
         # Schreibe gefilterte Datei
         with open(self.output_file, 'w', encoding='utf-8') as f:
             f.writelines(filtered)
@@ -174,6 +200,137 @@ class M3UDomainBlocker:
         print("="*60 + "\n")
 
 
+# ---------------------------------------------------------
+# Batch-Modus: viele Playlists parallel in einem Prozesspool
+# ---------------------------------------------------------
+
+PLAYLIST_EXTENSIONS = ('.m3u', '.m3u8')
+
+# Pro Worker-Prozess einmal aufgebaut (siehe _init_worker)
+_worker_blocker = None
+
+
+def _init_worker(patterns, domains):
+    """Initialisiert den Blocker einmal pro Worker-Prozess"""
+    global _worker_blocker
+    _worker_blocker = M3UDomainBlocker(None, None)
+    _worker_blocker.blocked_patterns = set(patterns)
+    _worker_blocker.blocked_domains = set(domains)
+    _worker_blocker.compile()
+
+
+def _write_atomic(path, lines):
+    """Schreibt Datei über Temp-Datei + os.replace (nie halb geschrieben)"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.m3u', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        # mkstemp legt 0600 an - Rechte des Originals übernehmen
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _filter_file_job(input_file, output_file):
+    """Worker: filtert eine Datei, liefert (input, output, stats, fehler)"""
+    try:
+        with open(input_file, 'r', encoding='utf-8', errors='ignore') as f:
+            filtered, stats = _worker_blocker.filter_lines(f)
+        _write_atomic(output_file, filtered)
+        return input_file, output_file, stats, None
+    except Exception as e:
+        return input_file, output_file, None, str(e)
+
+
+def read_domains_file(path):
+    """Liest Einträge (eine Domain/URL pro Zeile, # = Kommentar)"""
+    entries = []
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            entry = re.sub(r'\s+#.*$', '', line).strip()
+            if entry and not entry.startswith('#'):
+                entries.append(entry)
+    return entries
+
+
+def default_output_path(input_file):
+    return input_file.rsplit('.', 1)[0] + '_filtered.m3u'
+
+
+def collect_playlists(target):
+    """Liefert Playlists aus Verzeichnis oder Glob-Muster (sortiert)"""
+    if os.path.isdir(target):
+        files = [str(p) for p in Path(target).iterdir()
+                 if p.is_file() and p.suffix.lower() in PLAYLIST_EXTENSIONS]
+    else:
+        files = [p for p in glob.glob(target, recursive=True) if os.path.isfile(p)]
+    # Eigene Ergebnisse aus früheren Läufen nicht erneut filtern
+    return sorted(f for f in files if not f.rsplit('.', 1)[0].endswith('_filtered'))
+
+
+def filter_batch(blocker, files, in_place=False, jobs=None):
+    """Filtert viele Dateien parallel, liefert aggregierte Statistik"""
+    blocker.compile()
+    totals = {'files': 0, 'failed_files': 0, 'total': 0, 'blocked': 0, 'kept': 0}
+    per_file = []
+    
+    print(f"🔍 Filtere {len(files)} Playlists mit {jobs or os.cpu_count()} Prozessen...")
+    
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(tuple(blocker.blocked_patterns), tuple(blocker.blocked_domains))
+    ) as pool:
+        futures = [
+            pool.submit(_filter_file_job, f, f if in_place else default_output_path(f))
+            for f in files
+        ]
+        
+        for done, future in enumerate(as_completed(futures), start=1):
+            input_file, output_file, stats, error = future.result()
+            if error:
+                totals['failed_files'] += 1
+                print(f"  ⚠️ [{done}/{len(files)}] {input_file}: {error}")
+                continue
+            
+            totals['files'] += 1
+            for key in ('total', 'blocked', 'kept'):
+                totals[key] += stats[key]
+            per_file.append((input_file, stats))
+            print(f"  ✓ [{done}/{len(files)}] {os.path.basename(input_file)}: "
+                  f"{stats['blocked']}/{stats['total']} geblockt")
+    
+    return totals, per_file
+
+
+def print_batch_report(totals, per_file, in_place, top=10):
+    print("\n" + "="*60)
+    print("📊 BATCH-ERGEBNIS:")
+    print("="*60)
+    print(f"Dateien:    {totals['files']} (Fehler: {totals['failed_files']})")
+    print(f"Gesamt:     {totals['total']} Streams")
+    print(f"🚫 Geblockt: {totals['blocked']} Streams ({totals['blocked']/max(1,totals['total'])*100:.1f}%)")
+    print(f"✅ Behalten: {totals['kept']} Streams ({totals['kept']/max(1,totals['total'])*100:.1f}%)")
+    
+    worst = sorted(per_file, key=lambda x: -x[1]['blocked'])[:top]
+    if worst and worst[0][1]['blocked']:
+        print(f"\n📋 Meiste Blockierungen:")
+        for input_file, stats in worst:
+            if not stats['blocked']:
+                break
+            print(f"   {os.path.basename(input_file)}: {stats['blocked']}/{stats['total']}")
+    
+    print(f"\n💾 Ausgabe: {'in-place ersetzt' if in_place else '*_filtered.m3u neben den Originalen'}")
+    print("="*60 + "\n")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Blockt IPTV Streams basierend auf Domains/URLs',
@@ -183,25 +340,46 @@ Beispiele:
   python block_domains.py input.m3u
   python block_domains.py input.m3u -o clean.m3u
   python block_domains.py input.m3u --domains cdn.ngenix.net zabava-htlive.cdn.ngenix.net
+  python block_domains.py ./playlists --domains cdn.ngenix.net
+  python block_domains.py "lists/**/*.m3u" --in-place -j 8 --domains cdn.ngenix.net
         """
     )
     
-    parser.add_argument('input', help='Input M3U Datei')
+    parser.add_argument('input', help='Input M3U Datei, Verzeichnis oder Glob-Muster (Batch-Modus)')
     parser.add_argument('-o', '--output', help='Output M3U Datei (default: input_filtered.m3u)')
     parser.add_argument('--domains', nargs='+', help='Domains zum Blocken (überspringt interaktive Eingabe)')
+    parser.add_argument('--domains-file', help='Datei mit Domains (eine pro Zeile, z.B. suggested_blocklist.txt)')
+    parser.add_argument('--in-place', action='store_true',
+                        help='Batch: Originale atomar ersetzen statt *_filtered.m3u daneben')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Batch: Anzahl Prozesse (default: CPU-Kerne)')
     
     args = parser.parse_args()
     
+    batch = os.path.isdir(args.input) or glob.has_magic(args.input)
+    if batch and args.output:
+        parser.error('-o ist im Batch-Modus nicht möglich (nutze --in-place oder *_filtered.m3u)')
+    
     # Output Dateiname
     if args.output:
         output = args.output
     else:
-        output = args.input.rsplit('.', 1)[0] + '_filtered.m3u'
+        output = default_output_path(args.input)
     
     # Blocker erstellen
     blocker = M3UDomainBlocker(args.input, output)
     
     # Domains hinzufügen
+    if args.domains_file:
+        try:
+            args.domains = (args.domains or []) + read_domains_file(args.domains_file)
+        except FileNotFoundError:
+            print(f"❌ Fehler: Datei '{args.domains_file}' nicht gefunden!")
+            sys.exit(1)
+        if not args.domains:
+            print(f"❌ Keine Einträge in '{args.domains_file}'. Abbruch.")
+            sys.exit(1)
+    
     if args.domains:
         # Non-interaktiv: Domains aus Kommandozeile
         print("\n" + "="*60)
@@ -215,6 +393,15 @@ Beispiele:
         # Interaktiv: Domains abfragen
         blocker.interactive_input()
     
+    if batch:
+        files = collect_playlists(args.input)
+        if not files:
+            print(f"❌ Keine Playlists gefunden: {args.input}")
+            sys.exit(1)
+        totals, per_file = filter_batch(blocker, files, in_place=args.in_place, jobs=args.jobs)
+        print_batch_report(totals, per_file, args.in_place)
+        return
+    
     # Filtere die M3U
     blocker.filter_m3u()
 
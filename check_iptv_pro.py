@@ -4,18 +4,49 @@ from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict
 
-import cv2
-import numpy as np
-import pytesseract
-from tqdm import tqdm
+from host_stats import HostStats, host_of, interleave_by_host
+from metrics import PhaseMetrics
+from proc_usage import Budget, UsageStats, add_usage, run_measured
+from result_stream import ResultWriter, error_class, result_record, stream_hash
+from baseline import Baseline, print_delta
+from tool_discovery import ffmpeg_info, find_tool, supports_url, tesseract_info
 
 if sys.platform.startswith('win'):
     sys.stdout.reconfigure(encoding='utf-8')
 
-FFMPEG  = r'C:\ProgramData\chocolatey\bin\ffmpeg.exe'
-FFPROBE = r'C:\ProgramData\chocolatey\bin\ffprobe.exe'
-TESSERACT = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-pytesseract.pytesseract.tesseract_cmd = TESSERACT
+# Aus Umgebungsvariable (FFMPEG, TESSERACT), PATH oder Windows-Standardpfad
+FFMPEG = find_tool('ffmpeg', 'FFMPEG')
+
+# cv2/numpy/pytesseract erst laden, wenn Fake-Check oder OCR wirklich laufen —
+# ein reiner Verbindungstest startet so in wenigen Millisekunden
+cv2 = np = pytesseract = None
+OCR_LANGS = ('rus', 'eng')
+
+
+def _load_vision():
+    global cv2, np
+    if cv2 is None:
+        import cv2 as _cv2
+        import numpy as _np
+        cv2, np = _cv2, _np
+
+
+def _load_ocr():
+    """
+    pytesseract laden und die OCR-Sprachen liefern (fehlende werden
+    weggelassen); None, wenn tesseract nicht installiert ist
+    """
+    global pytesseract
+    info = tesseract_info()
+    if info is None:
+        return None
+    _load_vision()
+    if pytesseract is None:
+        import pytesseract as _pytesseract
+        _pytesseract.pytesseract.tesseract_cmd = info['path']
+        pytesseract = _pytesseract
+    langs = [l for l in OCR_LANGS if l in info['languages']] or ['eng']
+    return '+'.join(langs)
 
 PAY_PATTERNS = [
     r'оплат', r'подпис', r'abonn',
@@ -26,15 +57,31 @@ PAY_PATTERNS = [
 
 class IPTVFilter:
 
-    def __init__(self, timeout, workers, mode, use_ocr, verbose):
+    def __init__(self, timeout, workers, mode, use_ocr, verbose,
+                 host_stats=None, skip_hosts=None, budget=None):
         self.timeout = timeout
         self.workers = workers
         self.mode = mode
         self.use_ocr = use_ocr
         self.verbose = verbose
-        self.stats = dict(tested=0, working=0, paywall=0, failed=0, fake=0)
+        self.stats = dict(tested=0, working=0, paywall=0, failed=0, fake=0, carried=0)
         self.fail_reasons = defaultdict(int)
         self.pbar = None
+        # Host-Statistik über Läufe hinweg (None = aus)
+        self.host_stats = host_stats
+        # Hosts, die ohne Test übersprungen werden (bekannt tot/Paywall)
+        self.skip_hosts = set(skip_hosts or ())
+        # Zeit pro Phase (basic, grab_frame, fake_check, astats, ocr, tesseract, stream)
+        self.metrics = PhaseMetrics()
+        # ffmpeg-Verbrauch pro Stream/Host; optionales Budget bricht teure Proben ab
+        self.budget = budget
+        self.usage = UsageStats()
+        self.probed = None  # hash -> Ergebnis, nur mit --baseline
+        # JSONL-Ergebnisse pro Stream (run(results_path=...)), sonst None
+        self.results = None
+        # Eingabe-Protokolle des gefundenen ffmpeg (aus dem Tool-Cache)
+        self.ffmpeg = None
+        self.ocr_lang = 'rus+eng'
 
     def log(self, msg, force=False):
         if self.verbose or force:
@@ -61,52 +108,84 @@ class IPTVFilter:
 
     # ---------- Technical checks ----------
 
+    def _ffmpeg(self, url, cmd, timeout, **kwargs):
+        """ffmpeg mit Messung; Verbrauch wird dem Stream url zugerechnet"""
+        run = run_measured(cmd, timeout, budget=self.budget, **kwargs)
+        trace = self.metrics.current_trace()
+        if trace is None:
+            self.usage.add(url, run.usage, run.over_budget)
+        else:
+            # Summe aller Aufrufe dieses Streams, in test_stream() einmal verbucht
+            add_usage(trace.setdefault('usage', {}), run.usage)
+            trace['over_budget'] = trace.get('over_budget') or run.over_budget
+        if run.over_budget:
+            self.log(f"⛔ {run.over_budget}: {url[:60]}")
+        return run
+
     def test_stream_basic(self, url):
         """Einfacher FFmpeg-Test wie m3u_combiner (3 Sekunden grabben)"""
+        with self.metrics.time('basic', host_of(url)) as span:
+            span.outcome = self._test_stream_basic(url)
+            return span.outcome == 'ok'
+
+    def _test_stream_basic(self, url):
         try:
-            result = subprocess.run(
+            result = self._ffmpeg(
+                url,
                 [FFMPEG, '-hide_banner', '-loglevel', 'error',
                  '-timeout', str(self.timeout * 1_000_000),
                  '-i', url,
                  '-t', '3',
                  '-c', 'copy',
                  '-f', 'null', '-'],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.PIPE,
-                timeout=self.timeout + 2
+                timeout=self.timeout + 2,
+                stderr=subprocess.PIPE
             )
-            
+
+            if result.over_budget:
+                self.fail_reasons['over_budget'] += 1
+                return 'over_budget'
+            if result.timed_out:
+                self.log(f"⏱️ Timeout: {url[:60]}")
+                self.fail_reasons['timeout'] += 1
+                return 'timeout'
             if result.returncode == 0:
                 self.log(f"✓ Stream OK: {url[:60]}")
-                return True
+                return 'ok'
             else:
                 error = result.stderr.decode('utf-8', errors='ignore')
                 self.log(f"❌ Stream Error: {error[:50]}")
+                trace = self.metrics.current_trace()
+                if trace is not None:
+                    trace['error'] = error.strip()
                 self.fail_reasons['ffmpeg_error'] += 1
-                return False
-                
-        except subprocess.TimeoutExpired:
-            self.log(f"⏱️ Timeout: {url[:60]}")
-            self.fail_reasons['timeout'] += 1
-            return False
+                return 'ffmpeg_error'
+
         except Exception as e:
             self.log(f"❌ Exception: {str(e)[:40]}")
             self.fail_reasons['exception'] += 1
-            return False
+            return 'exception'
 
     # ---------- Frame / Fake ----------
 
     def grab_frame(self, url, sec):
+        with self.metrics.time('grab_frame', host_of(url)) as span:
+            img = self._grab_frame(url, sec)
+            span.outcome = 'ok' if img is not None else 'no_frame'
+            return img
+
+    def _grab_frame(self, url, sec):
         with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as tmp:
             try:
-                subprocess.run(
+                run = self._ffmpeg(
+                    url,
                     [FFMPEG, '-hide_banner', '-loglevel', 'panic',
                      '-ss', str(sec), '-i', url,
                      '-frames:v', '1', '-y', tmp.name],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
                     timeout=self.timeout
                 )
+                if run.timed_out or run.over_budget:
+                    return None
                 img = cv2.imread(tmp.name)
                 return img
             except:
@@ -117,6 +196,12 @@ class IPTVFilter:
 
     def is_fake(self, url):
         """Erkennt statische Bilder (Fake-Streams)"""
+        with self.metrics.time('fake_check', host_of(url)) as span:
+            fake = self._is_fake(url)
+            span.outcome = 'fake' if fake else 'ok'
+            return fake
+
+    def _is_fake(self, url):
         try:
             self.log(f"🔍 Fake-Check: {url[:60]}")
             
@@ -138,13 +223,19 @@ class IPTVFilter:
             self.log(f"  🖼️ Statisch erkannt, prüfe Audio...")
             
             try:
-                out = subprocess.check_output(
-                    [FFMPEG, '-hide_banner', '-i', url, '-t', '5',
-                     '-af', 'astats=metadata=1:reset=1',
-                     '-f', 'null', '-'],
-                    stderr=subprocess.STDOUT,
-                    timeout=self.timeout
-                ).decode().lower()
+                with self.metrics.time('astats', host_of(url)):
+                    run = self._ffmpeg(
+                        url,
+                        [FFMPEG, '-hide_banner', '-i', url, '-t', '5',
+                         '-af', 'astats=metadata=1:reset=1',
+                         '-f', 'null', '-'],
+                        timeout=self.timeout,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT
+                    )
+                if run.timed_out or run.over_budget or run.returncode != 0:
+                    return False
+                out = run.stdout.decode(errors='ignore').lower()
 
                 has_audio = 'rms level' in out
                 if has_audio:
@@ -164,6 +255,12 @@ class IPTVFilter:
 
     def paywall_ocr(self, url, aggressive=False):
         """Erkennt Paywall-Bildschirme per OCR"""
+        with self.metrics.time('ocr', host_of(url)) as span:
+            paywall = self._paywall_ocr(url, aggressive)
+            span.outcome = 'paywall' if paywall else 'ok'
+            return paywall
+
+    def _paywall_ocr(self, url, aggressive=False):
         try:
             self.log(f"💰 OCR-Check: {url[:60]}")
             
@@ -185,9 +282,10 @@ class IPTVFilter:
                 gray = gray[h//4:3*h//4, w//4:3*w//4]
 
             # OCR
-            text = pytesseract.image_to_string(
-                gray, lang='rus+eng', config='--psm 6'
-            ).lower()
+            with self.metrics.time('tesseract'):
+                text = pytesseract.image_to_string(
+                    gray, lang=self.ocr_lang, config='--psm 6'
+                ).lower()
 
             # Suche nach Paywall-Keywords
             hits = sum(bool(re.search(p, text)) for p in PAY_PATTERNS)
@@ -208,28 +306,72 @@ class IPTVFilter:
     # ---------- Decision ----------
 
     def test_stream(self, s):
+        with self.metrics.trace() as trace:
+            with self.metrics.time('stream', host_of(s['url'])) as span:
+                result = self._test_stream(s, span)
+        self.usage.add(s['url'], trace.get('usage'), trace.get('over_budget'))
+        if self.probed is not None:
+            # echtes Ergebnis (auch skipped/fake/paywall) für den Delta-Bericht
+            self.probed[stream_hash(s['url'])] = span.outcome
+        if self.results is not None:
+            self.results.result(self._result_record(s['url'], span.outcome, trace))
+        return result
+
+    def _result_record(self, url, outcome, trace):
+        error = trace.get('error')
+        cls = None
+        if outcome == 'failed':
+            # Woran ist der Basis-Test gescheitert?
+            basic = trace['outcomes'].get('basic')
+            cls = basic if basic in ('timeout', 'over_budget', 'exception') else error_class(outcome, error)
+        return result_record(url, outcome, error=error, timings=trace['timings'],
+                             usage=trace.get('usage'), cls=cls)
+
+    def _test_stream(self, s, span):
         url_short = s['url'][:70] + '...' if len(s['url']) > 70 else s['url']
+        span.outcome = 'failed'
         
         try:
+            # Phase 0: Bekannt schlechte Hosts gar nicht erst testen
+            if self.skip_hosts and host_of(s['url']) in self.skip_hosts:
+                self.log(f"⏭️ Host übersprungen: {url_short}")
+                self.fail_reasons['host_skipped'] += 1
+                span.outcome = 'skipped'
+                return None
+
+            # Protokoll, das dieses ffmpeg gar nicht kann (z.B. rtmp ohne librtmp)
+            if not supports_url(self.ffmpeg, s['url']):
+                self.log(f"⏭️ Protokoll nicht unterstützt: {url_short}")
+                self.fail_reasons['unsupported_protocol'] += 1
+                span.outcome = 'skipped'
+                return None
+
             # Phase 1: Basis-Test (EINZIGER Connectivity-Test)
             if not self.test_stream_basic(s['url']):
                 self.fail_reasons['basic_test_failed'] += 1
+                self._record_host(s['url'], 'failed')
                 return None
 
             # Phase 2: Fake-Erkennung (nur im safe mode)
             if self.mode == 'safe':
                 if self.is_fake(s['url']):
                     self.fail_reasons['fake_stream'] += 1
+                    self._record_host(s['url'], 'fake')
+                    span.outcome = 'fake'
                     return None
 
             # Phase 3: Paywall-Erkennung (wenn OCR aktiviert)
             if self.use_ocr:
                 if self.paywall_ocr(s['url'], aggressive=(self.mode == 'aggressive')):
                     self.fail_reasons['paywall'] += 1
+                    self._record_host(s['url'], 'paywall')
+                    span.outcome = 'paywall'
                     return None
 
             # SUCCESS!
             self.log(f"✅ WORKING: {url_short}", force=True)
+            self._record_host(s['url'], 'working')
+            span.outcome = 'working'
             return s
 
         except Exception as e:
@@ -237,9 +379,24 @@ class IPTVFilter:
             self.fail_reasons['exception'] += 1
             return None
 
+    def _record_host(self, url, outcome):
+        if self.host_stats is not None:
+            self.host_stats.record(url, outcome)
+
     # ---------- Main ----------
 
-    def run(self, inp, outp):
+    def run(self, inp, outp, metrics_json=None, usage_top=5, results_path=None,
+            baseline=None, recheck_sample=0.1, file_order=False):
+        self.usage.keep = max(self.usage.keep, usage_top)
+        self.ffmpeg = ffmpeg_info()
+        if self.use_ocr:
+            self.ocr_lang = _load_ocr()
+            if self.ocr_lang is None:
+                print("⚠️ Tesseract nicht gefunden (PATH oder Umgebungsvariable TESSERACT) — OCR deaktiviert")
+                self.use_ocr = False
+        if self.mode == 'safe':
+            _load_vision()
+
         print(f"\n{'='*60}")
         print(f"IPTV Stream Checker PRO")
         print(f"{'='*60}")
@@ -248,15 +405,41 @@ class IPTVFilter:
         print(f"Worker: {self.workers}")
         print(f"OCR: {'AN' if self.use_ocr else 'AUS'}")
         print(f"Fake-Check: {'AN' if self.mode == 'safe' else 'AUS'}")
+        if self.skip_hosts:
+            print(f"Übersprungene Hosts: {len(self.skip_hosts)}")
+        if self.budget:
+            print(f"Budget pro Probe: CPU {self.budget.cpu_seconds or '-'}s, "
+                  f"RSS {self.budget.rss_kb // 1024 if self.budget.rss_kb else '-'} MB")
         print(f"{'='*60}\n")
         
         streams = self.extract_streams(inp)
         print(f"📋 {len(streams)} Streams geladen\n")
+
+        if results_path:
+            self.results = ResultWriter(results_path)
         
         good = []
-        self.pbar = tqdm(total=len(streams), desc="Teste Streams", 
-                         unit="stream", ncols=100,
-                         bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]')
+        total = len(streams)
+        probed = delta = None
+        if baseline is not None:
+            # Nur Neues + Stichprobe testen, Rest mit altem Status übernehmen
+            current_hashes = {stream_hash(s['url']) for s in streams}
+            streams, carried = baseline.plan(streams, recheck_sample)
+            print(f"🔀 Baseline: {len(streams)} zu testen, {len(carried)} übernommen\n")
+            for s, status in carried:
+                self.stats['carried'] += 1
+                if status == 'working':
+                    good.append(s)
+                if self.results is not None:
+                    self.results.result({**result_record(s['url'], status), 'carried': True})
+            probed = self.probed = {}
+
+        if not file_order:
+            # Hosts abwechseln, zuverlässige zuerst: kein Host bekommt alle Worker auf einmal,
+            # und funktionierende Streams stehen früh fest
+            streams = interleave_by_host(streams, self.host_stats)
+
+        self.pbar = _progress_bar(len(streams))
 
         with ThreadPoolExecutor(self.workers) as pool:
             futures = {pool.submit(self.test_stream, s): s for s in streams}
@@ -279,13 +462,18 @@ class IPTVFilter:
                 self.pbar.update(1)
 
         self.pbar.close()
+        if baseline is not None:
+            delta = baseline.delta(current_hashes, probed)
 
         # Schreibe Output
         with open(outp, 'w', encoding='utf-8') as f:
             f.write('#EXTM3U\n')
             f.write(f'# Gefiltert am: {datetime.now()}\n')
             f.write(f'# Mode: {self.mode}\n')
-            f.write(f'# Original: {len(streams)} | Working: {len(good)}\n')
+            f.write(f'# Original: {total} | Working: {len(good)}\n')
+            if delta:
+                f.write(f"# Delta: +{delta['added']} neu, -{delta['removed']} entfernt, "
+                        f"{delta['newly_dead']} neu tot, {self.stats['carried']} aus Baseline übernommen\n")
             for s in good:
                 f.write(s['info'] + '\n' + s['url'] + '\n')
 
@@ -296,6 +484,8 @@ class IPTVFilter:
         print(f"Getestet:    {self.stats['tested']}")
         print(f"✅ Working:  {self.stats['working']} ({self.stats['working']/max(1,self.stats['tested'])*100:.1f}%)")
         print(f"❌ Failed:   {self.stats['failed']}")
+        if self.stats['carried']:
+            print(f"🔀 Übernommen: {self.stats['carried']} (aus Baseline, nicht getestet)")
         
         if self.use_ocr:
             print(f"💰 Paywall:  {self.fail_reasons.get('paywall', 0)}")
@@ -307,9 +497,74 @@ class IPTVFilter:
             for reason, count in sorted(self.fail_reasons.items(), key=lambda x: -x[1]):
                 print(f"   {reason}: {count}")
         
+        if delta:
+            print_delta(delta)
+
+        self.metrics.print_summary(top_hosts_phase='stream')
+        self.usage.print_summary(usage_top)
+        if metrics_json:
+            self.metrics.dump_json(metrics_json, extra={'resource_usage': self.usage.to_dict()})
+            print(f"\n⏱️ Phasen-Metriken: {metrics_json}")
+
+        if self.results is not None:
+            self.results.summary({
+                'tool': 'check_iptv_pro',
+                'input': inp,
+                'output': outp,
+                'mode': self.mode,
+                **self.stats,
+                'fail_reasons': dict(self.fail_reasons),
+                'delta': delta,
+                'phases': self.metrics.to_dict()['phases'],
+                'resource_usage': self.usage.to_dict(usage_top),
+            })
+            self.results.close()
+            print(f"\n🧾 Ergebnisse (JSONL): {results_path}")
+
         print(f"\n💾 Gespeichert in: {outp}")
         print(f"{'='*60}\n")
 
+        if self.host_stats is not None:
+            self.host_stats.save()
+
+
+class _LineProgress:
+    """Ersatz für tqdm ohne Terminal (cron) oder ohne installiertes tqdm"""
+
+    def __init__(self, total, every=100):
+        self.total = total
+        self.n = 0
+        self.every = every
+        self.postfix = {}
+
+    def write(self, msg):
+        print(msg)
+
+    def set_postfix(self, postfix):
+        self.postfix = postfix
+
+    def update(self, n=1):
+        self.n += n
+        if self.n % self.every == 0 or self.n == self.total:
+            extra = ' '.join(f"{k}={v}" for k, v in self.postfix.items())
+            print(f"Teste Streams: {self.n}/{self.total} {extra}", flush=True)
+
+    def close(self):
+        pass
+
+
+def _progress_bar(total):
+    if sys.stderr.isatty():
+        try:
+            from tqdm import tqdm
+        except ImportError:
+            pass
+        else:
+            return tqdm(total=total, desc="Teste Streams",
+                        unit="stream", ncols=100,
+                        bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]')
+    return _LineProgress(total)
+
 
 def main():
     ap = argparse.ArgumentParser(description='IPTV Stream Checker mit OCR Paywall-Erkennung')
@@ -321,21 +576,72 @@ def main():
     ap.add_argument('--aggressive', action='store_true', help='Aggressive OCR-Modus')
     ap.add_argument('--no-ocr', action='store_true', help='OCR deaktivieren')
     ap.add_argument('-v', '--verbose', action='store_true', help='Detaillierte Ausgabe')
+    ap.add_argument('--host-stats', metavar='DATEI',
+                    help='Host-Statistik über mehrere Läufe lesen und fortschreiben (z.B. host_stats.json)')
+    ap.add_argument('--suggest-blocklist', nargs='?', const='suggested_blocklist.txt',
+                    help='Blockliste für block_domains.py schreiben (default: suggested_blocklist.txt)')
+    ap.add_argument('--skip-bad-hosts', action='store_true',
+                    help='Hosts aus der Blocklisten-Empfehlung nicht mehr testen')
+    ap.add_argument('--min-samples', type=int, default=5,
+                    help='Mindestanzahl Tests pro Host für eine Empfehlung (default: 5)')
+    ap.add_argument('--block-confidence', type=float, default=0.8,
+                    help='Mindest-Konfidenz (untere Schranke der Fehlerquote) (default: 0.8)')
+    ap.add_argument('--metrics-json', metavar='DATEI',
+                    help='Zeit pro Phase (Histogramme nach Ergebnis und Host) als JSON speichern')
+    ap.add_argument('--cpu-budget', type=float, metavar='SEK',
+                    help='ffmpeg-Aufruf abbrechen, wenn er mehr CPU-Sekunden verbraucht')
+    ap.add_argument('--rss-budget', type=int, metavar='MB',
+                    help='ffmpeg-Aufruf abbrechen, wenn er mehr Speicher (RSS) belegt')
+    ap.add_argument('--results', metavar='DATEI',
+                    help='Ergebnis pro Stream als JSON-Zeilen schreiben (+ Zusammenfassung am Ende)')
+    ap.add_argument('--baseline', metavar='DATEI',
+                    help='Früheres Ergebnis (JSONL von --results oder Ausgabe-M3U): nur Neues testen')
+    ap.add_argument('--recheck-sample', type=float, default=0.1, metavar='ANTEIL',
+                    help='Anteil bekannter Streams (funktionierend oder tot), der erneut getestet wird (default: 0.1)')
+    ap.add_argument('--file-order', action='store_true',
+                    help='Streams in Reihenfolge der Datei testen (statt Hosts abwechselnd)')
+    ap.add_argument('--usage-top', type=int, default=5, metavar='N',
+                    help='Teuerste N Streams/Hosts (CPU, Speicher) anzeigen (default: 5)')
     args = ap.parse_args()
 
+    if FFMPEG is None:
+        print("❌ Fehler: FFmpeg nicht gefunden (PATH oder Umgebungsvariable FFMPEG)!")
+        sys.exit(1)
+
     mode = 'normal'
     if args.safe:
         mode = 'safe'
     if args.aggressive:
         mode = 'aggressive'
 
+    if (args.suggest_blocklist or args.skip_bad_hosts) and not args.host_stats:
+        ap.error('--suggest-blocklist und --skip-bad-hosts brauchen --host-stats DATEI')
+
+    host_stats = HostStats(args.host_stats) if args.host_stats else None
+    skip_hosts = None
+    if host_stats is not None and args.skip_bad_hosts:
+        skip_hosts = [h for h, *_ in host_stats.suggest_blocklist(args.min_samples, args.block_confidence)]
+
     IPTVFilter(
         args.timeout,
         args.workers,
         mode,
         use_ocr=not args.no_ocr,
-        verbose=args.verbose
-    ).run(args.input, args.output)
+        verbose=args.verbose,
+        host_stats=host_stats,
+        skip_hosts=skip_hosts,
+        budget=Budget(args.cpu_budget, args.rss_budget)
+    ).run(args.input, args.output, metrics_json=args.metrics_json,
+          usage_top=args.usage_top, results_path=args.results,
+          baseline=Baseline.load(args.baseline) if args.baseline else None,
+          recheck_sample=args.recheck_sample, file_order=args.file_order)
+
+    if host_stats is not None and args.suggest_blocklist:
+        suggestions = host_stats.suggest_blocklist(args.min_samples, args.block_confidence)
+        host_stats.write_blocklist(args.suggest_blocklist, suggestions)
+        print(f"🚫 Blocklisten-Empfehlung: {len(suggestions)} Hosts → {args.suggest_blocklist}")
+        for host, reason, score, entry in suggestions[:10]:
+            print(f"   {host}: {reason} (n={entry['tested']}, conf {score:.2f})")
 
 
 if __name__ == '__main__':
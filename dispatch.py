@@ -0,0 +1,96 @@
+"""
+Выполнение блокирующих операций вне event loop бота.
+
+Отдельные пулы для БД, внешних API (Google Sheets) и тяжёлой работы
+(Excel, разбор плейлистов): медленный Google API не занимает потоки БД
+и наоборот. У каждого пула ограничена очередь и есть таймаут, поэтому
+при перегрузке бот отвечает «занят», а не копит задачи бесконечно.
+"""
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Exception):
+    """Очередь пула заполнена"""
+
+
+class BlockingPool:
+
+    def __init__(self, name: str, workers: int, max_queue: int, timeout: float):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._in_flight = 0  # выполняются + ждут в очереди
+        self.rejected = 0
+        self.timed_out = 0
+        self.latency = Histogram()  # ожидание в очереди + выполнение
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    @property
+    def queue_depth(self):
+        return max(0, self._in_flight - self.workers)
+
+    def _release(self):
+        self._in_flight -= 1
+
+    async def run(self, fn, *args, timeout: float = None):
+        """
+        Выполнить fn(*args) в пуле. PoolSaturated — если очередь полна,
+        asyncio.TimeoutError — если не уложились в timeout.
+        """
+        if self._in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PoolSaturated(f"Пул {self.name} перегружен")
+
+        loop = asyncio.get_running_loop()
+        self._in_flight += 1
+        future = self._executor.submit(fn, *args)
+
+        def on_done(_):
+            # Слот освобождается, когда поток действительно закончил (а не по таймауту)
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:
+                pass  # event loop уже закрыт
+
+        future.add_done_callback(on_done)
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            logger.warning(f"Таймаут в пуле {self.name}: {getattr(fn, '__name__', fn)}")
+            raise
+        finally:
+            self.latency.record(time.monotonic() - started)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class Dispatcher:
+    """Набор пулов бота: db, api, report"""
+
+    def __init__(self, db: BlockingPool, api: BlockingPool, report: BlockingPool):
+        self.db = db
+        self.api = api
+        self.report = report
+
+    @property
+    def pools(self):
+        return (self.db, self.api, self.report)
+
+    def shutdown(self):
+        for pool in self.pools:
+            pool.shutdown()
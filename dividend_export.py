@@ -0,0 +1,159 @@
+"""
+Экспорт дивидендов в Excel.
+
+Файл пишется в потоковом режиме openpyxl (write_only): строки идут
+прямо из курсора SQLite на диск, книга целиком в памяти не держится.
+Стили — общие именованные (NamedStyle), а не новый объект на каждую
+ячейку. Готовые файлы кэшируются по набору лет и пересобираются, только
+когда меняются данные соответствующего года.
+"""
+import os
+import logging
+import tempfile
+import threading
+from pathlib import Path
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill, Font
+
+logger = logging.getLogger(__name__)
+
+HEADERS = ["Дата", "WKN", "Акция", "Сумма (€)"]
+COLUMN_WIDTHS = {"A": 15, "B": 15, "C": 40, "D": 15}
+AMOUNT_FORMAT = '#,##0.00€'
+
+# Цвета для разных WKN
+ROW_COLORS = [
+    "E6F3FF", "FFF0E6", "E6FFE6", "FFF6E6", "F0E6FF",
+    "FFE6E6", "E6FFFF", "FFFFE6", "F5E6FF", "E6FFF0"
+]
+
+
+def _solid(color):
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+
+def _register_styles(wb):
+    """Именованные стили книги: заголовок, строки по цветам, итог"""
+    styles = [
+        NamedStyle(name="div_header", fill=_solid("366092"), font=Font(color="FFFFFF", bold=True)),
+        NamedStyle(name="div_total", fill=_solid("FFFF00"), font=Font(bold=True)),
+        NamedStyle(name="div_total_amount", fill=_solid("FFFF00"), font=Font(bold=True),
+                   number_format=AMOUNT_FORMAT),
+        NamedStyle(name="div_amount", number_format=AMOUNT_FORMAT),
+    ]
+    for i, color in enumerate(ROW_COLORS):
+        styles.append(NamedStyle(name=f"div_row_{i}", fill=_solid(color)))
+        styles.append(NamedStyle(name=f"div_row_{i}_amount", fill=_solid(color),
+                                 number_format=AMOUNT_FORMAT))
+    for style in styles:
+        wb.add_named_style(style)
+
+
+def _styled_row(ws, values, style, amount_style):
+    cells = []
+    for col, value in enumerate(values):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = amount_style if col == 3 else style
+        cells.append(cell)
+    return cells
+
+
+def write_year_sheet(wb, year, rows):
+    """Лист одного года; rows — итератор (date, wkn, name, amount)"""
+    ws = wb.create_sheet(str(year))
+    for column, width in COLUMN_WIDTHS.items():
+        ws.column_dimensions[column].width = width
+
+    ws.append(_styled_row(ws, HEADERS, "div_header", "div_header"))
+
+    wkn_colors = {}
+    total_sum = 0
+    count = 0
+    for date, wkn, name, amount in rows:
+        if wkn not in wkn_colors:
+            wkn_colors[wkn] = len(wkn_colors) % len(ROW_COLORS)
+        style = f"div_row_{wkn_colors[wkn]}"
+        ws.append(_styled_row(ws, [date, wkn, name, amount], style, f"{style}_amount"))
+        total_sum += amount
+        count += 1
+
+    if not count:
+        ws.append(["Нет данных", "", "", ""])
+
+    # Пустая строка, затем итог
+    ws.append([])
+    ws.append(_styled_row(ws, ["ИТОГО", "", "", total_sum], "div_total", "div_total_amount"))
+    return count, total_sum
+
+
+class ExcelExporter:
+
+    def __init__(self, store, export_dir=Path("exports")):
+        self.store = store
+        self.export_dir = Path(export_dir)
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()        # сборка файлов (долго)
+        self._state_lock = threading.Lock()  # только _fresh, во время сборки не держится
+        self._fresh = {}  # (год, ...) -> путь к актуальному файлу
+        # Кэш живёт в пределах процесса: старые файлы могут не совпадать с БД
+        for old in self.export_dir.glob("dividends_*.xlsx"):
+            old.unlink(missing_ok=True)
+
+    def path_for(self, years) -> Path:
+        years = sorted(set(years))
+        return self.export_dir / f"dividends_{'_'.join(map(str, years))}.xlsx"
+
+    def get(self, years) -> Path:
+        """Путь к готовому файлу за годы years (строится, если нет в кэше или устарел)"""
+        key = tuple(sorted(set(years)))
+        path = self.path_for(key)
+        with self._lock:
+            with self._state_lock:
+                if key in self._fresh and path.exists():
+                    logger.info(f"Excel из кэша: {path}")
+                    return path
+                # Отмечаем до сборки: invalidate() во время сборки снимет отметку
+                self._fresh[key] = path
+            try:
+                self._build(list(key), path)
+            except BaseException:
+                with self._state_lock:
+                    self._fresh.pop(key, None)
+                raise
+            return path
+
+    def invalidate(self, year: int):
+        """
+        Пометить устаревшими файлы, в которые входит этот год. Файлы не
+        удаляются: путь, уже отданный get(), остаётся читаемым, а новая
+        сборка атомарно заменит файл.
+        """
+        with self._state_lock:
+            for key in [k for k in self._fresh if year in k]:
+                del self._fresh[key]
+
+    def _build(self, years, path):
+        wb = Workbook(write_only=True)
+        _register_styles(wb)
+        total_rows = 0
+        with self.store.reader() as conn:
+            for year in years:
+                cursor = conn.execute(
+                    "SELECT date, wkn, name, amount FROM dividends WHERE year = ? ORDER BY date",
+                    (year,)
+                )
+                count, _ = write_year_sheet(wb, year, cursor)
+                total_rows += count
+
+        # Сначала во временный файл, затем атомарная замена
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".xlsx", dir=self.export_dir)
+        os.close(fd)
+        try:
+            wb.save(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        logger.info(f"Excel сохранен: {path} ({len(years)} лет, {total_rows} строк)")
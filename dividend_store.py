@@ -0,0 +1,261 @@
+"""
+Хранилище дивидендов: одно долгоживущее соединение SQLite в режиме WAL.
+
+Все запросы — константные строки SQL, поэтому sqlite3 берёт уже
+подготовленные statements из своего кэша. Методы блокирующие: из
+async-кода их вызывают через пул БД (dispatch.BlockingPool).
+
+Итоги по году, месяцу и WKN хранятся в отдельных таблицах и обновляются
+в той же транзакции, что и вставка/удаление, поэтому суммы читаются
+одной строкой независимо от объёма истории.
+"""
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS dividends (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        wkn TEXT NOT NULL,
+        name TEXT NOT NULL,
+        amount REAL NOT NULL,
+        year INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS wkn_lookup (
+        code TEXT PRIMARY KEY,
+        name TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_dividends_year_date ON dividends (year, date)",
+    "CREATE INDEX IF NOT EXISTS idx_dividends_year_created ON dividends (year, created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS dividend_totals_year (
+        year INTEGER PRIMARY KEY,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dividend_totals_month (
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (year, month)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dividend_totals_wkn (
+        year INTEGER NOT NULL,
+        wkn TEXT NOT NULL,
+        name TEXT NOT NULL,
+        total REAL NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (year, wkn)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_totals_wkn_year_total ON dividend_totals_wkn (year, total)",
+)
+
+SQL_INSERT_DIVIDEND = "INSERT INTO dividends (date, wkn, name, amount, year) VALUES (?, ?, ?, ?, ?)"
+SQL_DELETE_BY_DATE = "DELETE FROM dividends WHERE date = ? AND year = ?"
+SQL_SELECT_YEAR = "SELECT date, wkn, name, amount FROM dividends WHERE year = ? ORDER BY date"
+SQL_SELECT_RECENT = """
+    SELECT date, wkn, name, amount
+    FROM dividends
+    WHERE year = ?
+    ORDER BY created_at DESC
+    LIMIT ?
+"""
+SQL_SELECT_YEARS = "SELECT DISTINCT year FROM dividends ORDER BY year"
+SQL_SELECT_WKN = "SELECT name FROM wkn_lookup WHERE code = ?"
+SQL_UPSERT_WKN = "INSERT OR REPLACE INTO wkn_lookup (code, name) VALUES (?, ?)"
+
+# Итоги: delta > 0 при вставке, < 0 при удалении; пустые строки удаляются
+SQL_ADD_YEAR_TOTAL = """
+    INSERT INTO dividend_totals_year (year, total, count) VALUES (?, ?, ?)
+    ON CONFLICT (year) DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+"""
+SQL_ADD_MONTH_TOTAL = """
+    INSERT INTO dividend_totals_month (year, month, total, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT (year, month) DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+"""
+SQL_ADD_WKN_TOTAL = """
+    INSERT INTO dividend_totals_wkn (year, wkn, name, total, count) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (year, wkn) DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+"""
+SQL_PRUNE_TOTALS = (
+    "DELETE FROM dividend_totals_year WHERE count <= 0",
+    "DELETE FROM dividend_totals_month WHERE count <= 0",
+    "DELETE FROM dividend_totals_wkn WHERE count <= 0",
+)
+SQL_SELECT_DATE_GROUPS = """
+    SELECT wkn, name, SUM(amount), COUNT(*)
+    FROM dividends
+    WHERE date = ? AND year = ?
+    GROUP BY wkn
+"""
+SQL_SELECT_YEAR_TOTAL = "SELECT total, count FROM dividend_totals_year WHERE year = ?"
+SQL_SELECT_YEAR_TOTALS = "SELECT year, total, count FROM dividend_totals_year ORDER BY year"
+SQL_SELECT_MONTH_TOTALS = "SELECT month, total, count FROM dividend_totals_month WHERE year = ? ORDER BY month"
+SQL_SELECT_TOP_WKN = """
+    SELECT wkn, name, total, count
+    FROM dividend_totals_wkn
+    WHERE year = ?
+    ORDER BY total DESC
+    LIMIT ?
+"""
+SQL_REBUILD_TOTALS = (
+    "DELETE FROM dividend_totals_year",
+    "DELETE FROM dividend_totals_month",
+    "DELETE FROM dividend_totals_wkn",
+    """
+    INSERT INTO dividend_totals_year (year, total, count)
+    SELECT year, SUM(amount), COUNT(*) FROM dividends GROUP BY year
+    """,
+    """
+    INSERT INTO dividend_totals_month (year, month, total, count)
+    SELECT year, CAST(substr(date, 4, 2) AS INTEGER), SUM(amount), COUNT(*)
+    FROM dividends GROUP BY 1, 2
+    """,
+    """
+    INSERT INTO dividend_totals_wkn (year, wkn, name, total, count)
+    SELECT year, wkn, MAX(name), SUM(amount), COUNT(*) FROM dividends GROUP BY year, wkn
+    """,
+)
+
+
+def month_of(date: str) -> int:
+    """Месяц из даты формата ДД.ММ.ГГГГ"""
+    return int(date[3:5])
+
+
+class DividendStore:
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+
+    @contextmanager
+    def reader(self):
+        """Отдельное соединение только для чтения — для долгих выгрузок (WAL не блокирует запись)"""
+        conn = sqlite3.connect(f"{Path(self.path).resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---------- Схема ----------
+
+    def init_schema(self):
+        with self._lock, self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            # Итоги появились позже основной таблицы — заполнить по старым данным
+            rows = self._conn.execute("SELECT COUNT(*) FROM dividends").fetchone()[0]
+            counted = self._conn.execute(
+                "SELECT COALESCE(SUM(count), 0) FROM dividend_totals_year"
+            ).fetchone()[0]
+            if rows != counted:
+                logger.info(f"Пересчёт итогов дивидендов ({rows} записей)")
+                self._rebuild_totals()
+
+    def _rebuild_totals(self):
+        for statement in SQL_REBUILD_TOTALS:
+            self._conn.execute(statement)
+
+    def rebuild_totals(self):
+        """Пересчитать таблицы итогов по dividends"""
+        with self._lock, self._conn:
+            self._rebuild_totals()
+
+    def _add_totals(self, year, month, wkn, name, amount, count):
+        self._conn.execute(SQL_ADD_YEAR_TOTAL, (year, amount, count))
+        self._conn.execute(SQL_ADD_MONTH_TOTAL, (year, month, amount, count))
+        self._conn.execute(SQL_ADD_WKN_TOTAL, (year, wkn, name, amount, count))
+
+    # ---------- Дивиденды ----------
+
+    def add_dividend(self, date: str, wkn: str, name: str, amount: float, year: int):
+        with self._lock, self._conn:
+            self._conn.execute(SQL_INSERT_DIVIDEND, (date, wkn, name, amount, year))
+            self._add_totals(year, month_of(date), wkn, name, amount, 1)
+
+    def delete_by_date(self, date: str, year: int) -> int:
+        with self._lock, self._conn:
+            groups = self._conn.execute(SQL_SELECT_DATE_GROUPS, (date, year)).fetchall()
+            if not groups:
+                return 0
+            month = month_of(date)
+            for wkn, name, amount, count in groups:
+                self._add_totals(year, month, wkn, name, -amount, -count)
+            for statement in SQL_PRUNE_TOTALS:
+                self._conn.execute(statement)
+            return self._conn.execute(SQL_DELETE_BY_DATE, (date, year)).rowcount
+
+    def dividends_for_year(self, year: int):
+        with self._lock:
+            return self._conn.execute(SQL_SELECT_YEAR, (year,)).fetchall()
+
+    def dividend_years(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(SQL_SELECT_YEARS)]
+
+    def recent_dividends(self, year: int, limit: int = 10):
+        with self._lock:
+            return self._conn.execute(SQL_SELECT_RECENT, (year, limit)).fetchall()
+
+    # ---------- Итоги ----------
+
+    def year_total(self, year: int):
+        """(сумма, количество) за год"""
+        with self._lock:
+            row = self._conn.execute(SQL_SELECT_YEAR_TOTAL, (year,)).fetchone()
+        return (round(row[0], 2), row[1]) if row else (0.0, 0)
+
+    def year_totals(self):
+        """[(год, сумма, количество)] по всем годам"""
+        with self._lock:
+            rows = self._conn.execute(SQL_SELECT_YEAR_TOTALS).fetchall()
+        return [(year, round(total, 2), count) for year, total, count in rows]
+
+    def month_totals(self, year: int):
+        """[(месяц, сумма, количество)] за год"""
+        with self._lock:
+            rows = self._conn.execute(SQL_SELECT_MONTH_TOTALS, (year,)).fetchall()
+        return [(month, round(total, 2), count) for month, total, count in rows]
+
+    def top_wkns(self, year: int, limit: int = 10):
+        """[(wkn, название, сумма, количество)] — крупнейшие плательщики года"""
+        with self._lock:
+            rows = self._conn.execute(SQL_SELECT_TOP_WKN, (year, limit)).fetchall()
+        return [(wkn, name, round(total, 2), count) for wkn, name, total, count in rows]
+
+    # ---------- Справочник WKN ----------
+
+    def get_wkn_name(self, code: str):
+        with self._lock:
+            row = self._conn.execute(SQL_SELECT_WKN, (code,)).fetchone()
+        return row[0] if row else None
+
+    def replace_wkn_entries(self, rows):
+        """Массовая загрузка справочника: один executemany в одной транзакции"""
+        with self._lock, self._conn:
+            self._conn.executemany(SQL_UPSERT_WKN, rows)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Host-Statistik über mehrere Läufe - sammelt Ergebnisse pro Domain/IP
+und leitet daraus eine Blockliste für block_domains.py ab
+"""
+import os
+import json
+import math
+import heapq
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+DEFAULT_STATS_FILE = 'host_stats.json'
+
+# Ergebnisse, die pro Host gezählt werden
+OUTCOMES = ('working', 'failed', 'paywall', 'fake')
+
+# Gewicht eines Hosts beim Verschränken: zuverlässige Hosts bekommen höchstens
+# 1 / MIN_HOST_WEIGHT mal so viele Plätze wie unzuverlässige
+MIN_HOST_WEIGHT = 0.25
+
+
+def host_of(url):
+    """Domain/IP ohne Port, klein geschrieben (wie M3UDomainBlocker.normalize_domain)"""
+    try:
+        if '://' not in url:
+            url = 'http://' + url
+        host = urlparse(url).hostname
+        return host.lower() if host else None
+    except ValueError:
+        return None
+
+
+def wilson_lower_bound(hits, n, z=1.96):
+    """Untere Schranke des 95%-Konfidenzintervalls einer Quote"""
+    if n <= 0:
+        return 0.0
+    p = hits / n
+    denom = 1 + z * z / n
+    centre = p + z * z / (2 * n)
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return max(0.0, (centre - margin) / denom)
+
+
+class HostStats:
+
+    def __init__(self, path=DEFAULT_STATS_FILE, max_age_days=30):
+        self.path = path
+        self.max_age_days = max_age_days
+        self.hosts = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Lädt gespeicherte Statistik, verwirft Hosts die lange nicht gesehen wurden"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Host-Statistik nicht lesbar ({self.path}): {e}")
+            return
+
+        cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+        for host, entry in data.get('hosts', {}).items():
+            if entry.get('last_seen', '') >= cutoff:
+                self.hosts[host] = entry
+
+    def record(self, url, outcome):
+        """Zählt ein Testergebnis (working/failed/paywall/fake) für den Host der URL"""
+        host = host_of(url)
+        if not host or outcome not in OUTCOMES:
+            return
+        with self._lock:
+            entry = self.hosts.setdefault(host, {'tested': 0, **{o: 0 for o in OUTCOMES}})
+            entry['tested'] += 1
+            entry[outcome] += 1
+            entry['last_seen'] = datetime.now().isoformat(timespec='seconds')
+
+    def save(self):
+        """Schreibt die Statistik atomar (Temp-Datei + os.replace)"""
+        if not self.path:
+            return
+        with self._lock:
+            payload = {'updated_at': datetime.now().isoformat(timespec='seconds'), 'hosts': self.hosts}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix='.host_stats_', suffix='.json', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+
+    def reliability(self, host):
+        """Anteil funktionierender Tests (Laplace-geglättet: unbekannt = 0.5)"""
+        entry = self.hosts.get(host)
+        if not entry:
+            return 0.5
+        return (entry['working'] + 1) / (entry['tested'] + 2)
+
+    def suggest_blocklist(self, min_samples=5, confidence=0.8):
+        """
+        Rangliste der Hosts, die mit hoher Sicherheit tot oder Paywall sind.
+        Liefert Liste von (host, grund, score, entry), sortiert nach score.
+        """
+        suggestions = []
+        with self._lock:
+            for host, entry in self.hosts.items():
+                n = entry['tested']
+                if n < min_samples:
+                    continue
+                fail_score = wilson_lower_bound(entry['failed'], n)
+                paywall_score = wilson_lower_bound(entry['paywall'], n)
+                if fail_score >= confidence and fail_score >= paywall_score:
+                    suggestions.append((host, 'dead', fail_score, dict(entry)))
+                elif paywall_score >= confidence:
+                    suggestions.append((host, 'paywall', paywall_score, dict(entry)))
+        suggestions.sort(key=lambda x: (-x[2], -x[3]['tested'], x[0]))
+        return suggestions
+
+    def write_blocklist(self, path, suggestions):
+        """Schreibt Vorschläge im Format von block_domains.py --domains-file"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"# Vorgeschlagene Blockliste - erzeugt am {datetime.now().isoformat(timespec='seconds')}\n")
+            f.write(f"# Quelle: {self.path}\n")
+            f.write("# Verwendung: python block_domains.py input.m3u --domains-file <diese Datei>\n")
+            for host, reason, score, entry in suggestions:
+                n = entry['tested']
+                f.write(
+                    f"{host}  # {reason} | fail {entry['failed']/n*100:.0f}% | "
+                    f"paywall {entry['paywall']/n*100:.0f}% | n={n} | conf {score:.2f}\n"
+                )
+
+
+def interleave_by_host(streams, host_stats=None):
+    """
+    Streams so umsortieren, dass die Hosts sich abwechseln (gewichtetes
+    Round-Robin) und zuverlässige Hosts zuerst und etwas öfter drankommen.
+    Innerhalb eines Hosts bleibt die Reihenfolge der Playlist erhalten.
+
+    Ohne host_stats: reines Round-Robin in Reihenfolge des ersten Auftretens.
+    """
+    groups = {}
+    for s in streams:
+        groups.setdefault(host_of(s['url']), []).append(s)
+
+    ranked = []
+    for order, (host, items) in enumerate(groups.items()):
+        score = host_stats.reliability(host) if host_stats is not None else 0.5
+        weight = MIN_HOST_WEIGHT + (1 - MIN_HOST_WEIGHT) * score
+        ranked.append((-score, order, weight, items))
+    ranked.sort(key=lambda r: r[:2])
+
+    # Stride-Verfahren: der i-te Stream eines Hosts bekommt den Schlüssel i / Gewicht;
+    # bei Gleichstand gewinnt der zuverlässigere Host (rank)
+    def keyed(rank, weight, items):
+        for i, s in enumerate(items):
+            yield (i / weight, rank), s
+
+    merged = heapq.merge(
+        *(keyed(rank, weight, items) for rank, (_, _, weight, items) in enumerate(ranked)),
+        key=lambda pair: pair[0]
+    )
+    return [s for _, s in merged]
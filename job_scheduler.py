@@ -0,0 +1,543 @@
+"""
+Планировщик проверок плейлистов для бота.
+
+Все задания делят один ограниченный пул воркеров внутри процесса бота.
+Слоты раздаются по кругу между чатами (round-robin), поэтому один большой
+плейлист не блокирует остальных пользователей. Результаты проверок общие
+для всех пользователей (ProbeCache), одинаковые URL проверяются один раз.
+
+Большой плейлист можно отправить шардами (submit_sharded): шарды идут
+через пул вперемешку, а для лимитов и прогресса считаются одним заданием.
+
+Задание можно отменить (cancel/cancel_chat): очередь задания очищается,
+а запущенные ffmpeg убиваются вместе с группой процессов, если их
+результат больше никому не нужен.
+"""
+import time
+import asyncio
+import logging
+import functools
+import itertools
+import threading
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+
+from m3u_combiner_fixed import progress_event
+from proc_usage import kill_process_group
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerBusy(Exception):
+    """Очередь заполнена — новое задание не принято"""
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443, 'rtmp': 1935, 'rtsp': 554}
+
+# Поля результата, которые можно переиспользовать между заданиями
+CACHED_FIELDS = ('status', 'error', 'tested_at')
+
+
+def normalize_stream_url(url: str) -> str:
+    """Ключ кэша: схема и хост в нижнем регистре, без порта по умолчанию и #fragment"""
+    try:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or '').lower()
+        port = parts.port
+    except ValueError:
+        return url.strip()
+    netloc = host
+    if parts.username:
+        netloc = f"{parts.username}{':' + parts.password if parts.password else ''}@{host}"
+    if port and DEFAULT_PORTS.get(scheme) != port:
+        netloc += f":{port}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+class ProbeCache:
+    """
+    Общий кэш результатов проверок с TTL (ключ — normalize_stream_url).
+    Неудачные проверки живут меньше: часто это временный сбой.
+    """
+
+    def __init__(self, ttl=1800, negative_ttl=600, max_entries=200_000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, {поля результата})
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, result):
+        ttl = self.ttl if result.get('status') == 'working' else self.negative_ttl
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, {f: result.get(f) for f in CACHED_FIELDS})
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class ProbeJob:
+    """Одно задание: набор потоков одного чата"""
+
+    def __init__(self, job_id, chat_id, total, on_progress=None):
+        self.id = job_id
+        self.chat_id = chat_id
+        self.total = total
+        self.pending = deque()
+        self.results = []
+        self.working = 0
+        self.active = 0
+        self.cached = 0
+        self.created_at = time.monotonic()
+        self.on_progress = on_progress
+        self.group = None  # JobGroup, если задание — шард большой загрузки
+        self.max_result_bytes = None
+        self.on_result = None  # on_result(result) — каждый готовый результат (журнал)
+        self.working_bytes = 0  # примерный размер итогового плейлиста
+        self.cancel_reason = None
+        self.finished = asyncio.get_running_loop().create_future()
+
+    @property
+    def cancelled(self):
+        return self.cancel_reason is not None
+
+    @property
+    def done_count(self):
+        return len(self.results)
+
+    @property
+    def failed(self):
+        return self.done_count - self.working
+
+    def progress(self):
+        return progress_event(self.done_count, self.total, self.working, self.created_at)
+
+    def working_streams(self):
+        return [r for r in self.results if r.get('status') == 'working']
+
+    def _finish(self):
+        if not self.finished.done():
+            self.finished.set_result(self)
+
+
+class JobGroup:
+    """Шарды одной загрузки: общий прогресс и объединённый результат"""
+
+    def __init__(self, chat_id, shards, on_progress=None):
+        self.chat_id = chat_id
+        self.shards = shards
+        self.total = sum(job.total for job in shards)
+        self.created_at = time.monotonic()
+        self.on_progress = on_progress
+        self.max_result_bytes = None
+        self.on_result = None
+        self.cancel_reason = None
+        self.finished = asyncio.get_running_loop().create_future()
+        self._remaining = len(shards)
+        for job in shards:
+            job.group = self
+            job.on_progress = self._on_shard_progress
+            job.finished.add_done_callback(self._on_shard_done)
+
+    @property
+    def id(self):
+        return self.shards[0].id
+
+    @property
+    def working(self):
+        return sum(job.working for job in self.shards)
+
+    @property
+    def cached(self):
+        return sum(job.cached for job in self.shards)
+
+    @property
+    def done_count(self):
+        return sum(job.done_count for job in self.shards)
+
+    @property
+    def working_bytes(self):
+        return sum(job.working_bytes for job in self.shards)
+
+    @property
+    def cancelled(self):
+        return self.cancel_reason is not None
+
+    @property
+    def failed(self):
+        return self.done_count - self.working
+
+    def progress(self):
+        return progress_event(self.done_count, self.total, self.working, self.created_at)
+
+    def working_streams(self):
+        """Рабочие потоки всех шардов без повторов (по hash, иначе по URL)"""
+        seen = set()
+        merged = []
+        for job in self.shards:
+            for result in job.working_streams():
+                key = result.get('hash') or normalize_stream_url(result['url'])
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(result)
+        return merged
+
+    def _on_shard_progress(self, _event):
+        if self.on_progress:
+            self.on_progress(self.progress())
+
+    def _on_shard_done(self, _future):
+        self._remaining -= 1
+        if self._remaining == 0 and not self.finished.done():
+            self.finished.set_result(self)
+
+
+class ProbeScheduler:
+    """
+    Общий пул проверок. probe_fn(stream, on_spawn) выполняется в потоке
+    пула и возвращает dict со статусом (как M3UCombiner.test_stream);
+    on_spawn(process) регистрирует запущенный ffmpeg для отмены.
+    Все изменения состояния происходят в потоке event loop.
+    """
+
+    def __init__(self, probe_fn, max_workers=8, max_jobs=20, max_jobs_per_chat=2, cache=None):
+        self._probe_fn = probe_fn
+        self.cache = cache if cache is not None else ProbeCache()
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self.max_jobs_per_chat = max_jobs_per_chat
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="probe")
+        self._lanes = OrderedDict()  # chat_id -> deque[ProbeJob]
+        self._jobs = {}  # job_id -> ProbeJob
+        self._ids = itertools.count(1)
+        self._active = 0
+        self._inflight = {}  # ключ URL -> (id проверки, [(job, stream), ...] ожидающие результата)
+        self._probe_ids = itertools.count(1)
+        # Процессы проверок (доступ из потоков пула — под блокировкой)
+        self._proc_lock = threading.Lock()
+        self._processes = {}  # id проверки -> Popen
+        self._aborted = set()  # id проверок, отменённых при отмене заданий
+        self.cancelled_probes = 0
+        self._closed = False
+        # Для /metrics (меняются только в потоке event loop)
+        self.outcomes = defaultdict(int)  # статус -> число проверок
+        self.probe_seconds = Histogram()
+        self.probe_cpu_seconds = 0.0      # CPU ffmpeg (user+sys) по result['usage']
+
+    # ---------- Состояние ----------
+
+    @property
+    def active_probes(self):
+        return self._active
+
+    @property
+    def running_processes(self):
+        """Живые процессы ffmpeg"""
+        return len(self._processes)
+
+    @property
+    def queued_streams(self):
+        return sum(len(job.pending) for lane in self._lanes.values() for job in lane)
+
+    @property
+    def job_count(self):
+        """Незавершённые загрузки (шарды одной загрузки — одно задание)"""
+        return len(self._uploads())
+
+    def jobs_for_chat(self, chat_id):
+        return [job for job in self._jobs.values() if job.chat_id == chat_id]
+
+    def _uploads(self, chat_id=None):
+        return {
+            job.group or job for job in self._jobs.values()
+            if chat_id is None or job.chat_id == chat_id
+        }
+
+    def _check_admission(self, chat_id):
+        if self.job_count >= self.max_jobs:
+            raise SchedulerBusy("Сервер перегружен, попробуйте позже")
+        if len(self._uploads(chat_id)) >= self.max_jobs_per_chat:
+            raise SchedulerBusy("Дождитесь завершения предыдущих проверок")
+
+    # ---------- Приём заданий ----------
+
+    def submit(self, chat_id, streams, on_progress=None, max_result_bytes=None, on_result=None):
+        """
+        Поставить задание в очередь. SchedulerBusy — если нет места.
+        on_progress(event) вызывается в event loop после каждого результата,
+        on_result(result) — с самим результатом.
+        max_result_bytes — отменить задание, если итоговый плейлист его превысит.
+        """
+        self._check_admission(chat_id)
+        job = ProbeJob(next(self._ids), chat_id, len(streams), on_progress)
+        job.max_result_bytes = max_result_bytes
+        job.on_result = on_result
+        self._enqueue(job, streams)
+        self._pump()
+        return job
+
+    def submit_sharded(self, chat_id, streams, shard_size, on_progress=None, max_result_bytes=None,
+                       on_result=None):
+        """
+        Большой список — группой шардов по shard_size потоков. Шарды
+        чередуются в очереди чата, для лимитов группа — одно задание.
+        """
+        self._check_admission(chat_id)
+        chunks = [streams[i:i + shard_size] for i in range(0, len(streams), shard_size)] or [[]]
+        shards = [ProbeJob(next(self._ids), chat_id, len(chunk)) for chunk in chunks]
+        group = JobGroup(chat_id, shards, on_progress)
+        group.max_result_bytes = max_result_bytes
+        group.on_result = on_result
+        for job, chunk in zip(shards, chunks):
+            self._enqueue(job, chunk)
+        logger.info(f"Загрузка #{group.id} (чат {chat_id}): {group.total} потоков, {len(shards)} шардов")
+        self._pump()
+        return group
+
+    def _enqueue(self, job, streams):
+        if not job.total:
+            job._finish()
+            return
+        self._jobs[job.id] = job
+
+        # Уже известные результаты отдаём сразу, в очередь — только новые URL
+        for stream in streams:
+            cached = self.cache.get(normalize_stream_url(stream['url']))
+            if cached is not None:
+                job.cached += 1
+                self._deliver(job, {**stream, **cached, 'cached': True})
+                if job.cancelled:
+                    return
+            else:
+                job.pending.append(stream)
+
+        if job.pending:
+            self._lanes.setdefault(job.chat_id, deque()).append(job)
+        logger.info(
+            f"Задание #{job.id} (чат {job.chat_id}): {job.total} потоков, из кэша {job.cached}, "
+            f"в очереди {self.queued_streams}, активно {self._active}/{self.max_workers}"
+        )
+
+    # ---------- Диспетчеризация ----------
+
+    def _pump(self):
+        """Занять свободные слоты: по одному потоку от каждого чата по кругу"""
+        loop = asyncio.get_running_loop()
+        while not self._closed and self._active < self.max_workers and self._lanes:
+            chat_id, lane = self._lanes.popitem(last=False)
+            job = lane[0]
+            stream = job.pending.popleft()
+            if not job.pending:
+                lane.popleft()
+            elif job.group is not None:
+                # Шарды одной загрузки идут вперемешку
+                lane.rotate(-1)
+            if lane:
+                # В конец очереди — следующий слот получит другой чат
+                self._lanes[chat_id] = lane
+
+            key = normalize_stream_url(stream['url'])
+            # Кто-то успел проверить этот URL, пока задание стояло в очереди
+            cached = self.cache.get(key)
+            if cached is not None:
+                job.cached += 1
+                self._deliver(job, {**stream, **cached, 'cached': True})
+                continue
+            # Этот URL уже проверяется для другого задания — ждём тот же результат
+            if key in self._inflight:
+                self._inflight[key][1].append((job, stream))
+                continue
+
+            probe_id = next(self._probe_ids)
+            waiting = [(job, stream)]
+            self._inflight[key] = (probe_id, waiting)
+            self._active += 1
+            job.active += 1
+            future = loop.run_in_executor(self._executor, self._run_probe, probe_id, stream)
+            future.add_done_callback(functools.partial(
+                self._on_probe_done, job, key, stream, probe_id, waiting, time.monotonic()
+            ))
+
+    def _run_probe(self, probe_id, stream):
+        """Выполняется в потоке пула"""
+        def on_spawn(process):
+            with self._proc_lock:
+                if probe_id in self._aborted:
+                    kill_process_group(process)
+                else:
+                    self._processes[probe_id] = process
+        try:
+            return self._probe_fn(stream, on_spawn)
+        finally:
+            with self._proc_lock:
+                self._processes.pop(probe_id, None)
+
+    def _on_probe_done(self, job, key, stream, probe_id, waiting, started_at, future):
+        self._active -= 1
+        job.active -= 1
+        self.probe_seconds.record(time.monotonic() - started_at)
+        with self._proc_lock:
+            aborted = probe_id in self._aborted
+            self._aborted.discard(probe_id)
+        if self._inflight.get(key, (None,))[0] == probe_id:
+            del self._inflight[key]
+        if future.cancelled():
+            # Пул остановлен (shutdown, cancel_futures=True) — результата не будет
+            return
+        if aborted:
+            # Проверку убили при отмене — результат ничего не говорит о потоке.
+            # Кто успел к ней присоединиться и не отменён — снова в очередь.
+            for waiting_job, waiting_stream in waiting:
+                if not waiting_job.cancelled:
+                    self._requeue(waiting_job, waiting_stream)
+            self._pump()
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"Ошибка проверки потока: {e}")
+            result = {**stream, 'status': 'error', 'error': str(e)}
+
+        self.outcomes[result.get('status') or 'unknown'] += 1
+        usage = result.get('usage') or {}
+        self.probe_cpu_seconds += (usage.get('cpu_user_s') or 0) + (usage.get('cpu_sys_s') or 0)
+        self.cache.put(key, result)
+        shared = {f: result.get(f) for f in CACHED_FIELDS}
+        for waiting_job, waiting_stream in waiting:
+            if waiting_job.cancelled:
+                continue
+            if waiting_job is job and waiting_stream is stream:
+                self._deliver(job, result)
+            else:
+                self._deliver(waiting_job, {**waiting_stream, **shared, 'cached': True})
+        self._pump()
+
+    def _requeue(self, job, stream):
+        """Вернуть поток в начало очереди задания"""
+        job.pending.appendleft(stream)
+        lane = self._lanes.setdefault(job.chat_id, deque())
+        if job not in lane:
+            lane.appendleft(job)
+
+    def _deliver(self, job, result):
+        """Записать результат в задание, сообщить прогресс, завершить при необходимости"""
+        job.results.append(result)
+        if result.get('status') == 'working':
+            job.working += 1
+            job.working_bytes += len(result['url']) + len(result.get('info') or '') + 2
+        owner = job.group or job
+        if owner.on_result:
+            try:
+                owner.on_result(result)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика результата: {e}")
+        if job.on_progress:
+            try:
+                job.on_progress(job.progress())
+            except Exception as e:
+                logger.error(f"Ошибка обработчика прогресса: {e}")
+
+        if owner.max_result_bytes and owner.working_bytes > owner.max_result_bytes:
+            self.cancel(owner, 'too_large')
+            return
+
+        if job.done_count >= job.total:
+            self._jobs.pop(job.id, None)
+            job._finish()
+            logger.info(
+                f"Задание #{job.id} завершено: {job.working}/{job.total} рабочих "
+                f"за {time.monotonic() - job.created_at:.0f}с"
+            )
+
+    # ---------- Отмена ----------
+
+    def cancel(self, job, reason='cancelled'):
+        """
+        Отменить задание или группу шардов: убрать из очереди, убить
+        проверки, результат которых больше никому не нужен. Возвращает
+        число потоков, которые так и не были проверены.
+        """
+        shards = job.shards if isinstance(job, JobGroup) else [job]
+        if job.cancelled or job.finished.done():
+            return 0
+        job.cancel_reason = reason
+        dropped = 0
+        for shard in shards:
+            if shard.finished.done():
+                continue
+            shard.cancel_reason = reason
+            dropped += len(shard.pending) + shard.active
+            shard.pending.clear()
+            self._jobs.pop(shard.id, None)
+            lane = self._lanes.get(shard.chat_id)
+            if lane is not None and shard in lane:
+                lane.remove(shard)
+                if not lane:
+                    del self._lanes[shard.chat_id]
+
+        # Общие проверки: убиваем только те, которых больше никто не ждёт
+        for key, (probe_id, waiting) in list(self._inflight.items()):
+            alive = [(j, s) for j, s in waiting if not j.cancelled]
+            if len(alive) == len(waiting):
+                continue
+            waiting[:] = alive
+            if not alive:
+                # Новые задания с этим URL запустят свежую проверку
+                del self._inflight[key]
+                self._abort_probe(probe_id)
+
+        for shard in shards:
+            shard._finish()
+        logger.info(f"Задание #{job.id} (чат {job.chat_id}) отменено ({reason}), не проверено: {dropped}")
+        self._pump()
+        return dropped
+
+    def cancel_chat(self, chat_id, reason='cancelled'):
+        """Отменить все задания чата; возвращает число отменённых загрузок"""
+        uploads = self._uploads(chat_id)
+        for upload in uploads:
+            self.cancel(upload, reason)
+        return len(uploads)
+
+    def cancel_all(self, reason='cancelled'):
+        """Отменить все задания (например, при остановке бота)"""
+        uploads = self._uploads()
+        for upload in uploads:
+            self.cancel(upload, reason)
+        return len(uploads)
+
+    def _abort_probe(self, probe_id):
+        with self._proc_lock:
+            self._aborted.add(probe_id)
+            process = self._processes.pop(probe_id, None)
+        if process is not None:
+            kill_process_group(process)
+        self.cancelled_probes += 1
+
+    def shutdown(self):
+        self._closed = True
+        with self._proc_lock:
+            processes = list(self._processes.values())
+            self._aborted.update(self._processes)
+        for process in processes:
+            kill_process_group(process)
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,191 @@
+"""
+Журнал проверок плейлистов бота (SQLite), чтобы проверки переживали
+перезапуск контейнера.
+
+Для каждой проверки сохраняются чат, копия входного плейлиста в
+JOBS_DIR и журнал уже проверенных потоков (по hash). После рестарта
+незавершённые проверки продолжаются с места остановки: потоки из
+журнала повторно не проверяются.
+"""
+import time
+import shutil
+import asyncio
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS probe_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        file_unique_id TEXT,
+        file_name TEXT,
+        status TEXT NOT NULL DEFAULT 'running',
+        attempts INTEGER NOT NULL DEFAULT 1,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS probe_journal (
+        job_id INTEGER NOT NULL,
+        hash TEXT NOT NULL,
+        status TEXT NOT NULL,
+        error TEXT,
+        tested_at TEXT,
+        PRIMARY KEY (job_id, hash)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_probe_jobs_status ON probe_jobs (status)",
+)
+
+SQL_INSERT_JOB = """
+    INSERT INTO probe_jobs (chat_id, file_unique_id, file_name, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+SQL_JOURNAL = """
+    INSERT OR REPLACE INTO probe_journal (job_id, hash, status, error, tested_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+SQL_SELECT_JOURNAL = "SELECT hash, status, error, tested_at FROM probe_journal WHERE job_id = ?"
+SQL_SELECT_UNFINISHED = """
+    SELECT id, chat_id, file_unique_id, file_name, attempts, created_at
+    FROM probe_jobs WHERE status = 'running' ORDER BY id
+"""
+SQL_SET_STATUS = "UPDATE probe_jobs SET status = ?, updated_at = ? WHERE id = ?"
+SQL_BUMP_ATTEMPTS = "UPDATE probe_jobs SET attempts = attempts + 1, updated_at = ? WHERE id = ?"
+SQL_DELETE_JOURNAL = "DELETE FROM probe_journal WHERE job_id = ?"
+SQL_PURGE_JOBS = "DELETE FROM probe_jobs WHERE status != 'running' AND updated_at < ?"
+
+
+class JobStore:
+
+    def __init__(self, path, jobs_dir=Path("jobs")):
+        self.path = path
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def input_path(self, job_id: int) -> Path:
+        return self.jobs_dir / f"{job_id}.m3u"
+
+    def create(self, chat_id: int, file_unique_id: str, file_name: str, src: Path) -> int:
+        """Записать новую проверку и сохранить копию входного плейлиста"""
+        now = time.time()
+        with self._lock, self._conn:
+            job_id = self._conn.execute(
+                SQL_INSERT_JOB, (chat_id, file_unique_id, file_name, now, now)
+            ).lastrowid
+        shutil.copyfile(src, self.input_path(job_id))
+        return job_id
+
+    def journal(self, job_id: int, results):
+        """Отметить потоки как проверенные: results — dict'ы с hash/status/error/tested_at"""
+        rows = [
+            (job_id, r['hash'], r.get('status'), r.get('error'), r.get('tested_at'))
+            for r in results if r.get('hash')
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(SQL_JOURNAL, rows)
+
+    def completed(self, job_id: int) -> dict:
+        """hash -> поля результата для уже проверенных потоков"""
+        with self._lock:
+            rows = self._conn.execute(SQL_SELECT_JOURNAL, (job_id,)).fetchall()
+        return {
+            h: {'status': status, 'error': error, 'tested_at': tested_at}
+            for h, status, error, tested_at in rows
+        }
+
+    def unfinished(self):
+        """Проверки, прерванные перезапуском"""
+        with self._lock:
+            rows = self._conn.execute(SQL_SELECT_UNFINISHED).fetchall()
+        keys = ('id', 'chat_id', 'file_unique_id', 'file_name', 'attempts', 'created_at')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def bump_attempts(self, job_id: int):
+        with self._lock, self._conn:
+            self._conn.execute(SQL_BUMP_ATTEMPTS, (time.time(), job_id))
+
+    def finish(self, job_id: int, status: str):
+        """Закрыть проверку (done/cancelled/failed/expired): журнал и копия входа больше не нужны"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(SQL_SET_STATUS, (status, now, job_id))
+            self._conn.execute(SQL_DELETE_JOURNAL, (job_id,))
+            # Строки закрытых проверок храним неделю — для отладки
+            self._conn.execute(SQL_PURGE_JOBS, (now - 7 * 86400,))
+        self.input_path(job_id).unlink(missing_ok=True)
+
+
+class JobJournal:
+    """
+    Буфер журнала одной проверки. record() вызывается из event loop на
+    каждый результат; запись в БД — пачками через write(rows).
+    """
+
+    def __init__(self, job_id: int, write, batch_size: int = 50, interval: float = 2.0):
+        self.job_id = job_id
+        self._write = write  # корутина write(job_id, rows)
+        self.batch_size = batch_size
+        self.interval = interval
+        self._buffer = []
+        self._pending = set()
+        self._timer = None
+
+    def record(self, result: dict):
+        self._buffer.append(result)
+        if len(self._buffer) >= self.batch_size:
+            self._spawn_flush()
+        elif self._timer is None:
+            # Результаты приходят редко — не держим их в памяти дольше interval
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._spawn_flush)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _spawn_flush(self):
+        self._cancel_timer()
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        task = asyncio.create_task(self._flush(rows))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _flush(self, rows):
+        try:
+            await self._write(self.job_id, rows)
+        except Exception as e:
+            # Не записанное будет проверено ещё раз после рестарта — не страшно
+            logger.warning(f"Журнал проверки #{self.job_id} не записан: {e}")
+
+    async def close(self):
+        """Дописать остаток буфера"""
+        self._spawn_flush()
+        for task in list(self._pending):
+            await task
+
+    def flush_sync(self, store: JobStore):
+        """При остановке бота: записать остаток напрямую, без пула"""
+        self._cancel_timer()
+        rows, self._buffer = self._buffer, []
+        if rows:
+            store.journal(self.job_id, rows)
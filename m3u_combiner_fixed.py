@@ -11,18 +11,47 @@ import os
 import sys
 import json
 from pathlib import Path
-from urllib.parse import urlparse
 import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-import hashlib
 import threading
+import time
+
+from proc_usage import Budget, UsageStats, run_measured
+from result_stream import ResultWriter, result_record, stream_hash
+from tool_discovery import find_tool
+from baseline import Baseline, print_delta
+from host_stats import HostStats, interleave_by_host
+
+
+def progress_event(tested, total, working, started_at):
+    """Strukturiertes Fortschritts-Event (für Callbacks und --progress-json)"""
+    elapsed = time.monotonic() - started_at
+    remaining = total - tested
+    eta = elapsed / tested * remaining if tested else None
+    return {
+        'type': 'progress',
+        'tested': tested,
+        'total': total,
+        'working': working,
+        'failed': tested - working,
+        'elapsed_s': round(elapsed, 1),
+        'eta_s': round(eta, 1) if eta is not None else None
+    }
+
 
 class M3UCombiner:
-    def __init__(self, timeout=8, max_workers=15, output_file="combined_working.m3u"):
+    def __init__(self, timeout=8, max_workers=15, output_file="combined_working.m3u", budget=None,
+                 collect_usage=True, host_stats=None):
         self.timeout = timeout
         self.max_workers = max_workers
         self.output_file = output_file
+        # Optionales CPU/RSS-Budget pro Probe (proc_usage.Budget); Verbrauch
+        # pro Stream sammeln (im Bot aus — dort läuft der Prozess dauerhaft)
+        self.budget = budget
+        self.usage = UsageStats() if collect_usage else None
+        # PATH / Umgebungsvariable FFMPEG statt "ffmpeg -version" bei jedem Start
+        self.ffmpeg = find_tool('ffmpeg', 'FFMPEG') or 'ffmpeg'
         
         # Für Duplikaterkennung
         self.seen_streams = set()
@@ -36,60 +65,65 @@ class M3UCombiner:
             'streams_working': 0,
             'streams_failed': 0,
             'streams_duplicate': 0,
+            'streams_carried': 0,
+            'streams_carried_working': 0,
             'playlists_processed': {}
         }
         
         # Gesammelte funktionierende Streams
         self.working_streams = []
+
+        # Delta-Bericht gegen --baseline (None ohne Baseline)
+        self.delta = None
+
+        # Host-Statistik (wie check_iptv_pro): Reihenfolge der Proben und Zähler pro Host
+        self.host_stats = host_stats
     
     def get_stream_hash(self, url):
-        parsed = urlparse(url)
-        clean_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
-        return hashlib.md5(clean_url.encode('utf-8')).hexdigest()
+        return stream_hash(url)
     
     def extract_streams_from_m3u(self, m3u_path):
         streams = []
         
         try:
+            # Zeilenweise lesen — auch riesige Playlists nicht komplett im Speicher
             with open(m3u_path, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
-            
-            current_info = None
-            for line in lines:
-                line = line.strip()
+                current_info = None
+                for line in f:
+                    line = line.strip()
                 
-                if not line:
-                    continue
+                    if not line:
+                        continue
                 
-                if line.startswith('#EXTINF:'):
-                    current_info = line
-                    continue
+                    if line.startswith('#EXTINF:'):
+                        current_info = line
+                        continue
                 
-                if (line and not line.startswith('#') and 
-                    (line.startswith('http://') or 
-                     line.startswith('https://') or
-                     line.startswith('rtmp://') or
-                     line.startswith('rtsp://') or
-                     line.startswith('udp://') or
-                     line.startswith('rtp://'))):
+                    if (line and not line.startswith('#') and 
+                        (line.startswith('http://') or 
+                         line.startswith('https://') or
+                         line.startswith('rtmp://') or
+                         line.startswith('rtsp://') or
+                         line.startswith('udp://') or
+                         line.startswith('rtp://'))):
                     
-                    stream_hash = self.get_stream_hash(line)
+                        stream_hash = self.get_stream_hash(line)
                     
-                    if stream_hash in self.seen_streams:
-                        self.duplicate_count += 1
-                        self.stats['streams_duplicate'] += 1
-                        current_info = None
-                        continue
+                        if stream_hash in self.seen_streams:
+                            self.duplicate_count += 1
+                            self.stats['streams_duplicate'] += 1
+                            current_info = None
+                            continue
                     
-                    self.seen_streams.add(stream_hash)
+                        self.seen_streams.add(stream_hash)
                     
-                    streams.append({
-                        'url': line,
-                        'info': current_info if current_info else f"#EXTINF:-1,Unbekannter Kanal",
-                        'source_playlist': Path(m3u_path).name,
-                        'hash': stream_hash
-                    })
-                    current_info = None
+                        streams.append({
+                            'url': line,
+                            'info': current_info if current_info else f"#EXTINF:-1,Unbekannter Kanal",
+                            'source_playlist': Path(m3u_path).name,
+                            'hash': stream_hash
+                        })
+                        current_info = None
                     
         except Exception as e:
             print(f"  ⚠️ Fehler beim Lesen von {Path(m3u_path).name}: {e}")
@@ -99,11 +133,16 @@ class M3UCombiner:
     # ---------------------------------------------------------
     # 🔥 NEUE, MAXIMAL STABILE test_stream() — NIE WIEDER 99%-FREEZE
     # ---------------------------------------------------------
-    def test_stream(self, stream_info):
+    def test_stream(self, stream_info, on_spawn=None):
+        """
+        on_spawn(process) wird direkt nach dem Start von ffmpeg aufgerufen —
+        damit kann der Aufrufer die Prüfung abbrechen (kill_process_group).
+        Das Ergebnis enthält 'usage' (CPU, max. RSS, gelesene Bytes).
+        """
         url = stream_info['url']
 
         ffmpeg_cmd = [
-            'ffmpeg',
+            self.ffmpeg,
             '-hide_banner',
             '-loglevel', 'error',
             '-timeout', str(self.timeout * 1000000),
@@ -115,36 +154,50 @@ class M3UCombiner:
         ]
 
         try:
-            process = subprocess.Popen(
+            # Eigene Prozessgruppe: beim Abbruch werden auch Kindprozesse beendet
+            run = run_measured(
                 ffmpeg_cmd,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.PIPE
+                timeout=self.timeout + 1,
+                stderr=subprocess.PIPE,
+                budget=self.budget,
+                on_spawn=on_spawn
             )
+            if self.usage is not None:
+                self.usage.add(url, run.usage, run.over_budget)
 
-            try:
-                _, stderr = process.communicate(timeout=self.timeout + 1)
-            except subprocess.TimeoutExpired:
-                process.kill()
+            if run.over_budget:
+                return {
+                    **stream_info,
+                    'status': 'over_budget',
+                    'error': run.over_budget,
+                    'usage': run.usage,
+                    'tested_at': datetime.now().isoformat()
+                }
+
+            if run.timed_out:
                 return {
                     **stream_info,
                     'status': 'timeout',
                     'error': f'Timeout nach {self.timeout} Sekunden',
+                    'usage': run.usage,
                     'tested_at': datetime.now().isoformat()
                 }
 
-            if process.returncode == 0:
+            if run.returncode == 0:
                 return {
                     **stream_info,
                     'status': 'working',
                     'error': None,
+                    'usage': run.usage,
                     'tested_at': datetime.now().isoformat()
                 }
             else:
-                err = stderr.decode('utf-8', errors='ignore') if stderr else ""
+                err = run.stderr.decode('utf-8', errors='ignore') if run.stderr else ""
                 return {
                     **stream_info,
                     'status': 'failed',
                     'error': err[:80] if err else "Unknown error",
+                    'usage': run.usage,
                     'tested_at': datetime.now().isoformat()
                 }
 
@@ -174,7 +227,16 @@ class M3UCombiner:
     # ---------------------------------------------------------
     # 🔥 MAXIMAL STABILE process_playlists() MIT CTRL+C SUPPORT
     # ---------------------------------------------------------
-    def process_playlists(self, m3u_files):
+    def process_playlists(self, m3u_files, progress_callback=None, results=None,
+                          baseline=None, recheck_sample=0.1, file_order=False):
+        """
+        Testet alle Streams. progress_callback(event) bekommt nach jedem
+        Ergebnis ein progress_event()-Dict, results (ResultWriter) eine
+        JSON-Zeile pro Stream. Mit baseline (Baseline) werden nur neue
+        Streams und der Anteil recheck_sample der früher funktionierenden
+        getestet, der Rest wird übernommen. Ohne file_order wechseln sich
+        die Hosts ab, zuverlässige (laut host_stats) zuerst.
+        """
         all_streams = []
         
         print(f"\n📋 Extrahiere Streams aus Playlists...")
@@ -201,9 +263,22 @@ class M3UCombiner:
             return
         
         print(f"\n🔢 Insgesamt {len(all_streams)} eindeutige Streams gefunden")
+
+        probed = None
+        if baseline is not None:
+            current_hashes = {s['hash'] for s in all_streams}
+            all_streams, carried = baseline.plan(all_streams, recheck_sample)
+            print(f"🔀 Baseline: {len(all_streams)} zu testen, {len(carried)} übernommen")
+            for stream_info, status in carried:
+                self._carry(stream_info, status, results)
+            probed = {}
+
+        if not file_order:
+            all_streams = interleave_by_host(all_streams, self.host_stats)
         print(f"🔄 Teste Streams (parallel mit {self.max_workers} Workern)...")
 
         tested_count = 0
+        started_at = time.monotonic()
 
         try:
             with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
@@ -218,6 +293,12 @@ class M3UCombiner:
                     result = future.result()
 
                     self.stats['streams_tested'] += 1
+                    if probed is not None:
+                        probed[stream_info['hash']] = result['status']
+                    if self.host_stats is not None:
+                        self.host_stats.record(
+                            stream_info['url'], 'working' if result['status'] == 'working' else 'failed'
+                        )
                     
                     if result['status'] == 'working':
                         status_icon = "✅"
@@ -228,7 +309,18 @@ class M3UCombiner:
                         status_icon = "❌"
                         self.stats['streams_failed'] += 1
                         self.stats['playlists_processed'][stream_info['source_playlist']]['streams_failed'] += 1
+
+                    if results is not None:
+                        results.result(result_record(
+                            stream_info['url'], result['status'], error=result.get('error'),
+                            source=stream_info['source_playlist'], usage=result.get('usage')
+                        ))
                     
+                    if progress_callback:
+                        progress_callback(progress_event(
+                            tested_count, len(all_streams), self.stats['streams_working'], started_at
+                        ))
+
                     if tested_count % 10 == 0 or tested_count == len(all_streams):
                         progress = (tested_count / len(all_streams)) * 100
                         print(f"  {status_icon} [{tested_count}/{len(all_streams)}] {progress:.1f}% - {self._shorten_url(stream_info['url'])}")
@@ -238,6 +330,25 @@ class M3UCombiner:
             executor.shutdown(wait=False, cancel_futures=True)
             raise
 
+        if baseline is not None:
+            self.delta = baseline.delta(current_hashes, probed)
+
+    def _carry(self, stream_info, status, results):
+        """Stream mit Status aus der Baseline übernehmen, ohne ihn zu testen"""
+        self.stats['streams_carried'] += 1
+        playlist_stats = self.stats['playlists_processed'][stream_info['source_playlist']]
+        if status == 'working':
+            self.stats['streams_carried_working'] += 1
+            self.working_streams.append({**stream_info, 'status': 'working', 'carried': True})
+            playlist_stats['streams_working'] += 1
+        else:
+            playlist_stats['streams_failed'] += 1
+        if results is not None:
+            results.result({
+                **result_record(stream_info['url'], status, source=stream_info['source_playlist']),
+                'carried': True
+            })
+
     def _shorten_url(self, url):
         if len(url) > 50:
             return url[:25] + "..." + url[-22:]
@@ -265,6 +376,10 @@ class M3UCombiner:
                 f.write(f"# Total playlists processed: {len(self.stats['playlists_processed'])}\n")
                 f.write(f"# Total working streams: {len(self.working_streams)}\n")
                 f.write(f"# Duplicate streams filtered: {self.stats['streams_duplicate']}\n")
+                if self.delta:
+                    f.write(f"# Delta: +{self.delta['added']} neu, -{self.delta['removed']} entfernt, "
+                            f"{self.delta['newly_dead']} neu tot, "
+                            f"{self.stats['streams_carried']} aus Baseline übernommen\n")
                 f.write("#" + "="*60 + "\n\n")
                 
                 current_playlist = None
@@ -296,6 +411,9 @@ class M3UCombiner:
         print(f"Getestete Streams: {self.stats['streams_tested']}")
         print(f"✅ Funktionierende: {self.stats['streams_working']}")
         print(f"❌ Fehlgeschlagene: {self.stats['streams_failed']}")
+        if self.stats['streams_carried']:
+            print(f"🔀 Aus Baseline übernommen: {self.stats['streams_carried']} "
+                  f"(davon funktionierend: {self.stats['streams_carried_working']})")
         
         if self.stats['streams_tested'] > 0:
             success_rate = (self.stats['streams_working'] / self.stats['streams_tested']) * 100
@@ -313,38 +431,28 @@ class M3UCombiner:
                 print(f"    Erfolgsrate: {rate:.1f}%")
             print()
         
+        if self.delta:
+            print_delta(self.delta)
+
+        if self.usage is not None:
+            self.usage.print_summary()
+
         print(f"🎯 Funktionierende Streams gesamt: {len(self.working_streams)}")
         print(f"="*70)
     
-    def save_statistics(self):
-        stats_file = f"m3u_combiner_stats_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        
-        try:
-            detailed_stats = {
-                'timestamp': datetime.now().isoformat(),
-                'settings': {
-                    'timeout': self.timeout,
-                    'max_workers': self.max_workers
-                },
-                'statistics': self.stats,
-                'working_streams_count': len(self.working_streams),
-                'working_streams': [
-                    {
-                        'url': s['url'],
-                        'channel_name': s['info'],
-                        'source': s['source_playlist'],
-                        'tested_at': s.get('tested_at', '')
-                    } for s in self.working_streams
-                ]
-            }
-            
-            with open(stats_file, 'w', encoding='utf-8') as f:
-                json.dump(detailed_stats, f, indent=2, ensure_ascii=False)
-            
-            print(f"📊 Statistiken gespeichert in: {stats_file}")
-            
-        except Exception as e:
-            print(f"⚠️ Konnte Statistiken nicht speichern: {e}")
+    def write_summary(self, results):
+        """Abschlusszeile der JSONL-Ergebnisse (Einstellungen, Zähler, Verbrauch)"""
+        results.summary({
+            'tool': 'm3u_combiner',
+            'settings': {
+                'timeout': self.timeout,
+                'max_workers': self.max_workers
+            },
+            'statistics': self.stats,
+            'resource_usage': self.usage.to_dict() if self.usage is not None else None,
+            'delta': self.delta,
+            'working_streams_count': len(self.working_streams)
+        })
 
 def main():
     parser = argparse.ArgumentParser(
@@ -366,16 +474,27 @@ Beispiele:
     parser.add_argument('-o', '--output', default='combined_working.m3u',
                        help='Ausgabe-Dateiname (default: combined_working.m3u)')
     parser.add_argument('--no-stats', action='store_true',
-                       help='Keine JSON-Statistik speichern')
+                       help='Keine JSONL-Ergebnisse speichern')
+    parser.add_argument('--results', metavar='DATEI',
+                       help='Ergebnis pro Stream als JSON-Zeilen (default: m3u_combiner_results_<Zeit>.jsonl)')
+    parser.add_argument('--progress-json', metavar='DATEI',
+                       help='Fortschritt als JSON-Zeilen in DATEI schreiben ("-" = stderr)')
+    parser.add_argument('--baseline', metavar='DATEI',
+                       help='Früheres Ergebnis (JSONL von --results oder Ausgabe-M3U): nur Neues testen')
+    parser.add_argument('--recheck-sample', type=float, default=0.1, metavar='ANTEIL',
+                       help='Anteil bekannter Streams (funktionierend oder tot), der erneut getestet wird (default: 0.1)')
+    parser.add_argument('--host-stats', metavar='DATEI',
+                       help='Host-Statistik (wie check_iptv_pro.py, z.B. host_stats.json) lesen und fortschreiben')
+    parser.add_argument('--file-order', action='store_true',
+                       help='Streams in Reihenfolge der Dateien testen (statt Hosts abwechselnd)')
+    parser.add_argument('--cpu-budget', type=float, metavar='SEK',
+                       help='Probe abbrechen, wenn ffmpeg mehr CPU-Sekunden verbraucht')
+    parser.add_argument('--rss-budget', type=int, metavar='MB',
+                       help='Probe abbrechen, wenn ffmpeg mehr Speicher (RSS) belegt')
     
     args = parser.parse_args()
     
-    try:
-        subprocess.run(['ffmpeg', '-version'], 
-                      stdout=subprocess.DEVNULL, 
-                      stderr=subprocess.DEVNULL, 
-                      check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError):
+    if find_tool('ffmpeg', 'FFMPEG') is None:
         print("❌ Fehler: FFmpeg ist nicht installiert oder nicht im PATH!")
         sys.exit(1)
     
@@ -385,7 +504,9 @@ Beispiele:
     combiner = M3UCombiner(
         timeout=args.timeout,
         max_workers=args.workers,
-        output_file=args.output
+        output_file=args.output,
+        budget=Budget(args.cpu_budget, args.rss_budget),
+        host_stats=HostStats(args.host_stats) if args.host_stats else None
     )
     
     m3u_files = combiner.scan_directory(args.directory)
@@ -394,12 +515,41 @@ Beispiele:
         print(f"❌ Keine M3U-Dateien in {args.directory} gefunden!")
         sys.exit(1)
     
+    progress_out = None
+    progress_callback = None
+    if args.progress_json:
+        progress_out = sys.stderr if args.progress_json == '-' else open(args.progress_json, 'w', encoding='utf-8')
+
+        def progress_callback(event):
+            progress_out.write(json.dumps(event, separators=(',', ':')) + '\n')
+            progress_out.flush()
+
+    baseline = None
+    if args.baseline:
+        baseline = Baseline.load(args.baseline)
+        print(f"🔀 Baseline: {len(baseline.statuses)} Streams, davon {baseline.working} funktionierend")
+
+    results = None
+    if not args.no_stats:
+        results_path = args.results or f"m3u_combiner_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        results = ResultWriter(results_path)
+
     try:
-        combiner.process_playlists(m3u_files)
+        combiner.process_playlists(m3u_files, progress_callback=progress_callback, results=results,
+                                   baseline=baseline, recheck_sample=args.recheck_sample,
+                                   file_order=args.file_order)
     except KeyboardInterrupt:
         print("\n⛔ Abgebrochen durch Benutzer.")
+        if results is not None:
+            results.close()
         sys.exit(1)
+    finally:
+        if progress_out is not None and progress_out is not sys.stderr:
+            progress_out.close()
     
+    if combiner.host_stats is not None:
+        combiner.host_stats.save()
+
     output_file = combiner.create_combined_m3u(args.output)
     
     if output_file:
@@ -409,8 +559,10 @@ Beispiele:
     
     combiner.print_statistics()
     
-    if not args.no_stats:
-        combiner.save_statistics()
+    if results is not None:
+        combiner.write_summary(results)
+        results.close()
+        print(f"📊 Ergebnisse (JSONL) gespeichert in: {results.path}")
     
     print("\n🎉 Fertig! Die kombinierte Playlist enthält alle funktionierenden Streams mit Originalnamen.")
 
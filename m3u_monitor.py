@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+M3U Monitor — Dauerbetrieb statt Cron-Läufen.
+
+Hält einen Katalog aller Streams aus den Eingabe-Playlists
+(stream_catalog.py) und prüft jeden Stream nach eigenem Zeitplan:
+- stabile Streams immer seltener (Intervall verdoppelt sich bis --max-interval),
+- wechselhafte Streams oft (--min-interval),
+- ausgefallene mit exponentiellem Backoff ab --fail-interval.
+
+Eine Prioritätswarteschlange (Heap nach Fälligkeit) speist die Proben,
+begrenzt durch ein globales Budget (--rate Proben pro Minute, gleichmäßig
+verteilt) und --workers gleichzeitige ffmpeg-Prozesse. Die Proben selbst
+macht M3UCombiner.test_stream.
+
+Die veröffentlichte Playlist wird atomar ersetzt, sobald sich die Menge
+der funktionierenden Streams ändert (höchstens alle --publish-interval s).
+"""
+import os
+import sys
+import time
+import heapq
+import random
+import signal
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from m3u_combiner_fixed import M3UCombiner
+from proc_usage import Budget, kill_process_group
+from result_stream import ResultWriter, result_record
+from stream_catalog import StreamCatalog
+from tool_discovery import find_tool
+
+if sys.platform.startswith('win'):
+    sys.stdout.reconfigure(encoding='utf-8')
+
+FLAP_UNSTABLE = 0.3  # ab dieser Wechselhäufigkeit gilt ein Stream als wechselhaft
+MAX_DOUBLINGS = 16
+
+
+class RecheckPolicy:
+    """Wann wird ein Stream nach einer Probe das nächste Mal geprüft?"""
+
+    def __init__(self, min_interval=300, max_interval=86400, fail_interval=300, jitter=0.1):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.fail_interval = fail_interval
+        self.jitter = jitter
+
+    def update(self, row, working, now, rng=random):
+        """Rückgabe: (consecutive_ok, consecutive_fail, flap, next_check)"""
+        # Wechselhäufigkeit als gleitender Mittelwert der Statuswechsel
+        changed = row['status'] is not None and (row['status'] == 'working') != working
+        flap = row['flap'] * 0.8 + (0.2 if changed else 0.0)
+
+        if working:
+            ok, fail = row['consecutive_ok'] + 1, 0
+            if flap >= FLAP_UNSTABLE:
+                interval = self.min_interval
+            else:
+                interval = self.min_interval * 2 ** min(ok - 1, MAX_DOUBLINGS)
+        else:
+            ok, fail = 0, row['consecutive_fail'] + 1
+            interval = self.fail_interval * 2 ** min(fail - 1, MAX_DOUBLINGS)
+
+        interval = min(interval, self.max_interval)
+        # Streuung, damit gleich alte Streams nicht gleichzeitig fällig werden
+        interval *= 1 + rng.uniform(-self.jitter, self.jitter)
+        return ok, fail, round(flap, 4), now + interval
+
+
+class StreamMonitor:
+
+    def __init__(self, inputs, catalog: StreamCatalog, output, combiner: M3UCombiner,
+                 policy: RecheckPolicy, rate=120, workers=8, scan_interval=60,
+                 publish_interval=10, status_interval=60, results=None):
+        self.inputs = [Path(p) for p in inputs]
+        self.catalog = catalog
+        self.output = Path(output)
+        self.combiner = combiner
+        self.policy = policy
+        self.spacing = 60.0 / rate  # Abstand zwischen zwei Probenstarts
+        self.workers = workers
+        self.scan_interval = scan_interval
+        self.publish_interval = publish_interval
+        self.status_interval = status_interval
+        self.results = results
+
+        self._heap = []        # (next_check, hash)
+        self._next = {}        # hash -> next_check (veraltete Heap-Einträge erkennen)
+        self._in_flight = {}   # future -> hash
+        self._processes = {}   # hash -> Popen (zum Beenden beim Stopp)
+        self._proc_lock = threading.Lock()
+        self._fingerprint = None
+        self._next_slot = 0.0  # frühester Start der nächsten Probe (Ratenbudget)
+        # Playlist neu schreiben — beim Start nur, wenn es sie noch nicht gibt
+        self._dirty = not self.output.exists()
+        self._stopping = False
+        self.probes = 0
+
+    # ---------- Eingaben ----------
+
+    def _input_files(self):
+        files = []
+        for path in self.inputs:
+            if path.is_dir():
+                for ext in ('*.m3u', '*.m3u8'):
+                    files.extend(path.glob(ext))
+            elif path.exists():
+                files.append(path)
+        return sorted(files)
+
+    def scan(self, force=False):
+        """Playlists neu einlesen, wenn sich eine Datei geändert hat"""
+        files = self._input_files()
+        fingerprint = []
+        for f in files:
+            st = f.stat()
+            fingerprint.append((str(f), st.st_mtime_ns, st.st_size))
+        if not force and fingerprint == self._fingerprint:
+            return
+        self._fingerprint = fingerprint
+
+        # Frischer Combiner: extract_streams_from_m3u merkt sich gesehene Hashes
+        parser = M3UCombiner(collect_usage=False)
+        streams = []
+        for f in files:
+            streams.extend(parser.extract_streams_from_m3u(f))
+        added, removed = self.catalog.sync(streams)
+        if removed:
+            self._dirty = True  # neue Streams sind noch ungeprüft, ändern die Playlist also nicht
+        print(f"📋 {len(files)} Playlists, {len(streams)} Streams (+{added} neu, -{removed} entfernt)")
+        self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        busy = set(self._in_flight.values())
+        entries = [(t, h) for t, h in self.catalog.schedule() if h not in busy]
+        self._next = {h: t for t, h in entries}
+        heapq.heapify(entries)
+        self._heap = entries
+
+    # ---------- Proben ----------
+
+    def _probe(self, row):
+        stream = {'url': row['url'], 'info': row['info'], 'source_playlist': row['source']}
+
+        def on_spawn(process):
+            with self._proc_lock:
+                self._processes[row['hash']] = process
+
+        try:
+            return self.combiner.test_stream(stream, on_spawn)
+        finally:
+            with self._proc_lock:
+                self._processes.pop(row['hash'], None)
+
+    def _submit_due(self, pool, now):
+        """Fällige Streams starten — so viele, wie Budget und Worker erlauben"""
+        while self._heap and len(self._in_flight) < self.workers and now >= self._next_slot:
+            next_check, stream_hash = self._heap[0]
+            if next_check > now:
+                break
+            heapq.heappop(self._heap)
+            if self._next.get(stream_hash) != next_check:
+                continue  # veraltet oder inaktiv
+            del self._next[stream_hash]
+            row = self.catalog.get(stream_hash)
+            if row is None or not row['active']:
+                continue
+            self._in_flight[pool.submit(self._probe, row)] = stream_hash
+            self._next_slot = max(self._next_slot, now) + self.spacing
+
+    def _on_result(self, stream_hash, result):
+        now = time.time()
+        row = self.catalog.get(stream_hash)
+        if row is None:
+            return
+        working = result['status'] == 'working'
+        ok, fail, flap, next_check = self.policy.update(row, working, now)
+        self.catalog.record(stream_hash, result['status'], result.get('error'),
+                            ok, fail, flap, now, next_check)
+        self.probes += 1
+        if (row['status'] == 'working') != working:
+            self._dirty = True
+        if row['active']:
+            self._next[stream_hash] = next_check
+            heapq.heappush(self._heap, (next_check, stream_hash))
+        if self.results is not None:
+            self.results.result(result_record(
+                row['url'], result['status'], error=result.get('error'),
+                source=row['source'], usage=result.get('usage')
+            ))
+
+    # ---------- Veröffentlichen ----------
+
+    def publish(self):
+        """Playlist atomar ersetzen (temporäre Datei + os.replace)"""
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.output.parent, prefix=self.output.name, suffix='.tmp')
+        count = 0
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write("#EXTM3U\n")
+                f.write(f"# Generated by M3U Monitor at {datetime.now().isoformat(timespec='seconds')}\n")
+                for info, url, source in self.catalog.working():
+                    f.write(f"{info or '#EXTINF:-1,Unbekannter Kanal'}\n{url}\n")
+                    count += 1
+            os.replace(tmp, self.output)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self._dirty = False
+        return count
+
+    def print_status(self):
+        c = self.catalog.counts()
+        print(f"📡 {datetime.now():%H:%M:%S} {c['active']} Streams, ✅ {c['working']} ok, "
+              f"⏳ {c['due']} fällig, ❔ {c['unchecked']} ungeprüft, "
+              f"{self.probes} Proben, {len(self._in_flight)} laufen", flush=True)
+
+    # ---------- Hauptschleife ----------
+
+    def stop(self, *_):
+        if not self._stopping:
+            print("\n⛔ Beende Monitor…", flush=True)
+        self._stopping = True
+
+    def run(self, once=False):
+        """once=True: alle fälligen Streams einmal prüfen und beenden"""
+        self.scan(force=True)
+        now = time.monotonic()
+        next_scan = now + self.scan_interval
+        next_status = now + self.status_interval
+        last_publish = 0.0
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="probe") as pool:
+            try:
+                while not self._stopping:
+                    wall = time.time()
+                    if not once and time.monotonic() >= next_scan:
+                        self.scan()
+                        next_scan = time.monotonic() + self.scan_interval
+
+                    self._submit_due(pool, wall)
+
+                    if once and not self._in_flight and (not self._heap or self._heap[0][0] > wall):
+                        break
+
+                    # Bis zum nächsten Ereignis warten (höchstens 1 s, damit Signale greifen)
+                    timeout = 1.0
+                    if self._heap and len(self._in_flight) < self.workers:
+                        timeout = min(timeout, max(self._heap[0][0], self._next_slot) - wall)
+                    timeout = max(timeout, 0.01)
+                    if self._in_flight:
+                        done, _ = wait(self._in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            stream_hash = self._in_flight.pop(future)
+                            self._on_result(stream_hash, future.result())
+                    else:
+                        time.sleep(timeout)
+
+                    if self._dirty and time.monotonic() - last_publish >= self.publish_interval:
+                        count = self.publish()
+                        last_publish = time.monotonic()
+                        print(f"💾 {self.output} aktualisiert ({count} Streams)", flush=True)
+
+                    if time.monotonic() >= next_status:
+                        self.print_status()
+                        next_status = time.monotonic() + self.status_interval
+            finally:
+                # Laufende ffmpeg-Prozesse beenden, damit der Pool sofort frei wird
+                with self._proc_lock:
+                    for process in self._processes.values():
+                        kill_process_group(process)
+                for future in list(self._in_flight):
+                    future.cancel()
+
+        if self._dirty:
+            count = self.publish()
+            print(f"💾 {self.output} aktualisiert ({count} Streams)")
+        self.print_status()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Überwacht Streams aus M3U-Playlists dauerhaft und hält eine Playlist aktuell',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Beispiele:
+  python m3u_monitor.py ./playlists -o live.m3u
+  python m3u_monitor.py a.m3u b.m3u --rate 60 --workers 4 --max-interval 43200
+  python m3u_monitor.py ./playlists --once        # einmal alles Fällige prüfen
+        """
+    )
+    parser.add_argument('inputs', nargs='+', help='Playlists oder Verzeichnisse mit Playlists')
+    parser.add_argument('-o', '--output', default='monitored.m3u',
+                        help='Veröffentlichte Playlist (default: monitored.m3u)')
+    parser.add_argument('--db', default='monitor.db', help='Katalog-Datenbank (default: monitor.db)')
+    parser.add_argument('-t', '--timeout', type=int, default=8, help='Timeout pro Stream (default: 8)')
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help='Gleichzeitige Proben (default: 8)')
+    parser.add_argument('--rate', type=float, default=120,
+                        help='Proben pro Minute, gleichmäßig verteilt (default: 120)')
+    parser.add_argument('--min-interval', type=int, default=300,
+                        help='Kürzestes Prüfintervall in s, für wechselhafte Streams (default: 300)')
+    parser.add_argument('--max-interval', type=int, default=86400,
+                        help='Längstes Prüfintervall in s (default: 86400)')
+    parser.add_argument('--fail-interval', type=int, default=300,
+                        help='Erstes Intervall nach einem Ausfall, verdoppelt sich (default: 300)')
+    parser.add_argument('--scan-interval', type=int, default=60,
+                        help='Eingaben alle N s auf Änderungen prüfen (default: 60)')
+    parser.add_argument('--publish-interval', type=int, default=10,
+                        help='Playlist höchstens alle N s neu schreiben (default: 10)')
+    parser.add_argument('--results', metavar='DATEI',
+                        help='Jede Probe als JSON-Zeile anhängen')
+    parser.add_argument('--cpu-budget', type=float, metavar='SEK',
+                        help='Probe abbrechen, wenn ffmpeg mehr CPU-Sekunden verbraucht')
+    parser.add_argument('--rss-budget', type=int, metavar='MB',
+                        help='Probe abbrechen, wenn ffmpeg mehr Speicher (RSS) belegt')
+    parser.add_argument('--once', action='store_true',
+                        help='Alle fälligen Streams einmal prüfen und beenden')
+    args = parser.parse_args()
+
+    if find_tool('ffmpeg', 'FFMPEG') is None:
+        print("❌ Fehler: FFmpeg ist nicht installiert oder nicht im PATH!")
+        sys.exit(1)
+
+    catalog = StreamCatalog(args.db)
+    results = ResultWriter(args.results, append=True) if args.results else None
+    monitor = StreamMonitor(
+        args.inputs, catalog, args.output,
+        M3UCombiner(timeout=args.timeout, budget=Budget(args.cpu_budget, args.rss_budget),
+                    collect_usage=False),
+        RecheckPolicy(args.min_interval, args.max_interval, args.fail_interval),
+        rate=args.rate,
+        workers=args.workers,
+        scan_interval=args.scan_interval,
+        publish_interval=args.publish_interval,
+        results=results
+    )
+    signal.signal(signal.SIGINT, monitor.stop)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, monitor.stop)
+
+    print("🚀 M3U Monitor")
+    print("="*50)
+    try:
+        monitor.run(once=args.once)
+    finally:
+        if results is not None:
+            results.close()
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Leichtgewichtige Laufzeit-Metriken: Latenz-Histogramme im HDR-Stil und
+Phasen-Timer.
+
+Histogram speichert Werte in log-linearen Buckets (Zweierpotenz plus
+SUB_BUCKETS lineare Unterteilungen), d.h. feste relative Genauigkeit
+(~3% bei 32 Unterteilungen) über viele Größenordnungen bei wenigen
+hundert Zählern. Perzentile werden aus den Buckets berechnet, einzelne
+Messwerte werden nicht gespeichert.
+
+PhaseMetrics sammelt pro (Phase, Ergebnis) ein Histogramm und pro
+(Phase, Host) Zähler — für "wohin geht die Zeit?"-Auswertungen.
+
+PrometheusText baut das Textformat für einen /metrics-Endpoint ohne
+zusätzliche Abhängigkeit.
+"""
+import time
+import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+SUB_BUCKETS = 32        # lineare Unterteilungen pro Zweierpotenz
+SUB_BITS = SUB_BUCKETS.bit_length() - 1
+UNIT = 1_000_000        # Sekunden -> Mikrosekunden (interne Ganzzahlen)
+
+
+def _bucket_index(value: int) -> int:
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def _bucket_lower(index: int) -> int:
+    """Kleinster Wert (in µs), der in diesen Bucket fällt"""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    return mantissa << shift
+
+
+def _bucket_upper(index: int) -> int:
+    """Größter Wert (in µs), der in diesen Bucket fällt"""
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+
+class Histogram:
+    """Latenz-Histogramm in Sekunden (intern µs)"""
+
+    def __init__(self):
+        self.counts = defaultdict(int)  # Bucket-Index -> Anzahl
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds: float):
+        value = max(0, int(seconds * UNIT))
+        self.counts[_bucket_index(value)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: 'Histogram'):
+        for index, n in other.counts.items():
+            self.counts[index] += n
+        self.count += other.count
+        self.total += other.total
+        for attr, pick in (('min', min), ('max', max)):
+            theirs = getattr(other, attr)
+            if theirs is not None:
+                mine = getattr(self, attr)
+                setattr(self, attr, theirs if mine is None else pick(mine, theirs))
+
+    def percentile(self, p: float):
+        """Wert (s), unter dem p% der Messungen liegen (Obergrenze des Buckets)"""
+        if not self.count:
+            return None
+        target = max(1, -(-self.count * p // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(_bucket_upper(index) / UNIT, self.max)
+        return self.max
+
+    def count_le(self, seconds: float) -> int:
+        """
+        Anzahl Messungen <= seconds — für kumulative Buckets. Der Bucket, in
+        den seconds selbst fällt, zählt ganz mit: Werte bis seconds fehlen
+        nie, es können höchstens Werte bis eine Bucket-Breite (~3%) darüber
+        mitgezählt werden.
+        """
+        limit = int(seconds * UNIT)
+        return sum(n for index, n in self.counts.items() if _bucket_lower(index) <= limit)
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'total_s': round(self.total, 3),
+            'mean_ms': round(self.total / self.count * 1000, 1) if self.count else None,
+            'p50_ms': _ms(self.percentile(50)),
+            'p90_ms': _ms(self.percentile(90)),
+            'p99_ms': _ms(self.percentile(99)),
+            'max_ms': _ms(self.max),
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class Span:
+    """Offene Messung; outcome kann während der Phase gesetzt werden"""
+    __slots__ = ('outcome',)
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+
+class PhaseMetrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = defaultdict(Histogram)       # (phase, outcome) -> Histogram
+        self.hosts = defaultdict(lambda: [0, 0.0])  # (phase, host) -> [anzahl, sekunden]
+        self.started_at = time.perf_counter()
+        self._local = threading.local()             # offener trace() pro Thread
+
+    @contextmanager
+    def time(self, phase: str, host: str = None, outcome: str = 'ok'):
+        """
+        with metrics.time('ocr', host) as span:
+            ...
+            span.outcome = 'paywall'
+        Ausnahmen werden als outcome 'error' gezählt und weitergereicht.
+        """
+        span = Span(outcome)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            span.outcome = 'error'
+            raise
+        finally:
+            self.observe(phase, time.perf_counter() - start, span.outcome, host)
+
+    @contextmanager
+    def trace(self):
+        """
+        Phasen eines einzelnen Streams im aktuellen Thread mitschreiben:
+            with metrics.trace() as t:
+                ...
+            t['timings'] -> {phase: sekunden}, t['outcomes'] -> {phase: ergebnis}
+        """
+        trace = {'timings': {}, 'outcomes': {}}
+        self._local.trace = trace
+        try:
+            yield trace
+        finally:
+            self._local.trace = None
+
+    def current_trace(self):
+        return getattr(self._local, 'trace', None)
+
+    def observe(self, phase: str, seconds: float, outcome: str = 'ok', host: str = None):
+        trace = self.current_trace()
+        if trace is not None:
+            trace['timings'][phase] = round(trace['timings'].get(phase, 0) + seconds, 3)
+            trace['outcomes'][phase] = outcome
+        with self._lock:
+            self.phases[(phase, outcome)].record(seconds)
+            if host:
+                entry = self.hosts[(phase, host)]
+                entry[0] += 1
+                entry[1] += seconds
+
+    def phase_totals(self) -> dict:
+        """phase -> Histogram über alle Ergebnisse"""
+        totals = defaultdict(Histogram)
+        with self._lock:
+            for (phase, _), hist in self.phases.items():
+                totals[phase].merge(hist)
+        return totals
+
+    def top_hosts(self, phase: str, limit: int = 10):
+        """[(host, anzahl, sekunden)] mit der meisten Zeit in dieser Phase"""
+        with self._lock:
+            rows = [(host, n, s) for (p, host), (n, s) in self.hosts.items() if p == phase]
+        rows.sort(key=lambda r: -r[2])
+        return rows[:limit]
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            by_outcome = {
+                f"{phase}/{outcome}": hist.summary()
+                for (phase, outcome), hist in sorted(self.phases.items())
+            }
+            hosts = defaultdict(dict)
+            for (phase, host), (n, s) in self.hosts.items():
+                hosts[phase][host] = {'count': n, 'total_s': round(s, 3)}
+        return {
+            'wall_s': round(time.perf_counter() - self.started_at, 3),
+            'phases': {phase: hist.summary() for phase, hist in sorted(self.phase_totals().items())},
+            'by_outcome': by_outcome,
+            'hosts': hosts,
+        }
+
+    def dump_json(self, path, extra: dict = None):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({**self.to_dict(), **(extra or {})}, f, indent=2, ensure_ascii=False)
+
+    def print_summary(self, top_hosts_phase: str = None, limit: int = 5):
+        wall = time.perf_counter() - self.started_at
+        totals = self.phase_totals()
+        if not totals:
+            return
+        print(f"\n⏱️ Zeit pro Phase:")
+        print(f"   {'Phase':<12} {'n':>6} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9} {'Summe':>9}")
+        for phase, hist in sorted(totals.items(), key=lambda x: -x[1].total):
+            s = hist.summary()
+            print(f"   {phase:<12} {s['count']:>6} {_fmt(s['p50_ms'])} {_fmt(s['p90_ms'])} "
+                  f"{_fmt(s['p99_ms'])} {_fmt(s['max_ms'])} {hist.total:>8.1f}s")
+        print(f"   (Wandzeit {wall:.1f}s; Phasen laufen parallel und verschachtelt)")
+
+        with self._lock:
+            outcomes = sorted(self.phases.items())
+        print(f"\n   Nach Ergebnis:")
+        for (phase, outcome), hist in outcomes:
+            s = hist.summary()
+            print(f"   {phase + '/' + outcome:<28} {s['count']:>6} p50 {_fmt(s['p50_ms'])} p99 {_fmt(s['p99_ms'])}")
+
+        if top_hosts_phase:
+            rows = self.top_hosts(top_hosts_phase, limit)
+            if rows:
+                print(f"\n   Langsamste Hosts ({top_hosts_phase}):")
+                for host, n, seconds in rows:
+                    print(f"   {host:<40} {n:>5}× {seconds:>8.1f}s")
+
+
+def _fmt(ms):
+    return f"{'-':>9}" if ms is None else f"{ms:>7.0f}ms"
+
+
+# ---------- Prometheus-Textformat ----------
+
+DEFAULT_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class PrometheusText:
+    """
+    Sammelt Metriken im Prometheus-Textformat (0.0.4):
+        out = PrometheusText()
+        out.gauge('queue_depth', 'Wartende Streams', 12)
+        out.histogram('probe_seconds', 'Dauer', hist)
+        text = out.render()
+    Gleichnamige Metriken mit verschiedenen Labels werden gruppiert.
+    """
+
+    def __init__(self, prefix: str = ''):
+        self.prefix = prefix
+        self._families = {}  # name -> (typ, hilfe, [zeilen])
+
+    def _family(self, name, kind, help_text):
+        name = self.prefix + name
+        if name not in self._families:
+            self._families[name] = (kind, help_text, [])
+        return name, self._families[name][2]
+
+    def gauge(self, name: str, help_text: str, value, labels: dict = None):
+        name, lines = self._family(name, 'gauge', help_text)
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def counter(self, name: str, help_text: str, value, labels: dict = None):
+        name, lines = self._family(name, 'counter', help_text)
+        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def histogram(self, name: str, help_text: str, hist: Histogram, labels: dict = None,
+                  bounds=DEFAULT_BOUNDS):
+        name, lines = self._family(name, 'histogram', help_text)
+        labels = labels or {}
+        for bound in bounds:
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {hist.count_le(bound)}")
+        lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {hist.count}")
+        lines.append(f"{name}_sum{_labels(labels)} {_number(hist.total)}")
+        lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+    def render(self) -> str:
+        out = []
+        for name, (kind, help_text, lines) in self._families.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+def _number(value) -> str:
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
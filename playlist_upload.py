@@ -0,0 +1,83 @@
+"""
+Загруженные в бот плейлисты: распаковка и разбиение на шарды.
+
+Поддерживаются обычные .m3u/.m3u8/.txt и сжатые .gz, .zip, .xz.
+Распаковка идёт потоком кусками в файл на диске — архив целиком в
+память не читается, а размер распакованных данных ограничен (защита от
+zip-бомб).
+"""
+import gzip
+import lzma
+import shutil
+import zipfile
+from pathlib import Path
+
+PLAYLIST_EXTENSIONS = ('.m3u', '.m3u8', '.txt', '.text')
+COMPRESSED_EXTENSIONS = ('.gz', '.zip', '.xz')
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(ValueError):
+    """Файл нельзя обработать: формат, пустой архив или слишком большой размер"""
+
+
+def is_supported(name: str) -> bool:
+    name = name.lower()
+    return name.endswith(PLAYLIST_EXTENSIONS + COMPRESSED_EXTENSIONS)
+
+
+def _copy_limited(src, dst, max_bytes: int):
+    written = 0
+    while True:
+        chunk = src.read(CHUNK_SIZE)
+        if not chunk:
+            return written
+        written += len(chunk)
+        if written > max_bytes:
+            raise UploadError(f"Распакованный плейлист больше {max_bytes // (1024 * 1024)} МБ")
+        dst.write(chunk)
+
+
+def _zip_member(zf: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """Самый большой плейлист в архиве"""
+    members = [
+        info for info in zf.infolist()
+        if not info.is_dir() and info.filename.lower().endswith(PLAYLIST_EXTENSIONS)
+    ]
+    if not members:
+        raise UploadError("В архиве нет файлов .m3u/.m3u8/.txt")
+    return max(members, key=lambda info: info.file_size)
+
+
+def unpack_upload(src: Path, name: str, dest: Path, max_bytes: int) -> Path:
+    """
+    Записать плейлист из загруженного файла src (исходное имя name) в dest.
+    Сжатые форматы распаковываются потоком, не больше max_bytes.
+    """
+    name = name.lower()
+    try:
+        if name.endswith('.gz'):
+            opener = gzip.open(src, 'rb')
+        elif name.endswith('.xz'):
+            opener = lzma.open(src, 'rb')
+        elif name.endswith('.zip'):
+            with zipfile.ZipFile(src) as zf:
+                with zf.open(_zip_member(zf)) as member, open(dest, 'wb') as out:
+                    _copy_limited(member, out, max_bytes)
+            return dest
+        else:
+            if src.stat().st_size > max_bytes:
+                raise UploadError(f"Плейлист больше {max_bytes // (1024 * 1024)} МБ")
+            shutil.copyfile(src, dest)
+            return dest
+
+        with opener as packed, open(dest, 'wb') as out:
+            _copy_limited(packed, out, max_bytes)
+        return dest
+    except (OSError, EOFError, lzma.LZMAError, zipfile.BadZipFile) as e:
+        raise UploadError(f"Не удалось распаковать {name}: {e}") from e
+
+
+def shard(items, size: int):
+    """Разбить список на куски по size элементов"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
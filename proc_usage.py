@@ -0,0 +1,278 @@
+"""
+Ressourcenverbrauch einzelner ffmpeg-Aufrufe messen.
+
+run_measured() startet den Prozess in einer eigenen Prozessgruppe und
+wartet mit os.wait4() auf ihn — so liefert der Kernel die rusage genau
+dieses Kindes (CPU user/sys, max. RSS). Während der Laufzeit wird
+/proc/<pid> abgetastet (CPU, RSS, gelesene Bytes), damit ein optionales
+Budget (CPU-Sekunden / RSS in MB) ausufernde Proben abbrechen kann.
+
+Ohne os.wait4 (Windows) wird nur die Wandzeit gemessen.
+
+UsageStats sammelt die Werte pro Host und behält die teuersten Streams
+(begrenzte Bestenliste) für die "teuerste Streams/Hosts"-Auswertung.
+"""
+import os
+import sys
+import time
+import heapq
+import signal
+import threading
+import subprocess
+from collections import defaultdict
+
+from host_stats import host_of
+
+SAMPLE_INTERVAL = 0.25  # Abstand zwischen /proc-Stichproben
+EXIT_POLL_INTERVAL = 0.05  # max. Abstand zwischen wait4-Abfragen (wie Popen.wait)
+HAS_WAIT4 = hasattr(os, 'wait4')
+HAS_PROC = os.path.isdir('/proc/self')
+CLK_TCK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+# ru_maxrss ist unter Linux in KB, unter macOS in Bytes
+MAXRSS_KB = 1 / 1024 if sys.platform == 'darwin' else 1
+
+
+def kill_process_group(process):
+    """ffmpeg samt Kindprozessen beenden (Prozessgruppe unter POSIX)"""
+    try:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass  # bereits beendet
+
+
+class Budget:
+    """Grenzen pro Probe; None = keine Grenze"""
+
+    def __init__(self, cpu_seconds=None, rss_mb=None):
+        self.cpu_seconds = cpu_seconds
+        self.rss_kb = rss_mb * 1024 if rss_mb else None
+
+    def __bool__(self):
+        return bool(self.cpu_seconds or self.rss_kb)
+
+    def exceeded(self, cpu_s, rss_kb):
+        """Grund als Text oder None"""
+        if self.cpu_seconds and cpu_s is not None and cpu_s > self.cpu_seconds:
+            return f"CPU-Budget überschritten ({cpu_s:.1f}s > {self.cpu_seconds}s)"
+        if self.rss_kb and rss_kb is not None and rss_kb > self.rss_kb:
+            return f"Speicher-Budget überschritten ({rss_kb // 1024} MB > {self.rss_kb // 1024} MB)"
+        return None
+
+
+class Measured:
+    """Ergebnis von run_measured()"""
+    __slots__ = ('returncode', 'stdout', 'stderr', 'usage', 'timed_out', 'over_budget')
+
+    def __init__(self, returncode, stdout, stderr, usage, timed_out=False, over_budget=None):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.usage = usage
+        self.timed_out = timed_out
+        self.over_budget = over_budget  # Grund als Text, wenn per Budget beendet
+
+
+def _sample(pid):
+    """(cpu_s, rss_kb, read_bytes) aus /proc; fehlende Werte als None"""
+    cpu = rss = read = None
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            # Feld 2 (comm) kann Leerzeichen enthalten -> nach der letzten ')' teilen
+            fields = f.read().rsplit(b')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / CLK_TCK
+        with open(f'/proc/{pid}/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmRSS:'):
+                    rss = int(line.split()[1])
+                    break
+        with open(f'/proc/{pid}/io', 'rb') as f:
+            for line in f:
+                if line.startswith(b'rchar:'):
+                    read = int(line.split()[1])
+                    break
+    except (OSError, IndexError, ValueError):
+        pass  # Prozess schon beendet oder /proc/<pid>/io nicht lesbar
+    return cpu, rss, read
+
+
+def _drain(pipe, chunks):
+    chunks.append(pipe.read())
+    pipe.close()
+
+
+def run_measured(cmd, timeout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                 budget: Budget = None, on_spawn=None) -> Measured:
+    """
+    Wie subprocess.run(cmd, timeout=...), aber mit Messung. Bei Timeout
+    wird die Prozessgruppe beendet und timed_out gesetzt (keine Ausnahme).
+    on_spawn(process) wird direkt nach dem Start aufgerufen.
+    """
+    started = time.monotonic()
+    process = subprocess.Popen(
+        cmd, stdout=stdout, stderr=stderr,
+        start_new_session=(os.name == 'posix')
+    )
+    if on_spawn:
+        on_spawn(process)
+
+    if not HAS_WAIT4:
+        timed_out = False
+        try:
+            out, err = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_group(process)
+            out, err = process.communicate()
+            timed_out = True
+        usage = {'wall_s': round(time.monotonic() - started, 3)}
+        return Measured(process.returncode, out, err, usage, timed_out)
+
+    # Pipes in Threads leeren, sonst blockiert ffmpeg bei vollem Puffer
+    outputs = {}
+    readers = []
+    for name in ('stdout', 'stderr'):
+        pipe = getattr(process, name)
+        if pipe is not None:
+            outputs[name] = []
+            reader = threading.Thread(target=_drain, args=(pipe, outputs[name]), daemon=True)
+            reader.start()
+            readers.append(reader)
+
+    timed_out = False
+    over_budget = None
+    read_bytes = None
+    peak_rss = 0
+    interval = 0.01
+    deadline = started + timeout
+    next_sample = started
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        now = time.monotonic()
+        # Ende schnell bemerken, /proc aber nur alle SAMPLE_INTERVAL lesen
+        if HAS_PROC and now >= next_sample:
+            next_sample = now + SAMPLE_INTERVAL
+            cpu, rss, read = _sample(process.pid)
+            read_bytes = read if read is not None else read_bytes
+            peak_rss = max(peak_rss, rss or 0)
+            if budget and not over_budget:
+                over_budget = budget.exceeded(cpu, rss)
+                if over_budget:
+                    kill_process_group(process)
+        if not over_budget and not timed_out and now >= deadline:
+            timed_out = True
+            kill_process_group(process)
+        if over_budget or timed_out:
+            pid, status, rusage = os.wait4(process.pid, 0)
+            break
+        time.sleep(interval)
+        interval = min(interval * 2, EXIT_POLL_INTERVAL)
+
+    # Popen soll den bereits abgeholten Prozess nicht noch einmal abwarten
+    process.returncode = os.waitstatus_to_exitcode(status)
+    for reader in readers:
+        reader.join()
+    out = b''.join(outputs['stdout']) if 'stdout' in outputs else None
+    err = b''.join(outputs['stderr']) if 'stderr' in outputs else None
+
+    usage = {
+        'wall_s': round(time.monotonic() - started, 3),
+        'cpu_user_s': round(rusage.ru_utime, 3),
+        'cpu_sys_s': round(rusage.ru_stime, 3),
+        'max_rss_kb': int(max(rusage.ru_maxrss * MAXRSS_KB, peak_rss)),
+        'read_bytes': read_bytes,
+    }
+    return Measured(process.returncode, out, err, usage, timed_out, over_budget)
+
+
+def add_usage(total: dict, usage: dict) -> dict:
+    """usage eines weiteren Aufrufs zur Summe einer Probe addieren (RSS: Maximum)"""
+    if not usage:
+        return total
+    for key, value in usage.items():
+        if value is None:
+            continue
+        if key == 'max_rss_kb':
+            total[key] = max(total.get(key) or 0, value)
+        else:
+            total[key] = round((total.get(key) or 0) + value, 3)
+    return total
+
+
+def cpu_seconds(usage: dict) -> float:
+    return (usage.get('cpu_user_s') or 0) + (usage.get('cpu_sys_s') or 0)
+
+
+class UsageStats:
+    """
+    Verbrauch pro Host und die keep teuersten Streams, thread-sicher.
+    add() einmal pro Stream mit dem summierten Verbrauch aller Aufrufe.
+    """
+
+    def __init__(self, keep: int = 50):
+        self._lock = threading.Lock()
+        self.keep = keep
+        self._top = []                    # Min-Heap (cpu, rss, nr, url, usage)
+        self._seq = 0
+        self.hosts = defaultdict(dict)    # host -> usage (summiert)
+        self.host_probes = defaultdict(int)
+        self.over_budget = 0
+
+    def add(self, url: str, usage: dict, over_budget=None):
+        if not usage:
+            return
+        host = host_of(url)
+        entry = (cpu_seconds(usage), usage.get('max_rss_kb') or 0, self._seq, url, usage)
+        with self._lock:
+            self._seq += 1
+            if len(self._top) < self.keep:
+                heapq.heappush(self._top, entry)
+            elif entry[:2] > self._top[0][:2]:
+                heapq.heapreplace(self._top, entry)
+            add_usage(self.hosts[host], usage)
+            self.host_probes[host] += 1
+            if over_budget:
+                self.over_budget += 1
+
+    def top_streams(self, limit: int = 10):
+        """[(url, usage)] mit der meisten CPU-Zeit (höchstens keep)"""
+        with self._lock:
+            rows = heapq.nlargest(limit, self._top, key=lambda e: e[:2])
+        return [(url, usage) for _, _, _, url, usage in rows]
+
+    def top_hosts(self, limit: int = 10):
+        """[(host, aufrufe, usage)] mit der meisten CPU-Zeit"""
+        with self._lock:
+            rows = [(host, self.host_probes[host], usage) for host, usage in self.hosts.items()]
+        rows.sort(key=lambda r: -cpu_seconds(r[2]))
+        return rows[:limit]
+
+    def to_dict(self, limit: int = 20) -> dict:
+        return {
+            'over_budget': self.over_budget,
+            'top_streams': [{'url': url, **usage} for url, usage in self.top_streams(limit)],
+            'top_hosts': [
+                {'host': host, 'probes': n, **usage} for host, n, usage in self.top_hosts(limit)
+            ],
+        }
+
+    def print_summary(self, limit: int = 5):
+        streams = self.top_streams(limit)
+        if not streams or not any(cpu_seconds(u) for _, u in streams):
+            return
+        print(f"\n🔥 Teuerste Streams (CPU user+sys, max. RSS):")
+        for url, usage in streams:
+            short = url if len(url) <= 60 else url[:30] + '...' + url[-27:]
+            print(f"   {cpu_seconds(usage):>7.2f}s {_mb(usage.get('max_rss_kb')):>8}  {short}")
+        print(f"\n   Teuerste Hosts:")
+        for host, n, usage in self.top_hosts(limit):
+            print(f"   {cpu_seconds(usage):>7.2f}s {_mb(usage.get('max_rss_kb')):>8}  {host} ({n} Aufrufe)")
+        if self.over_budget:
+            print(f"   ⛔ Wegen Budget abgebrochen: {self.over_budget}")
+
+
+def _mb(kb):
+    return '-' if kb is None else f"{kb / 1024:.0f} MB"
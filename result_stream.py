@@ -0,0 +1,116 @@
+"""
+Ergebnisse als JSON-Zeilen (JSONL) — eine kompakte Zeile pro getestetem
+Stream, sobald das Ergebnis vorliegt, und zum Schluss eine
+Zusammenfassung:
+
+    {"type":"result","ts":"...","hash":"...","host":"...","status":"failed","error_class":"http_403",...}
+    {"type":"summary","ts":"...","tested":1000,"working":412,...}
+
+Die Datei wird nie komplett im Speicher gehalten und lässt sich während
+des Laufs mit tail/grep/jq auswerten.
+"""
+import json
+import hashlib
+import threading
+from datetime import datetime
+from urllib.parse import urlparse
+
+from host_stats import host_of
+
+# (Klasse, Teilstrings in der ffmpeg-Fehlermeldung) — erste Übereinstimmung zählt
+ERROR_PATTERNS = (
+    ('http_403', ('403 forbidden', 'server returned 403')),
+    ('http_404', ('404 not found', 'server returned 404')),
+    ('http_4xx', ('server returned 4',)),
+    ('http_5xx', ('server returned 5',)),
+    ('dns', ('failed to resolve', 'name or service not known', 'nodename nor servname',
+             'temporary failure in name resolution')),
+    ('refused', ('connection refused',)),
+    ('timeout', ('timed out', 'timeout')),
+    ('reset', ('connection reset', 'broken pipe', 'end of file')),
+    ('tls', ('tls', 'ssl', 'certificate')),
+    ('invalid_data', ('invalid data', 'could not find codec', 'unknown format')),
+)
+
+# Status, die schon selbst die Fehlerklasse sind
+STATUS_CLASSES = ('timeout', 'over_budget', 'paywall', 'fake', 'skipped', 'cancelled')
+
+
+def stream_hash(url):
+    """md5 über scheme://host/pfad (Query ignoriert) — wie M3UCombiner.get_stream_hash"""
+    parsed = urlparse(url)
+    clean_url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+    return hashlib.md5(clean_url.encode('utf-8')).hexdigest()
+
+
+def error_class(status, error=None):
+    """Grobe Fehlerklasse für Auswertungen; None bei funktionierenden Streams"""
+    if status == 'working':
+        return None
+    if status in STATUS_CLASSES:
+        return status
+    text = (error or '').lower()
+    for cls, needles in ERROR_PATTERNS:
+        if any(n in text for n in needles):
+            return cls
+    return 'other' if text else status
+
+
+def result_record(url, status, error=None, source=None, timings=None, usage=None, cls=None):
+    """Eine Ergebniszeile; timings: phase -> Sekunden, usage: aus proc_usage"""
+    record = {
+        'hash': stream_hash(url),
+        'host': host_of(url),
+        'url': url,
+        'status': status,
+        'error_class': cls or error_class(status, error),
+    }
+    if source:
+        record['source'] = source
+    if error:
+        record['error'] = error.strip()[:200]
+    if timings:
+        record['timings'] = timings
+    if usage:
+        record['wall_s'] = usage.get('wall_s')
+        if usage.get('cpu_user_s') is not None:
+            record['cpu_s'] = round(usage['cpu_user_s'] + (usage.get('cpu_sys_s') or 0), 3)
+            record['max_rss_kb'] = usage.get('max_rss_kb')
+    return record
+
+
+class ResultWriter:
+    """Thread-sicherer JSONL-Schreiber; jede Zeile wird sofort geschrieben"""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self._lock = threading.Lock()
+        # zeilengepuffert; append=True für Dauerläufe (m3u_monitor.py)
+        self._f = open(path, 'a' if append else 'w', encoding='utf-8', buffering=1)
+        self.count = 0
+
+    def _write(self, record):
+        line = json.dumps(
+            {**record, 'ts': datetime.now().isoformat(timespec='seconds')},
+            separators=(',', ':'), ensure_ascii=False
+        )
+        with self._lock:
+            self._f.write(line + '\n')
+            self.count += 1
+
+    def result(self, record: dict):
+        self._write({'type': 'result', **record})
+
+    def summary(self, record: dict):
+        self._write({'type': 'summary', **record})
+
+    def close(self):
+        with self._lock:
+            if not self._f.closed:
+                self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,253 @@
+"""
+Шлюз к Google Sheets для дивидендов.
+
+Клиент авторизуется один раз и кэшируется, номер последней строки
+хранится локально. Все записи по одной позиции (значения, цвет, формула
+суммы) уходят одним batch_update, а несколько позиций, пришедших почти
+одновременно, объединяются в один запрос. Удаление строк — тоже один
+batch_update с deleteDimension по непрерывным диапазонам.
+
+Клиент подставляется через client_factory, поэтому шлюз можно проверять
+на локальной заглушке с методами open_by_key/sheet1/batch_update
+(см. test_sheets_gateway.py). gspread нужен только настоящему клиенту.
+"""
+import os
+import json
+import time
+import base64
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+SPREADSHEET_KEY = "1r2P4pF1TcICCuUAZNZm5lEpykVVZe94QZQ6-z6CrNg8"
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+# Первая строка — заголовки, вторая — формула суммы в D2, данные с третьей
+FIRST_DATA_ROW = 3
+
+COLORS = [
+    {"red": 1.0, "green": 0.9, "blue": 0.9},
+    {"red": 0.9, "green": 1.0, "blue": 0.9},
+    {"red": 0.9, "green": 0.9, "blue": 1.0},
+    {"red": 1.0, "green": 1.0, "blue": 0.9},
+    {"red": 0.9, "green": 1.0, "blue": 1.0},
+]
+
+def get_color_for_wkn(wkn: str):
+    return COLORS[hash(wkn) % len(COLORS)]
+
+def authorize_from_env():
+    """gspread-клиент из GOOGLE_CREDENTIALS_BASE64"""
+    import gspread
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    b64 = os.getenv("GOOGLE_CREDENTIALS_BASE64")
+    if not b64:
+        raise ValueError("GOOGLE_CREDENTIALS_BASE64 не задан")
+    creds_dict = json.loads(base64.b64decode(b64).decode('utf-8'))
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
+    return gspread.authorize(creds)
+
+def last_data_row(rows) -> int:
+    """Номер последней непустой строки данных (2, если данных нет)"""
+    last = FIRST_DATA_ROW - 1
+    for i, r in enumerate(rows[FIRST_DATA_ROW - 1:], start=FIRST_DATA_ROW):
+        if r and any(cell.strip() for cell in r[:4]):
+            last = i
+    return last
+
+def _ensure_off_loop():
+    """Вызовы шлюза блокируют поток (окно coalesce_window, сеть) — не в event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    raise RuntimeError("SheetsGateway блокирует поток — вызывайте через пул потоков (pools.api)")
+
+def _cell(value):
+    if isinstance(value, (int, float)):
+        return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
+
+def sum_formula_request(sheet_id: int, last_row: int) -> dict:
+    """updateCells для формулы суммы в D2"""
+    formula = f"=SUM(D{FIRST_DATA_ROW}:D{max(last_row, FIRST_DATA_ROW)})"
+    return {
+        "updateCells": {
+            "range": {
+                "sheetId": sheet_id,
+                "startRowIndex": 1, "endRowIndex": 2,
+                "startColumnIndex": 3, "endColumnIndex": 4,
+            },
+            "rows": [{"values": [{"userEnteredValue": {"formulaValue": formula}}]}],
+            "fields": "userEnteredValue",
+        }
+    }
+
+def append_rows_request(sheet_id: int, start_row: int, entries) -> dict:
+    """updateCells: значения и цвет фона для entries = [(date, wkn, name, amount), ...]"""
+    rows = []
+    for date, wkn, name, amount in entries:
+        color = get_color_for_wkn(wkn)
+        rows.append({"values": [
+            {**_cell(v), "userEnteredFormat": {"backgroundColor": color}}
+            for v in (date, wkn, name, amount)
+        ]})
+    return {
+        "updateCells": {
+            "range": {
+                "sheetId": sheet_id,
+                "startRowIndex": start_row - 1, "endRowIndex": start_row - 1 + len(rows),
+                "startColumnIndex": 0, "endColumnIndex": 4,
+            },
+            "rows": rows,
+            "fields": "userEnteredValue,userEnteredFormat.backgroundColor",
+        }
+    }
+
+def contiguous_ranges(row_numbers):
+    """[3, 4, 5, 9, 10] -> [(3, 5), (9, 10)] (номера строк с 1, включительно)"""
+    ranges = []
+    for n in sorted(set(row_numbers)):
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], n)
+        else:
+            ranges.append((n, n))
+    return ranges
+
+def delete_rows_requests(sheet_id: int, ranges) -> list:
+    """deleteDimension снизу вверх, чтобы индексы верхних диапазонов не сдвигались"""
+    return [
+        {
+            "deleteDimension": {
+                "range": {
+                    "sheetId": sheet_id,
+                    "dimension": "ROWS",
+                    "startIndex": start - 1,
+                    "endIndex": end,
+                }
+            }
+        }
+        for start, end in sorted(ranges, reverse=True)
+    ]
+
+
+class SheetsGateway:
+
+    def __init__(self, client_factory=authorize_from_env, spreadsheet_key=SPREADSHEET_KEY,
+                 coalesce_window=0.5):
+        self._client_factory = client_factory
+        self._spreadsheet_key = spreadsheet_key
+        self.coalesce_window = coalesce_window
+        self._spreadsheet = None
+        self._last_row = {}  # sheet_id -> последняя строка данных
+        self._lock = threading.Lock()        # очередь и кэш клиента
+        self._write_lock = threading.Lock()  # записи строго по очереди (номера строк)
+        self._pending = []
+
+    # ---------- Клиент ----------
+
+    def spreadsheet(self):
+        """Авторизованная таблица (авторизация один раз на процесс)"""
+        with self._lock:
+            if self._spreadsheet is None:
+                self._spreadsheet = self._client_factory().open_by_key(self._spreadsheet_key)
+            return self._spreadsheet
+
+    def invalidate(self, sheet_id=None):
+        """Сбросить кэш последней строки (и клиента, если sheet_id не указан)"""
+        with self._lock:
+            if sheet_id is None:
+                self._spreadsheet = None
+                self._last_row.clear()
+            else:
+                self._last_row.pop(sheet_id, None)
+
+    def _known_last_row(self, worksheet) -> int:
+        last = self._last_row.get(worksheet.id)
+        if last is None:
+            # Один раз читаем лист, дальше считаем сами
+            last = last_data_row(worksheet.get_all_values())
+            self._last_row[worksheet.id] = last
+        return last
+
+    # ---------- Добавление ----------
+
+    def add_entry(self, date: str, wkn: str, name: str, amount: float) -> bool:
+        """
+        Добавить строку в первый лист. Блокирует до отправки; записи,
+        пришедшие в течение coalesce_window, уходят одним запросом.
+        """
+        _ensure_off_loop()
+        future = Future()
+        with self._lock:
+            self._pending.append(((date, wkn, name, amount), future))
+            leader = len(self._pending) == 1
+        if leader:
+            time.sleep(self.coalesce_window)
+            self._flush()
+        try:
+            return future.result()
+        except Exception as e:
+            logger.error(f"Ошибка добавления в Google Sheets: {e}")
+            return False
+
+    def _flush(self):
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                spreadsheet = self.spreadsheet()
+                worksheet = spreadsheet.sheet1
+                start_row = self._known_last_row(worksheet) + 1
+                entries = [entry for entry, _ in batch]
+                new_last = start_row + len(entries) - 1
+                spreadsheet.batch_update({"requests": [
+                    append_rows_request(worksheet.id, start_row, entries),
+                    sum_formula_request(worksheet.id, new_last),
+                ]})
+                self._last_row[worksheet.id] = new_last
+            except Exception as e:
+                # Состояние листа неизвестно — перечитаем при следующей записи
+                self.invalidate()
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            for _, future in batch:
+                future.set_result(True)
+
+    # ---------- Удаление ----------
+
+    def delete_by_date(self, date: str) -> int:
+        """Удалить все строки данных с этой датой и обновить формулу — одним запросом"""
+        _ensure_off_loop()
+        with self._write_lock:
+            try:
+                spreadsheet = self.spreadsheet()
+                worksheet = spreadsheet.sheet1
+                rows = worksheet.get_all_values()
+                matches = [
+                    i for i, r in enumerate(rows[FIRST_DATA_ROW - 1:], start=FIRST_DATA_ROW)
+                    if r and r[0] == date
+                ]
+                if not matches:
+                    self._last_row[worksheet.id] = last_data_row(rows)
+                    return 0
+
+                matched = set(matches)
+                remaining = [r for i, r in enumerate(rows, start=1) if i not in matched]
+                new_last = last_data_row(remaining)
+                spreadsheet.batch_update({"requests": [
+                    *delete_rows_requests(worksheet.id, contiguous_ranges(matches)),
+                    sum_formula_request(worksheet.id, new_last),
+                ]})
+                self._last_row[worksheet.id] = new_last
+                return len(matches)
+            except Exception:
+                self.invalidate()
+                raise
@@ -0,0 +1,127 @@
+"""
+Persistenter Stream-Katalog für m3u_monitor.py (SQLite).
+
+Pro Stream (Hash wie M3UCombiner.get_stream_hash): URL, #EXTINF, Quelle,
+letzter Status, Zähler für die Planung (Erfolge/Fehler in Folge,
+Wechselhäufigkeit) und der Zeitpunkt der nächsten Prüfung. Streams, die
+aus den Eingabe-Playlists verschwinden, werden inaktiv statt gelöscht —
+kommen sie zurück, bleibt ihre Historie erhalten.
+"""
+import time
+import sqlite3
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS streams (
+        hash TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        info TEXT,
+        source TEXT,
+        status TEXT,
+        error TEXT,
+        checks INTEGER NOT NULL DEFAULT 0,
+        failures INTEGER NOT NULL DEFAULT 0,
+        consecutive_ok INTEGER NOT NULL DEFAULT 0,
+        consecutive_fail INTEGER NOT NULL DEFAULT 0,
+        flap REAL NOT NULL DEFAULT 0,
+        first_seen REAL NOT NULL,
+        last_seen REAL NOT NULL,
+        last_checked REAL,
+        next_check REAL NOT NULL,
+        active INTEGER NOT NULL DEFAULT 1
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_streams_active_next ON streams (active, next_check)",
+)
+
+SQL_UPSERT = """
+    INSERT INTO streams (hash, url, info, source, first_seen, last_seen, next_check)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(hash) DO UPDATE SET
+        url = excluded.url,
+        info = excluded.info,
+        source = excluded.source,
+        last_seen = excluded.last_seen,
+        active = 1
+"""
+SQL_DEACTIVATE = "UPDATE streams SET active = 0 WHERE active = 1 AND last_seen < ?"
+SQL_SELECT_SCHEDULE = "SELECT hash, next_check FROM streams WHERE active = 1"
+SQL_SELECT_STREAM = "SELECT * FROM streams WHERE hash = ?"
+SQL_RECORD = """
+    UPDATE streams SET
+        status = ?, error = ?, checks = checks + 1, failures = failures + ?,
+        consecutive_ok = ?, consecutive_fail = ?, flap = ?,
+        last_checked = ?, next_check = ?
+    WHERE hash = ?
+"""
+SQL_SELECT_WORKING = """
+    SELECT info, url, source FROM streams
+    WHERE active = 1 AND status = 'working'
+    ORDER BY source, info
+"""
+SQL_COUNTS = """
+    SELECT COUNT(*),
+           COALESCE(SUM(status = 'working'), 0),
+           COALESCE(SUM(next_check <= ?), 0),
+           COALESCE(SUM(status IS NULL), 0)
+    FROM streams WHERE active = 1
+"""
+
+
+class StreamCatalog:
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+
+    def close(self):
+        self._conn.close()
+
+    def sync(self, streams, now=None):
+        """
+        Katalog an die aktuellen Eingabe-Streams anpassen. Neue sind sofort
+        fällig; nicht mehr vorhandene werden inaktiv.
+        Rückgabe: (neu, entfernt)
+        """
+        now = now or time.time()
+        with self._conn:
+            before = self._conn.execute("SELECT COUNT(*) FROM streams").fetchone()[0]
+            self._conn.executemany(SQL_UPSERT, (
+                (s['hash'], s['url'], s.get('info'), s.get('source_playlist'), now, now, now)
+                for s in streams
+            ))
+            after = self._conn.execute("SELECT COUNT(*) FROM streams").fetchone()[0]
+            removed = self._conn.execute(SQL_DEACTIVATE, (now,)).rowcount
+        return after - before, removed
+
+    def schedule(self):
+        """[(next_check, hash)] aller aktiven Streams"""
+        return [(row[1], row[0]) for row in self._conn.execute(SQL_SELECT_SCHEDULE)]
+
+    def get(self, stream_hash):
+        row = self._conn.execute(SQL_SELECT_STREAM, (stream_hash,)).fetchone()
+        return dict(row) if row else None
+
+    def record(self, stream_hash, status, error, consecutive_ok, consecutive_fail, flap,
+               checked_at, next_check):
+        with self._conn:
+            self._conn.execute(SQL_RECORD, (
+                status, error, 0 if status == 'working' else 1,
+                consecutive_ok, consecutive_fail, flap,
+                checked_at, next_check, stream_hash
+            ))
+
+    def working(self):
+        """(info, url, source) aller funktionierenden aktiven Streams"""
+        return self._conn.execute(SQL_SELECT_WORKING)
+
+    def counts(self, now=None):
+        """{'active', 'working', 'due', 'unchecked'}"""
+        row = self._conn.execute(SQL_COUNTS, (now or time.time(),)).fetchone()
+        return dict(zip(('active', 'working', 'due', 'unchecked'), row))
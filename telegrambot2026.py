@@ -3,7 +3,6 @@ import tempfile
 import zipfile
 import logging
 import asyncio
-import sqlite3
 from pathlib import Path
 from datetime import datetime
 from contextlib import asynccontextmanager
@@ -11,8 +10,12 @@ import json
 import base64
 import traceback
 import re
+import time
+import functools
+from collections import defaultdict
 
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import PlainTextResponse
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -27,10 +30,26 @@ import requests
 # Google Sheets
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
-
-# Excel generation
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font
+from sheets_gateway import SheetsGateway
+
+# Локальная БД
+from dividend_store import DividendStore
+from dividend_export import ExcelExporter
+from wkn_index import WknIndex
+
+# Блокирующие операции вне event loop
+from dispatch import BlockingPool, Dispatcher, PoolSaturated
+from webhook_ingest import UpdateIngestor, IngestRejected
+
+# Проверка потоков
+from m3u_combiner_fixed import M3UCombiner
+from tool_discovery import find_tool
+from host_stats import interleave_by_host
+from proc_usage import Budget
+from job_scheduler import ProbeScheduler, ProbeCache, SchedulerBusy
+from playlist_upload import is_supported, unpack_upload, UploadError
+from job_store import JobStore, JobJournal
+from metrics import Histogram, PrometheusText
 
 # ─────────────── ЛОГИРОВАНИЕ ───────────────
 logging.basicConfig(
@@ -43,280 +62,163 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "change-me-very-secure-secret-2026")
-COMBINER_SCRIPT = "m3u_combiner_fixed.py"
+PROBE_WORKERS = int(os.getenv("PROBE_WORKERS", 8))      # общий лимит ffmpeg-проверок на весь бот
+PROBE_TIMEOUT = int(os.getenv("PROBE_TIMEOUT", 15))
+MAX_JOBS = int(os.getenv("MAX_JOBS", 10))               # больше заданий в очереди — отказ
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", 5))  # не чаще одного edit_text на чат
+PROBE_CACHE_TTL = int(os.getenv("PROBE_CACHE_TTL", 1800))      # общий кэш результатов между пользователями
+# Бюджет одной проверки: ffmpeg убивается, если превысил (пусто — без лимита)
+PROBE_CPU_BUDGET = float(os.getenv("PROBE_CPU_BUDGET", 0)) or None  # CPU-секунды
+PROBE_RSS_BUDGET = int(os.getenv("PROBE_RSS_BUDGET", 0)) or None    # МБ
 
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не задан")
 
 application: Application = None
+scheduler: ProbeScheduler = None
+FFMPEG_AVAILABLE = False  # проверяется один раз при старте
+ingestor: UpdateIngestor = None
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024   # лимит Bot API на скачивание
+MAX_PLAYLIST_BYTES = 200 * 1024 * 1024  # после распаковки
+SHARD_SIZE = 2000                       # потоков в шарде большой загрузки
+MAX_SEND_BYTES = 50 * 1024 * 1024       # лимит Bot API на отправку
+# m3u сжимается в zip в несколько раз; больше этого — результат точно не отправить
+MAX_RESULT_BYTES = 4 * MAX_SEND_BYTES
+uploads = {}  # chat_id -> {file_unique_id: задание} — для отмены повторных загрузок
+
+# Журнал проверок: переживает перезапуск контейнера
+JOBS_DB_PATH = Path("jobs.db")
+JOBS_DIR = Path("jobs")
+RESUME_MAX_AGE = 24 * 3600   # старые прерванные проверки не продолжаем
+RESUME_MAX_ATTEMPTS = 3      # проверка, которая роняет бота, не повторяется бесконечно
+job_store: JobStore = None
+journals = set()             # открытые журналы — дописываются при остановке
+resumed_tasks = set()
+
+# /metrics: если задан METRICS_TOKEN — только с заголовком Authorization: Bearer <token>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+check_durations = defaultdict(Histogram)  # итог проверки (done/cancelled/failed) -> длительность
+INGEST_QUEUE = 200         # апдейтов в очереди, дальше webhook отвечает 429
+INGEST_CONCURRENCY = 16    # апдейтов в обработке одновременно
+
+# Пулы для блокирующей работы: (потоки, очередь, таймаут в секундах)
+pools = Dispatcher(
+    db=BlockingPool("db", workers=1, max_queue=50, timeout=10),          # одно соединение SQLite
+    api=BlockingPool("api", workers=4, max_queue=20, timeout=30),        # Google Sheets
+    report=BlockingPool("report", workers=2, max_queue=4, timeout=120),  # Excel, разбор плейлистов
+)
+BUSY_TEXT = "⏳ Сервер занят, попробуйте позже"
 
 # ─────────────── ЛОКАЛЬНАЯ БД ───────────────
 DB_PATH = Path("dividends.db")
+WKN_JSON_PATHS = (Path("wkn_data.json"), Path("wkn.json.txt"))
+
+store: DividendStore = None
+exporter: ExcelExporter = None
+wkn_index = WknIndex()
 
 def init_db():
-    """Инициализация SQLite базы данных"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS dividends (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            wkn TEXT NOT NULL,
-            name TEXT NOT NULL,
-            amount REAL NOT NULL,
-            year INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS wkn_lookup (
-            code TEXT PRIMARY KEY,
-            name TEXT NOT NULL
-        )
-    """)
-    conn.commit()
-    conn.close()
+    """Инициализация SQLite базы данных (одно соединение на всё время работы)"""
+    global store, exporter
+    store = DividendStore(DB_PATH)
+    store.init_schema()
+    exporter = ExcelExporter(store)
+
+async def run_db(fn, *args):
+    """Выполнить синхронную функцию работы с БД вне event loop"""
+    return await pools.db.run(fn, *args)
 
 def add_dividend_to_db(date: str, wkn: str, name: str, amount: float, year: int):
     """Добавить дивиденд в БД"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO dividends (date, wkn, name, amount, year)
-        VALUES (?, ?, ?, ?, ?)
-    """, (date, wkn, name, amount, year))
-    conn.commit()
-    conn.close()
+    store.add_dividend(date, wkn, name, amount, year)
+    exporter.invalidate(year)
 
 def get_wkn_info(code: str):
-    """Получить информацию об акции по WKN/ISIN"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT name FROM wkn_lookup WHERE code = ?", (code,))
-    result = c.fetchone()
-    conn.close()
-    return {"name": result[0]} if result else None
+    """Получить информацию об акции по WKN/ISIN (сначала индекс в памяти, потом БД)"""
+    entry = wkn_index.get(code)
+    if entry:
+        return {"name": entry["name"]}
+    name = store.get_wkn_name(code)
+    return {"name": name} if name else None
 
 def load_wkn_json():
-    """Загрузить справочник WKN из JSON (если есть)"""
-    json_path = Path("wkn_data.json")
-    if not json_path.exists():
-        logger.info("wkn_data.json не найден, пропускаем загрузку")
+    """Загрузить справочник WKN из JSON (если есть) в индекс и БД одной транзакцией"""
+    global wkn_index
+    json_path = next((p for p in WKN_JSON_PATHS if p.exists()), None)
+    if json_path is None:
+        logger.info("wkn_data.json / wkn.json.txt не найден, пропускаем загрузку")
         return
     
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        for code, name in data.items():
-            c.execute("INSERT OR REPLACE INTO wkn_lookup (code, name) VALUES (?, ?)", (code, name))
-        conn.commit()
-        conn.close()
-        logger.info(f"Загружено {len(data)} записей WKN")
+        wkn_index = WknIndex.from_json(json_path)
+        store.replace_wkn_entries(wkn_index.code_rows())
+        logger.info(f"Загружено {len(wkn_index)} записей WKN из {json_path}")
     except Exception as e:
-        logger.error(f"Ошибка загрузки wkn_data.json: {e}")
+        logger.error(f"Ошибка загрузки {json_path}: {e}")
 
 def delete_dividends_by_date(date: str, year: int = None):
     """Удалить записи по дате из БД"""
     if year is None:
         year = datetime.now().year
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM dividends WHERE date = ? AND year = ?", (date, year))
-    deleted = c.rowcount
-    conn.commit()
-    conn.close()
+    deleted = store.delete_by_date(date, year)
+    if deleted:
+        exporter.invalidate(year)
     return deleted
 
-def generate_excel(year: int = None):
-    """Генерация Excel файла с дивидендами"""
-    if year is None:
-        year = datetime.now().year
-    
-    print(f"🔧 Генерирую Excel за {year} год...")
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        SELECT date, wkn, name, amount 
-        FROM dividends 
-        WHERE year = ? 
-        ORDER BY date
-    """, (year,))
-    rows = c.fetchall()
-    conn.close()
-    
-    print(f"📊 Найдено записей: {len(rows)}")
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = str(year)
-    
-    # Заголовки
-    headers = ["Дата", "WKN", "Акция", "Сумма (€)"]
-    ws.append(headers)
-    
-    # Стиль заголовков
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(color="FFFFFF", bold=True)
-    for col in range(1, 5):
-        cell = ws.cell(row=1, column=col)
-        cell.fill = header_fill
-        cell.font = header_font
-    
-    # Цвета для разных WKN
-    colors = [
-        "E6F3FF", "FFF0E6", "E6FFE6", "FFF6E6", "F0E6FF",
-        "FFE6E6", "E6FFFF", "FFFFE6", "F5E6FF", "E6FFF0"
-    ]
-    wkn_colors = {}
-    
-    # Данные
-    current_row = 2
-    total_sum = 0
-    
-    if rows:
-        for date, wkn, name, amount in rows:
-            ws.append([date, wkn, name, amount])
-            current_row += 1
-            total_sum += amount
-            
-            # Цвет для WKN
-            if wkn not in wkn_colors:
-                wkn_colors[wkn] = colors[len(wkn_colors) % len(colors)]
-            
-            fill = PatternFill(start_color=wkn_colors[wkn], end_color=wkn_colors[wkn], fill_type="solid")
-            for col in range(1, 5):
-                ws.cell(row=current_row, column=col).fill = fill
-    else:
-        print("⚠️ Нет данных для отображения")
-        ws.append(["Нет данных", "", "", ""])
-        current_row = 3
-    
-    # Строка с суммой
-    sum_row = current_row + 1
-    ws[f"A{sum_row}"] = "ИТОГО"
-    ws[f"D{sum_row}"] = total_sum if rows else 0
-    
-    # Стиль итоговой строки
-    total_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-    total_font = Font(bold=True)
-    for col in range(1, 5):
-        ws.cell(row=sum_row, column=col).fill = total_fill
-        ws.cell(row=sum_row, column=col).font = total_font
-    
-    # Ширина колонок
-    ws.column_dimensions['A'].width = 15
-    ws.column_dimensions['B'].width = 15
-    ws.column_dimensions['C'].width = 40
-    ws.column_dimensions['D'].width = 15
-    
-    # Форматирование чисел
-    for row in ws.iter_rows(min_row=2, max_row=current_row, min_col=4, max_col=4):
-        for cell in row:
-            cell.number_format = '#,##0.00€'
-    
-    # Форматирование итога
-    ws[f"D{sum_row}"].number_format = '#,##0.00€'
-    
-    # Сохранение
-    output_path = Path(f"dividends_{year}.xlsx")
-    wb.save(output_path)
-    
-    print(f"✅ Excel сохранен: {output_path}")
-    return output_path
+def generate_excel(year: int = None, years: list = None):
+    """Excel с дивидендами (потоковая запись, кэш по годам)"""
+    if years is None:
+        years = [year if year is not None else datetime.now().year]
+    return exporter.get(years)
 
 # ─────────────── GOOGLE SHEETS ───────────────
-COLORS = [
-    {"red": 1.0, "green": 0.9, "blue": 0.9},
-    {"red": 0.9, "green": 1.0, "blue": 0.9},
-    {"red": 0.9, "green": 0.9, "blue": 1.0},
-    {"red": 1.0, "green": 1.0, "blue": 0.9},
-    {"red": 0.9, "green": 1.0, "blue": 1.0},
-]
-
-def get_color_for_wkn(wkn: str):
-    return COLORS[hash(wkn) % len(COLORS)]
+sheets = SheetsGateway()
 
 def _get_spreadsheet():
+    return sheets.spreadsheet()
+
+def add_dividend_to_sheets(date: str, wkn: str, name: str, amount: float):
+    """Добавить дивиденд в Google Sheets (значения, цвет и формула — один запрос)"""
+    return sheets.add_entry(date, wkn, name, amount)
+
+def create_year_sheet(year: str):
+    """Создать лист года копией первого листа, с заголовком и формулой суммы"""
+    sh = _get_spreadsheet()
+    sh.duplicate_sheet(sh.sheet1.id, insert_sheet_index=1, new_sheet_name=year)
+    sheet = sh.worksheet(year)
+    sheet.clear()
+    sheet.update("A1:D2", [
+        ["Дата", "WKN", "Акция", "Сумма (€)"],
+        ["", "", "", "=SUM(D3:D1000)"]
+    ], value_input_option='USER_ENTERED')
+
+def sheets_diagnostics() -> str:
+    """Проверка доступа к Google Sheets отдельной авторизацией (для /divdebug)"""
     b64 = os.getenv("GOOGLE_CREDENTIALS_BASE64")
     if not b64:
-        raise ValueError("GOOGLE_CREDENTIALS_BASE64 не задан")
+        return "❌ GOOGLE_CREDENTIALS_BASE64 не задан"
+
     creds_dict = json.loads(base64.b64decode(b64).decode('utf-8'))
+    if "client_email" not in creds_dict:
+        return "❌ Неверный формат credentials.json"
+
     scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
     creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
     client = gspread.authorize(creds)
-    return client.open_by_key("1r2P4pF1TcICCuUAZNZm5lEpykVVZe94QZQ6-z6CrNg8")
+    sheet = client.open_by_key("1r2P4pF1TcICCuUAZNZm5lEpykVVZe94QZQ6-z6CrNg8").sheet1
+    value = sheet.acell("D2").value or "пусто"
 
-def update_sum_formula(sheet):
-    """Обновить формулу суммы в ячейке D2"""
-    try:
-        rows = sheet.get_all_values()
-        last_row = 2
-        for i, r in enumerate(rows[2:], start=3):
-            if r and any(cell.strip() for cell in r[:4]):
-                last_row = i
-        
-        if last_row >= 3:
-            formula = f"=SUM(D3:D{last_row})"
-        else:
-            formula = "=SUM(D3:D3)"
-        
-        # Используем update_cell для правильной установки формулы
-        sheet.update_cell(2, 4, formula)  # row, col, value
-        return True
-    except Exception as e:
-        logger.error(f"Ошибка обновления формулы: {e}")
-        return False
-
-def add_dividend_to_sheets(date: str, wkn: str, name: str, amount: float):
-    """Добавить дивиденд в Google Sheets"""
-    try:
-        sheet = _get_spreadsheet().sheet1
-        rows = sheet.get_all_values()
-        
-        # Найти последнюю строку с данными
-        last_data_row = 2
-        for i, r in enumerate(rows[2:], start=3):
-            if r and any(cell.strip() for cell in r[:4]):
-                last_data_row = i
-        
-        new_data_row = last_data_row + 1
-        
-        # Добавляем данные
-        sheet.update(f"A{new_data_row}", [[date, wkn, name, amount]])
-        
-        # Цвет
-        color = get_color_for_wkn(wkn)
-        sheet.format(f"A{new_data_row}:D{new_data_row}", {"backgroundColor": color})
-        
-        # Обновляем формулу суммы
-        update_sum_formula(sheet)
-        
-        return True
-    except Exception as e:
-        logger.error(f"Ошибка добавления в Google Sheets: {e}")
-        return False
+    return (
+        f"✅ Google Sheets подключен!\n"
+        f"Email: {creds_dict['client_email']}\n"
+        f"D2 (формула): {value}"
+    )
 
 def delete_from_sheets(date: str):
-    """Удалить записи из Google Sheets по дате"""
+    """Удалить записи из Google Sheets по дате (один batchUpdate на все строки)"""
     try:
-        sheet = _get_spreadsheet().sheet1
-        rows = sheet.get_all_values()
-        to_del = [i+1 for i, r in enumerate(rows[2:], start=3) if r and r[0] == date]
-        
-        for i in sorted(to_del, reverse=True):
-            sheet.delete_rows(i)
-        
-        # Обновить формулу суммы
-        update_sum_formula(sheet)
-        
-        return len(to_del)
+        return sheets.delete_by_date(date)
     except Exception as e:
         logger.error(f"Ошибка удаления из Google Sheets: {e}")
         return 0
@@ -325,10 +227,99 @@ def delete_from_sheets(date: str):
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "👋 Привет!\n\n"
-        "📺 Пришли .m3u/.m3u8/.txt файл — проверю потоки\n"
+        "📺 Пришли .m3u/.m3u8/.txt файл (можно .gz/.zip/.xz) — проверю потоки\n"
+        "⛔ /cancel — остановить проверку\n"
         "💰 Скрытые команды: /mysecret"
     )
 
+def format_progress(event: dict) -> str:
+    text = (
+        f"🔍 Проверено {event['tested']}/{event['total']}\n"
+        f"✅ {event['working']}  ❌ {event['failed']}"
+    )
+    if event.get('eta_s') is not None:
+        text += f"\n⏱ осталось ~{max(1, round(event['eta_s'] / 60))} мин"
+    return text
+
+class ProgressReporter:
+    """
+    Превращает события прогресса в edit_text не чаще раза в PROGRESS_INTERVAL
+    на чат (лимит общий для всех заданий чата — защита от flood control).
+    Вызывается в потоке event loop.
+    """
+    _last_edit = {}  # chat_id -> time.monotonic() последнего edit_text (только за interval)
+
+    def __init__(self, msg, chat_id, interval=PROGRESS_INTERVAL):
+        self.msg = msg
+        self.chat_id = chat_id
+        self.interval = interval
+        self._latest = None
+        self._timer = None
+        self._task = None
+        # Сообщение только что отправлено/изменено — первый апдейт через interval
+        self._mark_edit()
+
+    def _mark_edit(self):
+        now = time.monotonic()
+        # Отметки старше interval на задержку уже не влияют — не копим их
+        for chat_id, last in list(self._last_edit.items()):
+            if now - last >= self.interval:
+                del self._last_edit[chat_id]
+        self._last_edit[self.chat_id] = now
+
+    def __call__(self, event: dict):
+        self._latest = event
+        if self._timer is None:
+            last = self._last_edit.get(self.chat_id, 0.0)
+            delay = max(0.0, last + self.interval - time.monotonic())
+            self._timer = asyncio.get_running_loop().call_later(delay, self._flush)
+
+    def _flush(self):
+        self._timer = None
+        event, self._latest = self._latest, None
+        if event is None or (self._task and not self._task.done()):
+            # Предыдущий edit ещё в пути — отправим свежее состояние позже
+            if event is not None:
+                self(event)
+            return
+        self._mark_edit()
+        self._task = asyncio.create_task(self._edit(format_progress(event)))
+
+    async def _edit(self, text: str):
+        try:
+            await self.msg.edit_text(text)
+        except Exception as e:
+            logger.debug(f"Прогресс не обновлён: {e}")
+
+    async def close(self):
+        """Остановить обновления и дождаться edit_text, который уже в пути:
+        иначе он может прийти после итогового текста и затереть его"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._latest = None
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+CANCEL_TEXTS = {
+    'cancelled': "⛔ Проверка отменена",
+    'duplicate': "⛔ Отменено: тот же файл загружен повторно",
+    'too_large': "❌ Остановлено: результат больше 50 МБ — Telegram не даст его отправить",
+}
+
+# /cancel - остановить проверки этого чата
+async def cancel_checks(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cancelled = scheduler.cancel_chat(update.effective_chat.id)
+    if cancelled:
+        await update.message.reply_text(f"⛔ Остановлено проверок: {cancelled}")
+    else:
+        await update.message.reply_text("Нет активных проверок")
+
+def _zip_playlist(m3u_path: Path, zip_path: Path):
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.write(m3u_path, "good.m3u")
+
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     document = update.message.document
     if not document:
@@ -336,63 +327,134 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     name = (document.file_name or "").lower()
-    if not any(name.endswith(ext) for ext in ('.m3u', '.m3u8', '.txt', '.text')):
-        await update.message.reply_text("Поддерживаются: .m3u, .m3u8, .txt")
+    if not is_supported(name):
+        await update.message.reply_text("Поддерживаются: .m3u, .m3u8, .txt и сжатые .gz, .zip, .xz")
+        return
+    if document.file_size and document.file_size > MAX_DOWNLOAD_BYTES:
+        await update.message.reply_text("❌ Файл больше 20 МБ — Telegram не даёт боту его скачать. Сожмите его в .xz или .gz")
+        return
+
+    if not FFMPEG_AVAILABLE:
+        await update.message.reply_text("❌ FFmpeg не установлен на сервере")
         return
 
     msg = await update.message.reply_text("📥 Скачиваю...")
+    chat_id = update.effective_chat.id
     
     try:
         with tempfile.TemporaryDirectory() as tmp_str:
             tmp = Path(tmp_str)
+            upload_path = tmp / "upload"
             input_path = tmp / "input.m3u"
             
-            # Скачивание файла
+            # Скачивание файла и распаковка (для .gz/.zip/.xz — потоком)
             file = await document.get_file()
-            await file.download_to_drive(custom_path=str(input_path))
+            await file.download_to_drive(custom_path=str(upload_path))
+            await pools.report.run(unpack_upload, upload_path, name, input_path, MAX_PLAYLIST_BYTES)
 
-            await msg.edit_text("🔍 Проверяю потоки... (3—20 мин)")
+            # Копия входа и запись в журнале — проверка переживёт перезапуск
+            job_id = await run_db(job_store.create, chat_id, document.file_unique_id, name, input_path)
+    except UploadError as e:
+        await msg.edit_text(f"❌ {e}")
+        return
+    except (PoolSaturated, asyncio.TimeoutError):
+        await msg.edit_text(BUSY_TEXT)
+        return
+    except Exception as e:
+        logger.exception("Ошибка загрузки плейлиста")
+        await msg.edit_text(f"💥 Ошибка: {str(e)[:200]}")
+        return
 
-            # Проверка FFmpeg
-            try:
-                proc = await asyncio.create_subprocess_exec(
-                    "ffmpeg", "-version",
-                    stdout=asyncio.subprocess.DEVNULL,
-                    stderr=asyncio.subprocess.DEVNULL
-                )
-                await proc.communicate()
-                if proc.returncode != 0:
-                    raise FileNotFoundError("FFmpeg error")
-            except Exception as e:
-                logger.error(f"FFmpeg check failed: {e}")
-                await msg.edit_text("❌ FFmpeg не установлен на сервере")
-                return
+    await run_check(job_id, chat_id, document.file_unique_id, msg)
+
+async def run_check(job_id: int, chat_id: int, file_unique_id: str, msg):
+    """
+    Проверка сохранённого плейлиста job_id: потоки из журнала не проверяются
+    повторно, результат уходит в чат chat_id. Используется и для новых
+    загрузок, и для продолжения после перезапуска.
+    """
+    status = 'failed'
+    journal = None
+    started = time.monotonic()
+    try:
+        combiner = M3UCombiner(timeout=PROBE_TIMEOUT)
+        input_path = job_store.input_path(job_id)
+        streams = await pools.report.run(combiner.extract_streams_from_m3u, input_path)
+        if not streams:
+            status = 'done'
+            await msg.edit_text("❌ В файле нет ссылок на потоки")
+            return
 
-            output_m3u = tmp / "good.m3u"
-            
-            # Запуск скрипта проверки
-            cmd = [
-                "python3", COMBINER_SCRIPT, 
-                str(tmp), 
-                "-w", "4", 
-                "-t", "15", 
-                "-o", str(output_m3u)
-            ]
-            
-            proc = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+        # Уже проверенное до перезапуска
+        done = await run_db(job_store.completed, job_id)
+        restored = [{**s, **done[s['hash']]} for s in streams if s['hash'] in done]
+        # Хосты по очереди: плейлисты сгруппированы по провайдеру, иначе первые
+        # минуты все воркеры бьют в один хост
+        remaining = interleave_by_host([s for s in streams if s['hash'] not in done])
+
+        # Тот же файл ещё проверяется — старую проверку отменяем
+        chat_uploads = uploads.setdefault(chat_id, {})
+        previous = chat_uploads.pop(file_unique_id, None)
+        if previous is not None:
+            scheduler.cancel(previous, 'duplicate')
+
+        # Постановка в общую очередь проверок
+        reporter = ProgressReporter(msg, chat_id)
+        journal = JobJournal(job_id, lambda jid, rows: run_db(job_store.journal, jid, rows))
+        journals.add(journal)
+        options = dict(on_progress=reporter, max_result_bytes=MAX_RESULT_BYTES, on_result=journal.record)
+        try:
+            if len(remaining) > SHARD_SIZE:
+                job = scheduler.submit_sharded(chat_id, remaining, SHARD_SIZE, **options)
+            else:
+                job = scheduler.submit(chat_id, remaining, **options)
+        except SchedulerBusy as e:
+            await msg.edit_text(f"⏳ {e}")
+            status = 'cancelled'
+            return
+
+        chat_uploads[file_unique_id] = job
+        if not job.finished.done():
+            cached_note = f" (из кэша: {job.cached})" if job.cached else ""
+            restored_note = f"\n♻️ Уже проверено до перезапуска: {len(restored)}" if restored else ""
+            await msg.edit_text(
+                f"🔍 Проверяю {len(remaining)} потоков...{cached_note}{restored_note}\n⛔ /cancel — остановить"
             )
-            
-            stdout, stderr = await proc.communicate()
-            
-            if proc.returncode != 0:
-                error_msg = stderr.decode('utf-8', errors='ignore')[:500]
-                logger.error(f"Combiner error: {error_msg}")
-                await msg.edit_text(f"❌ Ошибка обработки:\n{error_msg}")
-                return
+        try:
+            await job.finished
+        finally:
+            await reporter.close()
+            if chat_uploads.get(file_unique_id) is job:
+                del chat_uploads[file_unique_id]
+
+        if job.cancel_reason == 'shutdown':
+            # Проверка остаётся в журнале и продолжится после запуска
+            status = None
+            journal.flush_sync(job_store)
+            await msg.edit_text("♻️ Бот перезапускается — проверка продолжится после запуска")
+            return
+        if job.cancelled:
+            status = 'cancelled'
+            await msg.edit_text(CANCEL_TEXTS.get(job.cancel_reason, CANCEL_TEXTS['cancelled']))
+            return
 
+        restored_working = [r for r in restored if r.get('status') == 'working']
+        working = len(restored_working) + job.working
+        total = len(streams)
+
+        with tempfile.TemporaryDirectory() as tmp_str:
+            tmp = Path(tmp_str)
+            output_m3u = tmp / "good.m3u"
+            combiner.working_streams = restored_working + job.working_streams()
+            combiner.stats['playlists_processed'][input_path.name] = {
+                'path': str(input_path),
+                'streams_found': total,
+                'streams_working': working,
+                'streams_failed': total - working
+            }
+            await pools.report.run(combiner.create_combined_m3u, output_m3u)
+
+            status = 'done'
             if not output_m3u.exists() or output_m3u.stat().st_size < 200:
                 await msg.edit_text("❌ Не найдено рабочих потоков")
                 return
@@ -401,32 +463,80 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
             zip_name = f"m3u_{datetime.now().strftime('%Y%m%d_%H%M')}.zip"
             zip_path = tmp / zip_name
             
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                zf.write(output_m3u, "good.m3u")
+            await pools.report.run(_zip_playlist, output_m3u, zip_path)
 
             # Отправка
             file_size = zip_path.stat().st_size
-            if file_size > 50 * 1024 * 1024:
+            if file_size > MAX_SEND_BYTES:
                 await msg.edit_text("❌ Файл >50 МБ — слишком большой для отправки")
                 return
             
             await msg.edit_text("📤 Отправляю результат...")
             
             with open(zip_path, "rb") as f:
-                await update.message.reply_document(
+                await application.bot.send_document(
+                    chat_id=chat_id,
                     document=f,
                     filename=zip_name,
-                    caption=f"✅ Готово! Размер: {file_size / 1024:.1f} KB"
+                    caption=f"✅ Готово! Рабочих: {working}/{total}, размер: {file_size / 1024:.1f} KB"
                 )
             
             await msg.delete()
 
+    except asyncio.CancelledError:
+        # Остановка бота: проверка остаётся в журнале и продолжится после рестарта
+        status = None
+        if journal is not None:
+            journal.flush_sync(job_store)
+        raise
+    except (PoolSaturated, asyncio.TimeoutError):
+        await msg.edit_text(BUSY_TEXT)
     except Exception as e:
         logger.exception("Критическая ошибка при обработки плейлиста")
         try:
             await msg.edit_text(f"💥 Ошибка: {str(e)[:200]}")
         except:
-            await update.message.reply_text("💥 Ошибка обработки файла")
+            await application.bot.send_message(chat_id, "💥 Ошибка обработки файла")
+    finally:
+        if journal is not None:
+            journals.discard(journal)
+        if status is not None:
+            check_durations[status].record(time.monotonic() - started)
+            try:
+                if journal is not None:
+                    await journal.close()  # иначе запоздалая запись журнала переживёт finish
+                await run_db(job_store.finish, job_id, status)
+            except Exception as e:
+                logger.error(f"Проверка #{job_id} не закрыта в журнале: {e}")
+
+async def resume_checks():
+    """Продолжить проверки, прерванные перезапуском (после старта бота)"""
+    for record in await run_db(job_store.unfinished):
+        job_id, chat_id = record['id'], record['chat_id']
+        too_old = time.time() - record['created_at'] > RESUME_MAX_AGE
+        if too_old or record['attempts'] >= RESUME_MAX_ATTEMPTS or not job_store.input_path(job_id).exists():
+            await run_db(job_store.finish, job_id, 'expired')
+            try:
+                await application.bot.send_message(
+                    chat_id, f"⚠️ Проверка {record['file_name'] or ''} прервана перезапуском. Пришлите файл ещё раз"
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось уведомить чат {chat_id}: {e}")
+            continue
+
+        await run_db(job_store.bump_attempts, job_id)
+        logger.info(f"Продолжаю проверку #{job_id} (чат {chat_id})")
+        try:
+            msg = await application.bot.send_message(
+                chat_id, f"♻️ Бот перезапущен — продолжаю проверку {record['file_name'] or ''}"
+            )
+        except Exception as e:
+            logger.warning(f"Чат {chat_id} недоступен, проверка #{job_id} закрыта: {e}")
+            await run_db(job_store.finish, job_id, 'failed')
+            continue
+        task = asyncio.create_task(run_check(job_id, chat_id, record['file_unique_id'], msg))
+        resumed_tasks.add(task)
+        task.add_done_callback(resumed_tasks.discard)
 
 # ─────────────── СКРЫТЫЕ КОМАНДЫ ───────────────
 async def handle_hidden_commands(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -440,9 +550,12 @@ async def handle_hidden_commands(update: Update, context: ContextTypes.DEFAULT_T
             "• <code>isinDE00012345 30euro</code> — добавить по ISIN\n"
             "• <code>del02.06</code> — удалить записи за 2 июня\n"
             "• <code>new27</code> — создать лист на 2027 год\n"
-            "• <code>/divxlsx</code> — скачать Excel\n"
+            "• <code>/divxlsx</code> — скачать Excel (<code>/divxlsx 2024 2025</code>, <code>/divxlsx all</code>)\n"
             "• <code>/divlog</code> — последние записи\n"
-            "• <code>/divdebug</code> — тест Google Sheets",
+            "• <code>/divsum</code> — итоги по годам и месяцам (<code>/divsum 2024</code>)\n"
+            "• <code>/divtop</code> — крупнейшие плательщики (<code>/divtop 2024 5</code>, <code>/divtop 5</code>)\n"
+            "• <code>/divdebug</code> — тест Google Sheets\n"
+            "• <code>/wkn basf</code> — поиск WKN/ISIN/тикера",
             parse_mode="HTML"
         )
         return
@@ -451,15 +564,10 @@ async def handle_hidden_commands(update: Update, context: ContextTypes.DEFAULT_T
     if match := re.fullmatch(r"new(\d{2})", text, re.IGNORECASE):
         year = f"20{match.group(1)}"
         try:
-            sh = _get_spreadsheet()
-            sh.duplicate_sheet(sh.sheet1.id, insert_sheet_index=1, new_sheet_name=year)
-            sheet = sh.worksheet(year)
-            sheet.clear()
-            sheet.update("A1:D2", [
-                ["Дата", "WKN", "Акция", "Сумма (€)"],
-                ["", "", "", "=SUM(D3:D1000)"]
-            ], value_input_option='USER_ENTERED')
+            await pools.api.run(create_year_sheet, year)
             await update.message.reply_text(f"🆕 Лист {year} создан в Google Sheets")
+        except (PoolSaturated, asyncio.TimeoutError):
+            await update.message.reply_text(BUSY_TEXT)
         except Exception as e:
             logger.error(f"new error: {e}")
             await update.message.reply_text("❌ Ошибка создания листа")
@@ -470,11 +578,15 @@ async def handle_hidden_commands(update: Update, context: ContextTypes.DEFAULT_T
         day, month = match.groups()
         target = f"{day}.{month}.{datetime.now().year}"
         
-        # Удалить из БД
-        deleted_db = delete_dividends_by_date(target)
-        
-        # Удалить из Sheets
-        deleted_sheets = delete_from_sheets(target)
+        try:
+            # Удалить из БД
+            deleted_db = await run_db(delete_dividends_by_date, target)
+            
+            # Удалить из Sheets
+            deleted_sheets = await pools.api.run(delete_from_sheets, target)
+        except (PoolSaturated, asyncio.TimeoutError):
+            await update.message.reply_text(BUSY_TEXT)
+            return
         
         await update.message.reply_text(
             f"🗑️ Удалено:\n"
@@ -494,8 +606,12 @@ async def handle_hidden_commands(update: Update, context: ContextTypes.DEFAULT_T
         amount = float(match.group("amount"))
 
         try:
-            # Поиск в базе
-            stock_info = get_wkn_info(code)
+            # Индекс загружен — он и есть справочник, промах в БД не ищем;
+            # БД — только если JSON при старте не нашёлся
+            if len(wkn_index):
+                stock_info = wkn_index.get(code)
+            else:
+                stock_info = await run_db(get_wkn_info, code)
             
             if stock_info:
                 stock_name = stock_info["name"]
@@ -506,10 +622,13 @@ async def handle_hidden_commands(update: Update, context: ContextTypes.DEFAULT_T
             year = datetime.now().year
             
             # Добавить в БД
-            add_dividend_to_db(date_str, code, stock_name, amount, year)
+            await run_db(add_dividend_to_db, date_str, code, stock_name, amount, year)
             
             # Добавить в Google Sheets
-            sheets_ok = add_dividend_to_sheets(date_str, code, stock_name, amount)
+            try:
+                sheets_ok = await pools.api.run(add_dividend_to_sheets, date_str, code, stock_name, amount)
+            except (PoolSaturated, asyncio.TimeoutError):
+                sheets_ok = False
             
             status = "✅ Добавлено в БД и Sheets" if sheets_ok else "⚠️ Добавлено в БД (Sheets недоступен)"
             
@@ -519,25 +638,34 @@ async def handle_hidden_commands(update: Update, context: ContextTypes.DEFAULT_T
                 f"🏢 {stock_name}\n"
                 f"💶 {amount}€"
             )
+        except (PoolSaturated, asyncio.TimeoutError):
+            await update.message.reply_text(BUSY_TEXT)
         except Exception as e:
             logger.error(f"Ошибка добавления дивиденда: {e}")
             await update.message.reply_text("❌ Ошибка при добавлении")
         return
 
-# /divxlsx - скачать Excel
+# /divxlsx 2024 2025 или /divxlsx all - несколько лет, по листу на год
 async def download_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        year = datetime.now().year
-        xlsx_path = generate_excel(year)
+        args = context.args or []
+        if args == ["all"]:
+            years = await run_db(store.dividend_years) or [datetime.now().year]
+        elif args and all(a.isdigit() for a in args):
+            years = sorted({int(a) for a in args})
+        else:
+            years = [datetime.now().year]
+        xlsx_path = await pools.report.run(functools.partial(generate_excel, years=years))
         
+        label = str(years[0]) if len(years) == 1 else f"{years[0]}–{years[-1]}"
         with open(xlsx_path, "rb") as f:
             await update.message.reply_document(
                 document=f,
-                filename=f"dividends_{year}.xlsx",
-                caption=f"📊 Дивиденды за {year} год"
+                filename=f"dividends_{label}.xlsx",
+                caption=f"📊 Дивиденды за {label}"
             )
-        
-        xlsx_path.unlink()  # Удалить временный файл
+    except (PoolSaturated, asyncio.TimeoutError):
+        await update.message.reply_text(BUSY_TEXT)
     except Exception as e:
         logger.error(f"Ошибка генерации Excel: {e}")
         await update.message.reply_text("❌ Ошибка при создании файла")
@@ -545,17 +673,7 @@ async def download_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # /divlog - показать последние записи
 async def show_log(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            SELECT date, wkn, name, amount 
-            FROM dividends 
-            WHERE year = ? 
-            ORDER BY created_at DESC 
-            LIMIT 10
-        """, (datetime.now().year,))
-        rows = c.fetchall()
-        conn.close()
+        rows = await run_db(store.recent_dividends, datetime.now().year, 10)
         
         if not rows:
             await update.message.reply_text("🔭 Записей нет")
@@ -567,56 +685,147 @@ async def show_log(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += f"• {date} | {wkn} | {name} | {amount}€\n"
             total += amount
         
+        year_total, year_count = await run_db(store.year_total, datetime.now().year)
         text += f"\n💰 Сумма: {total:.2f}€"
+        text += f"\n📅 За год: {year_total:.2f}€ ({year_count} записей)"
         await update.message.reply_text(text)
         
+    except (PoolSaturated, asyncio.TimeoutError):
+        await update.message.reply_text(BUSY_TEXT)
     except Exception as e:
         logger.error(f"Ошибка показа логов: {e}")
         await update.message.reply_text("❌ Ошибка")
 
-# /divdebug - диагностика Google Sheets
-async def divdebug(update: Update, context: ContextTypes.DEFAULT_TYPE):
+MONTHS = ["янв", "фев", "мар", "апр", "май", "июн", "июл", "авг", "сен", "окт", "ноя", "дек"]
+
+# /divsum [год] - итоги за год по месяцам и по всем годам
+async def show_totals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args or []
+    year = int(args[0]) if args and args[0].isdigit() else datetime.now().year
     try:
-        b64 = os.getenv("GOOGLE_CREDENTIALS_BASE64")
-        if not b64:
-            await update.message.reply_text("❌ GOOGLE_CREDENTIALS_BASE64 не задан")
-            return
+        months = await run_db(store.month_totals, year)
+        years = await run_db(store.year_totals)
+    except (PoolSaturated, asyncio.TimeoutError):
+        await update.message.reply_text(BUSY_TEXT)
+        return
 
-        creds_dict = json.loads(base64.b64decode(b64).decode('utf-8'))
-        if "client_email" not in creds_dict:
-            await update.message.reply_text("❌ Неверный формат credentials.json")
-            return
+    text = f"📅 {year} по месяцам:\n"
+    if months:
+        text += "\n".join(f"• {MONTHS[m - 1]}: {total:.2f}€ ({count})" for m, total, count in months)
+    else:
+        text += "нет записей"
+    if years:
+        text += "\n\n📊 По годам:\n"
+        text += "\n".join(f"• {y}: {total:.2f}€ ({count})" for y, total, count in years)
+    await update.message.reply_text(text)
+
+# /divtop [год] [N] - крупнейшие плательщики
+async def show_top(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Год — только четыре цифры, небольшое число — размер топа (/divtop 5, /divtop 2024 5)
+    year, limit = datetime.now().year, 10
+    for arg in context.args or []:
+        if not arg.isdigit():
+            continue
+        if len(arg) == 4:
+            year = int(arg)
+        else:
+            limit = min(max(int(arg), 1), 50)
+    try:
+        rows = await run_db(store.top_wkns, year, limit)
+    except (PoolSaturated, asyncio.TimeoutError):
+        await update.message.reply_text(BUSY_TEXT)
+        return
 
-        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key("1r2P4pF1TcICCuUAZNZm5lEpykVVZe94QZQ6-z6CrNg8").sheet1
-        value = sheet.acell("D2").value or "пусто"
+    if not rows:
+        await update.message.reply_text(f"🔭 За {year} записей нет")
+        return
+    text = f"🏆 Топ-{len(rows)} за {year}:\n\n" + "\n".join(
+        f"{i}. {name} ({wkn}) — {total:.2f}€, выплат: {count}"
+        for i, (wkn, name, total, count) in enumerate(rows, start=1)
+    )
+    await update.message.reply_text(text)
 
-        await update.message.reply_text(
-            f"✅ Google Sheets подключен!\n"
-            f"Email: {creds_dict['client_email']}\n"
-            f"D2 (формула): {value}"
-        )
+# /wkn <запрос> - поиск в справочнике
+async def find_wkn(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = " ".join(context.args or []).strip()
+    if not query:
+        await update.message.reply_text("Использование: /wkn <WKN, ISIN, тикер или название>")
+        return
+
+    found = wkn_index.search(query, limit=5)
+    if not found:
+        await update.message.reply_text("🔭 Ничего не найдено")
+        return
+
+    text = "\n".join(
+        f"• {e['name']} | WKN {e['wkn'] or '—'} | {e['isin'] or '—'} | {e['ticker'] or '—'}"
+        for e in found
+    )
+    await update.message.reply_text(f"🔎 Найдено:\n\n{text}")
 
+# /divdebug - диагностика Google Sheets
+async def divdebug(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await update.message.reply_text(await pools.api.run(sheets_diagnostics))
+    except (PoolSaturated, asyncio.TimeoutError):
+        await update.message.reply_text(BUSY_TEXT)
     except Exception as e:
         error_detail = traceback.format_exc()
         msg = f"❌ Ошибка:\n\n{error_detail[-3900:]}"
         await update.message.reply_text(msg)
 
 # ─────────────── FASTAPI ───────────────
+async def check_ffmpeg() -> bool:
+    """Однократная проверка FFmpeg при старте (не на каждую загрузку)"""
+    # Тот же бинарник, что запускает M3UCombiner (учитывает $FFMPEG)
+    ffmpeg = find_tool('ffmpeg', 'FFMPEG')
+    if ffmpeg is None:
+        return False
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            ffmpeg, "-version",
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        await proc.communicate()
+        return proc.returncode == 0
+    except Exception as e:
+        logger.error(f"FFmpeg check failed: {e}")
+        return False
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global application
+    global application, scheduler, ingestor, job_store, FFMPEG_AVAILABLE
     
     # Инициализация
     init_db()
     load_wkn_json()
+    job_store = JobStore(JOBS_DB_PATH, JOBS_DIR)
+
+    FFMPEG_AVAILABLE = await check_ffmpeg()
+    if not FFMPEG_AVAILABLE:
+        logger.error("FFmpeg не найден — проверка плейлистов отключена")
+    scheduler = ProbeScheduler(
+        M3UCombiner(
+            timeout=PROBE_TIMEOUT,
+            budget=Budget(PROBE_CPU_BUDGET, PROBE_RSS_BUDGET),
+            collect_usage=False
+        ).test_stream,
+        max_workers=PROBE_WORKERS,
+        max_jobs=MAX_JOBS,
+        cache=ProbeCache(ttl=PROBE_CACHE_TTL, negative_ttl=PROBE_CACHE_TTL // 3)
+    )
     
     application = Application.builder().token(BOT_TOKEN).build()
     await application.initialize()
     await application.start()
 
+    async def process_payload(payload):
+        await application.process_update(Update.de_json(payload, application.bot))
+
+    ingestor = UpdateIngestor(process_payload, max_queue=INGEST_QUEUE, max_concurrency=INGEST_CONCURRENCY)
+    ingestor.start()
+
     # Установка webhook после старта
     webhook_url = f"https://{os.getenv('RENDER_EXTERNAL_HOSTNAME')}/{WEBHOOK_SECRET}"
     await application.bot.set_webhook(
@@ -628,19 +837,36 @@ async def lifespan(app: FastAPI):
     
     # Handlers
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("cancel", cancel_checks))
     application.add_handler(CommandHandler("mysecret", handle_hidden_commands))
     application.add_handler(CommandHandler("divxlsx", download_excel))
     application.add_handler(CommandHandler("divlog", show_log))
     application.add_handler(CommandHandler("divdebug", divdebug))
-    application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+    application.add_handler(CommandHandler("divsum", show_totals))
+    application.add_handler(CommandHandler("divtop", show_top))
+    application.add_handler(CommandHandler("wkn", find_wkn))
+    # block=False: проверка идёт минуты и не должна задерживать другие апдейты
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_document, block=False))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_hidden_commands))
     
     logger.info("✅ Бот запущен")
+    if FFMPEG_AVAILABLE:
+        await resume_checks()
     yield
     
-    # Shutdown
+    # Shutdown: проверки не теряются — журнал дописывается, после запуска они продолжатся
+    await ingestor.stop()
+    scheduler.cancel_all('shutdown')
     await application.stop()
+    for task in list(resumed_tasks):
+        task.cancel()
+    # До остановки пулов: пачки журнала, уже отправленные в пул db, должны дописаться
+    await asyncio.gather(*(journal.close() for journal in list(journals)))
     await application.shutdown()
+    scheduler.shutdown()
+    pools.shutdown()
+    store.close()
+    job_store.close()
 
 app = FastAPI(title="M3U + Dividends Bot 2026", lifespan=lifespan)
 
@@ -650,7 +876,51 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {"status": "ok", "ingest": ingestor.stats() if ingestor else None}
+
+def render_metrics() -> str:
+    out = PrometheusText("m3ubot_")
+    if scheduler is not None:
+        out.gauge("jobs", "Незавершённые проверки плейлистов", scheduler.job_count)
+        out.gauge("queued_streams", "Потоки в очереди на проверку", scheduler.queued_streams)
+        out.gauge("active_probes", "Выполняющиеся проверки", scheduler.active_probes)
+        out.gauge("probe_workers", "Размер пула проверок", scheduler.max_workers)
+        out.gauge("ffmpeg_processes", "Живые процессы ffmpeg", scheduler.running_processes)
+        for status, n in sorted(scheduler.outcomes.items()):
+            out.counter("probes_total", "Проверки потоков по результату", n, {"status": status})
+        out.counter("probe_cache_hits_total", "Ответы из кэша проверок", scheduler.cache.hits)
+        out.counter("probe_cache_misses_total", "Промахи кэша проверок", scheduler.cache.misses)
+        out.counter("probes_cancelled_total", "Проверки, убитые при отмене", scheduler.cancelled_probes)
+        out.histogram("probe_seconds", "Длительность одной проверки потока", scheduler.probe_seconds)
+        out.counter("probe_cpu_seconds_total", "CPU ffmpeg (user+sys) на проверки", scheduler.probe_cpu_seconds)
+    for status, hist in sorted(check_durations.items()):
+        out.histogram("check_seconds", "Длительность проверки плейлиста", hist, {"status": status})
+    if ingestor is not None:
+        stats = ingestor.stats()
+        out.gauge("webhook_queue_depth", "Апдейты в очереди", stats["queue_depth"])
+        out.gauge("webhook_queue_max", "Размер очереди апдейтов", stats["queue_max"])
+        out.gauge("webhook_in_progress", "Апдейты в обработке", stats["in_progress"])
+        out.gauge("webhook_oldest_queued_seconds", "Возраст старейшего апдейта в очереди",
+                  stats["oldest_queued_s"] or 0)
+        out.gauge("webhook_lag_seconds", "Задержка от приёма до обработки (последний апдейт)",
+                  stats["last_lag_s"])
+        for name in ("accepted", "duplicates", "rejected", "processed", "failed"):
+            out.counter("webhook_updates_total", "Апдейты webhook по исходу", stats[name], {"result": name})
+    for pool in pools.pools:
+        labels = {"pool": pool.name}
+        out.gauge("pool_in_flight", "Задачи в пуле (выполняются и ждут)", pool.in_flight, labels)
+        out.gauge("pool_queue_depth", "Задачи, ждущие поток", pool.queue_depth, labels)
+        out.counter("pool_rejected_total", "Отказы из-за переполнения пула", pool.rejected, labels)
+        out.counter("pool_timeouts_total", "Таймауты в пуле", pool.timed_out, labels)
+        out.histogram("pool_call_seconds", "Длительность вызовов (db — SQLite, api — Google Sheets)",
+                      pool.latency, labels)
+    return out.render()
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(403, "Forbidden")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.post(f"/{WEBHOOK_SECRET}")
 async def webhook(request: Request):
@@ -658,9 +928,16 @@ async def webhook(request: Request):
         raise HTTPException(403, "Forbidden")
     
     try:
-        update = Update.de_json(await request.json(), application.bot)
-        await application.update_queue.put(update)
-        return {"ok": True}
+        payload = await request.json()
+    except Exception:
+        raise HTTPException(400, "Invalid JSON")
+
+    try:
+        queued = ingestor.accept(payload)
+        return {"ok": True, "duplicate": not queued}
+    except IngestRejected as e:
+        # Telegram повторит доставку позже
+        raise HTTPException(e.status, str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error("Webhook error", exc_info=True)
         raise HTTPException(500, str(e))
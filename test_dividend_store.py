@@ -0,0 +1,113 @@
+"""
+Проверка итогов DividendStore: после вставок, удалений и прочистки
+таблицы итогов должны совпадать с SUM ... GROUP BY по dividends.
+
+    python -m unittest test_dividend_store
+"""
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from dividend_store import DividendStore
+
+SQL_EXPECTED_YEARS = "SELECT year, SUM(amount), COUNT(*) FROM dividends GROUP BY year ORDER BY year"
+SQL_EXPECTED_MONTHS = """
+    SELECT CAST(substr(date, 4, 2) AS INTEGER), SUM(amount), COUNT(*)
+    FROM dividends WHERE year = ? GROUP BY 1 ORDER BY 1
+"""
+SQL_EXPECTED_WKNS = """
+    SELECT wkn, SUM(amount), COUNT(*)
+    FROM dividends WHERE year = ? GROUP BY wkn
+"""
+
+
+class DividendTotalsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = DividendStore(str(Path(self.tmp.name) / "dividends.db"))
+        self.store.init_schema()
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def fill(self, seed=3, count=300):
+        rng = random.Random(seed)
+        for _ in range(count):
+            year = rng.choice((2025, 2026))
+            date = f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{year}"
+            wkn = f"WKN{rng.randint(1, 15)}"
+            self.store.add_dividend(date, wkn, f"Акция {wkn}", round(rng.uniform(0.1, 50), 2), year)
+
+    def query(self, sql, *params):
+        return self.store._conn.execute(sql, params).fetchall()
+
+    def assertTotalsMatch(self):
+        expected = [(y, round(t, 2), c) for y, t, c in self.query(SQL_EXPECTED_YEARS)]
+        self.assertEqual(self.store.year_totals(), expected)
+        for year, _, _ in expected:
+            self.assertEqual(self.store.year_total(year), next((t, c) for y, t, c in expected if y == year))
+            months = [(m, round(t, 2), c) for m, t, c in self.query(SQL_EXPECTED_MONTHS, year)]
+            self.assertEqual(self.store.month_totals(year), months)
+
+            wkns = {w: (round(t, 2), c) for w, t, c in self.query(SQL_EXPECTED_WKNS, year)}
+            top = self.store.top_wkns(year, limit=len(wkns))
+            self.assertEqual({w: (t, c) for w, _, t, c in top}, wkns)
+            totals = [t for _, _, t, _ in top]
+            self.assertEqual(totals, sorted(totals, reverse=True))
+        # Прочистка: строк итогов без записей не остаётся
+        for table in ("dividend_totals_year", "dividend_totals_month", "dividend_totals_wkn"):
+            self.assertEqual(self.query(f"SELECT COUNT(*) FROM {table} WHERE count <= 0"), [(0,)])
+
+    def test_totals_after_adds(self):
+        self.fill()
+        self.assertTotalsMatch()
+
+    def test_totals_after_deletes_and_prune(self):
+        self.fill()
+        dates = self.query("SELECT DISTINCT date, year FROM dividends ORDER BY date")
+        for date, year in dates[::3]:
+            self.assertGreater(self.store.delete_by_date(date, year), 0)
+        self.assertEqual(self.store.delete_by_date("31.12.2030", 2030), 0)
+        self.assertTotalsMatch()
+
+    def test_deleting_everything_empties_totals(self):
+        self.store.add_dividend("01.03.2026", "A", "Акция A", 10, 2026)
+        self.store.add_dividend("01.03.2026", "B", "Акция B", 5, 2026)
+        self.store.add_dividend("02.04.2026", "A", "Акция A", 1.5, 2026)
+
+        self.assertEqual(self.store.delete_by_date("01.03.2026", 2026), 2)
+        self.assertEqual(self.store.month_totals(2026), [(4, 1.5, 1)])
+        self.assertEqual(self.store.top_wkns(2026), [("A", "Акция A", 1.5, 1)])
+
+        self.store.delete_by_date("02.04.2026", 2026)
+        self.assertEqual(self.store.year_totals(), [])
+        self.assertEqual(self.store.year_total(2026), (0.0, 0))
+        self.assertEqual(self.store.top_wkns(2026), [])
+        self.assertTotalsMatch()
+
+    def test_init_schema_rebuilds_on_mismatch(self):
+        self.fill(count=50)
+        # Записи в обход add_dividend (как в базе до появления итогов)
+        with self.store._conn:
+            self.store._conn.execute(
+                "INSERT INTO dividends (date, wkn, name, amount, year) VALUES ('05.06.2024', 'OLD', 'Старая', 7, 2024)"
+            )
+            self.store._conn.execute("DELETE FROM dividend_totals_wkn")
+
+        self.store.init_schema()
+        self.assertEqual(self.store.year_total(2024), (7.0, 1))
+        self.assertTotalsMatch()
+
+    def test_rebuild_totals_restores_corrupted_table(self):
+        self.fill(count=50)
+        with self.store._conn:
+            self.store._conn.execute("UPDATE dividend_totals_month SET total = total + 100")
+        self.store.rebuild_totals()
+        self.assertTotalsMatch()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+"""
+Проверка ProbeScheduler с поддельной функцией проверки (без ffmpeg).
+
+    python -m unittest test_job_scheduler
+"""
+import os
+import time
+import asyncio
+import unittest
+import subprocess
+
+from job_scheduler import ProbeScheduler, ProbeCache, SchedulerBusy
+
+
+def fake_probe(stream, on_spawn):
+    """Рабочие — URL с 'ok', остальные — нет"""
+    status = 'working' if 'ok' in stream['url'] else 'failed'
+    return {**stream, 'status': status, 'error': None if status == 'working' else 'fake'}
+
+
+def gated(probe, gate: asyncio.Event):
+    """probe, который ждёт gate (проверки «висят», пока тест не разрешит)"""
+    loop = asyncio.get_running_loop()
+
+    def wrapper(stream, on_spawn):
+        asyncio.run_coroutine_threadsafe(gate.wait(), loop).result()
+        return probe(stream, on_spawn)
+    return wrapper
+
+
+def sleeping_probe(stream, on_spawn):
+    """Настоящий процесс, как ffmpeg: завершается сам через 5 с или убивается отменой"""
+    process = subprocess.Popen(['sleep', '5'], start_new_session=True)
+    on_spawn(process)
+    process.wait()
+    return {**stream, 'status': 'working' if process.returncode == 0 else 'failed'}
+
+
+def streams(*names):
+    return [{'url': f'http://host.example/{name}', 'info': f'#EXTINF:-1,{name}'} for name in names]
+
+
+class SchedulerTestCase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.gate = asyncio.Event()
+        self.scheduler = None
+
+    async def asyncTearDown(self):
+        self.gate.set()
+        self.scheduler.shutdown()
+
+    def make(self, probe_fn, max_workers=2, **kwargs):
+        self.scheduler = ProbeScheduler(probe_fn, max_workers=max_workers, cache=ProbeCache(), **kwargs)
+        return self.scheduler
+
+
+class ShardedSubmitTest(SchedulerTestCase):
+
+    async def test_group_progress_and_deduplicated_result(self):
+        self.make(fake_probe)
+        events = []
+        items = streams('ok1', 'bad1', 'ok2', 'ok1', 'bad2')  # ok1 — в двух шардах
+        group = self.scheduler.submit_sharded(1, items, 2, on_progress=events.append)
+
+        self.assertEqual(len(group.shards), 3)
+        self.assertEqual(group.total, 5)
+        await asyncio.wait_for(group.finished, 5)
+
+        self.assertEqual(group.done_count, 5)
+        self.assertEqual(group.working, 3)
+        self.assertEqual(sorted(r['url'] for r in group.working_streams()),
+                         ['http://host.example/ok1', 'http://host.example/ok2'])
+        # Прогресс — по всей группе, а не по отдельному шарду
+        self.assertTrue(all(e['total'] == 5 for e in events))
+        self.assertEqual(events[-1]['tested'], 5)
+        self.assertEqual(self.scheduler.job_count, 0)
+
+    async def test_group_is_one_upload_for_admission(self):
+        self.make(gated(fake_probe, self.gate), max_jobs_per_chat=1)
+        group = self.scheduler.submit_sharded(1, streams('a', 'b', 'c', 'd'), 2)
+
+        self.assertEqual(self.scheduler.job_count, 1)
+        with self.assertRaises(SchedulerBusy):
+            self.scheduler.submit(1, streams('e'))
+        # Другой чат не затронут
+        other = self.scheduler.submit(2, streams('f'))
+
+        self.gate.set()
+        await asyncio.wait_for(asyncio.gather(group.finished, other.finished), 5)
+        self.assertEqual(group.done_count, 4)
+
+    async def test_cancel_group_finishes_all_shards(self):
+        self.make(gated(fake_probe, self.gate))
+        group = self.scheduler.submit_sharded(1, streams('a', 'b', 'c', 'd', 'e'), 2)
+        await asyncio.sleep(0)
+
+        dropped = self.scheduler.cancel(group)
+        self.gate.set()
+        await asyncio.wait_for(group.finished, 5)
+
+        self.assertEqual(dropped, 5)
+        self.assertTrue(group.cancelled)
+        self.assertTrue(all(shard.cancelled for shard in group.shards))
+        self.assertEqual(self.scheduler.job_count, 0)
+        self.assertEqual(self.scheduler.queued_streams, 0)
+
+
+@unittest.skipUnless(os.name == 'posix', 'Группы процессов только в POSIX')
+class CancelTest(SchedulerTestCase):
+
+    async def test_shared_probe_survives_cancel_of_one_waiter(self):
+        self.make(gated(fake_probe, self.gate))
+        first = self.scheduler.submit(1, streams('ok'))
+        second = self.scheduler.submit(2, streams('ok'))
+        await asyncio.sleep(0)
+
+        self.scheduler.cancel(first)
+        self.gate.set()
+        await asyncio.wait_for(second.finished, 5)
+
+        self.assertEqual(self.scheduler.cancelled_probes, 0)
+        self.assertEqual(first.results, [])
+        self.assertEqual([r['status'] for r in second.results], ['working'])
+
+    async def test_exclusive_probe_is_killed(self):
+        self.make(sleeping_probe)
+        job = self.scheduler.submit(1, streams('slow'))
+        other = self.scheduler.submit(2, streams('other'))
+        while self.scheduler.running_processes < 2:
+            await asyncio.sleep(0.01)
+
+        started = time.monotonic()
+        self.scheduler.cancel(job)
+        await asyncio.wait_for(job.finished, 1)
+        while self.scheduler.active_probes > 1:
+            await asyncio.sleep(0.01)
+
+        self.assertLess(time.monotonic() - started, 2)  # sleep 5 убит, а не дождались
+        self.assertEqual(self.scheduler.cancelled_probes, 1)
+        self.assertEqual(job.results, [])
+        self.assertFalse(other.finished.done())  # чужая проверка не тронута
+        self.assertEqual(self.scheduler.running_processes, 1)
+        self.scheduler.cancel(other)
+
+    async def test_same_url_after_cancel_gets_fresh_probe(self):
+        self.make(gated(fake_probe, self.gate))
+        first = self.scheduler.submit(1, streams('ok'))
+        await asyncio.sleep(0)
+        self.scheduler.cancel(first)
+
+        second = self.scheduler.submit(2, streams('ok'))
+        # Своя проверка, а не ожидание убитой
+        self.assertEqual(self.scheduler.active_probes, 2)
+        self.gate.set()
+        await asyncio.wait_for(second.finished, 5)
+
+        self.assertEqual([r['status'] for r in second.results], ['working'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+Проверка Histogram (границы бакетов, count_le, перцентили) и вывода
+PrometheusText.
+
+    python -m unittest test_metrics
+"""
+import random
+import unittest
+
+from metrics import (
+    Histogram, PrometheusText, SUB_BUCKETS, UNIT,
+    _bucket_index, _bucket_lower, _bucket_upper,
+)
+
+# Относительная ширина бакета — точность count_le и percentile
+WIDTH = 1 / SUB_BUCKETS
+
+
+class BucketMathTest(unittest.TestCase):
+
+    def test_buckets_tile_the_range(self):
+        for index in range(1, 40 * SUB_BUCKETS):
+            self.assertEqual(_bucket_lower(index), _bucket_upper(index - 1) + 1)
+            self.assertEqual(_bucket_index(_bucket_lower(index)), index)
+            self.assertEqual(_bucket_index(_bucket_upper(index)), index)
+
+    def test_value_inside_its_bucket(self):
+        rng = random.Random(1)
+        for value in [0, 1, 31, 32, 33, 63, 64, 499_999, 500_000, 500_001] + \
+                [rng.randrange(10 ** 9) for _ in range(1000)]:
+            index = _bucket_index(value)
+            self.assertLessEqual(_bucket_lower(index), value)
+            self.assertLessEqual(value, _bucket_upper(index))
+
+
+class CountLeTest(unittest.TestCase):
+
+    def test_exact_bound_is_counted(self):
+        hist = Histogram()
+        for seconds in (0.49, 0.5, 0.5, 0.6):
+            hist.record(seconds)
+        self.assertEqual(hist.count_le(0.25), 0)
+        self.assertEqual(hist.count_le(0.5), 3)
+        self.assertEqual(hist.count_le(1), 4)
+
+    def test_never_misses_values_below_bound(self):
+        rng = random.Random(2)
+        values = [rng.uniform(0, 2) for _ in range(5000)]
+        hist = Histogram()
+        for v in values:
+            hist.record(v)
+        for bound in (0.005, 0.01, 0.1, 0.25, 0.5, 1, 1.5):
+            below = sum(1 for v in values if v <= bound)
+            slack = sum(1 for v in values if v <= bound * (1 + WIDTH) + 1 / UNIT)
+            self.assertGreaterEqual(hist.count_le(bound), below, bound)
+            self.assertLessEqual(hist.count_le(bound), slack, bound)
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_percentiles_within_bucket_width(self):
+        hist = Histogram()
+        for ms in range(1, 101):
+            hist.record(ms / 1000)
+        for p, exact in ((50, 0.050), (90, 0.090), (99, 0.099)):
+            value = hist.percentile(p)
+            self.assertGreaterEqual(value, exact)
+            self.assertLessEqual(value, exact * (1 + WIDTH))
+        self.assertEqual(hist.percentile(100), 0.1)
+
+    def test_empty(self):
+        self.assertIsNone(Histogram().percentile(50))
+        self.assertEqual(Histogram().count_le(1), 0)
+
+
+class PrometheusTextTest(unittest.TestCase):
+
+    def test_histogram_buckets_at_edges(self):
+        hist = Histogram()
+        for seconds in (0.1, 0.25, 0.5, 0.5, 1.0, 30.0):
+            hist.record(seconds)
+        out = PrometheusText(prefix='bot_')
+        out.histogram('probe_seconds', 'Dauer', hist, {'kind': 'x'}, bounds=(0.1, 0.25, 0.5, 1, 10))
+        lines = out.render().splitlines()
+
+        self.assertEqual(lines[:2], ['# HELP bot_probe_seconds Dauer', '# TYPE bot_probe_seconds histogram'])
+        buckets = {
+            line.split('le="')[1].split('"')[0]: int(line.rsplit(' ', 1)[1])
+            for line in lines if line.startswith('bot_probe_seconds_bucket')
+        }
+        self.assertEqual(buckets, {'0.1': 1, '0.25': 2, '0.5': 4, '1': 5, '10': 5, '+Inf': 6})
+        self.assertIn('bot_probe_seconds_count{kind="x"} 6', lines)
+        self.assertIn(f'bot_probe_seconds_sum{{kind="x"}} {float(hist.total)!r}', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
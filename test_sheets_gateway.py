@@ -0,0 +1,152 @@
+"""
+Проверка SheetsGateway на локальной заглушке Google Sheets.
+
+FakeSpreadsheet применяет запросы batch_update к списку строк в памяти
+по порядку, как это делает API: неверный порядок deleteDimension или
+сдвиг индексов на единицу сразу видны по итоговому содержимому листа.
+
+    python -m unittest test_sheets_gateway
+"""
+import asyncio
+import unittest
+
+from sheets_gateway import (
+    FIRST_DATA_ROW, SheetsGateway, contiguous_ranges, delete_rows_requests,
+)
+
+
+def _value(cell):
+    value = cell["userEnteredValue"]
+    if "formulaValue" in value:
+        return value["formulaValue"]
+    if "numberValue" in value:
+        return str(value["numberValue"])
+    return value["stringValue"]
+
+
+class FakeWorksheet:
+    id = 0
+
+    def __init__(self, rows):
+        self.rows = [list(r) for r in rows]
+
+    def get_all_values(self):
+        return [list(r) for r in self.rows]
+
+
+class FakeSpreadsheet:
+    """Заглушка для open_by_key(): sheet1 и batch_update"""
+
+    def __init__(self, rows):
+        self.sheet1 = FakeWorksheet(rows)
+        self.batches = []
+
+    def open_by_key(self, _key):
+        return self
+
+    def batch_update(self, body):
+        self.batches.append(body)
+        rows = self.sheet1.rows
+        for request in body["requests"]:
+            if "deleteDimension" in request:
+                r = request["deleteDimension"]["range"]
+                assert r["dimension"] == "ROWS"
+                del rows[r["startIndex"]:r["endIndex"]]
+            elif "updateCells" in request:
+                r = request["updateCells"]["range"]
+                for offset, row in enumerate(request["updateCells"]["rows"]):
+                    index = r["startRowIndex"] + offset
+                    while len(rows) <= index:
+                        rows.append([])
+                    target = rows[index]
+                    for col, cell in enumerate(row["values"], start=r["startColumnIndex"]):
+                        while len(target) <= col:
+                            target.append("")
+                        target[col] = _value(cell)
+            else:
+                raise AssertionError(f"Неожиданный запрос: {request}")
+
+
+def sheet(dates):
+    """Лист: заголовок, формула в D2, по строке данных на дату"""
+    rows = [["Дата", "WKN", "Акция", "Сумма"], ["", "", "", "=SUM(D3:D3)"]]
+    for i, date in enumerate(dates):
+        rows.append([date, f"WKN{i}", f"Акция {i}", str(i)])
+    return rows
+
+
+class ContiguousRangesTest(unittest.TestCase):
+
+    def test_groups_sorted_unique_rows(self):
+        self.assertEqual(contiguous_ranges([10, 4, 3, 9, 5, 4]), [(3, 5), (9, 10)])
+        self.assertEqual(contiguous_ranges([7]), [(7, 7)])
+        self.assertEqual(contiguous_ranges([]), [])
+
+    def test_delete_requests_bottom_up_zero_based(self):
+        requests = delete_rows_requests(0, [(3, 5), (9, 10)])
+        ranges = [(r["deleteDimension"]["range"]["startIndex"],
+                   r["deleteDimension"]["range"]["endIndex"]) for r in requests]
+        # Строки 9..10 -> индексы [8, 10), строки 3..5 -> [2, 5); нижний диапазон первым
+        self.assertEqual(ranges, [(8, 10), (2, 5)])
+
+
+class DeleteByDateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dates = ["01.01", "02.01", "02.01", "03.01", "02.01", "02.01", "04.01"]
+        self.fake = FakeSpreadsheet(sheet(self.dates))
+        self.gateway = SheetsGateway(client_factory=lambda: self.fake, coalesce_window=0)
+
+    def test_deletes_all_matching_rows_in_one_batch(self):
+        expected = [r for r in sheet(self.dates)[FIRST_DATA_ROW - 1:] if r[0] != "02.01"]
+
+        self.assertEqual(self.gateway.delete_by_date("02.01"), 4)
+
+        self.assertEqual(len(self.fake.batches), 1)
+        rows = self.fake.sheet1.rows
+        self.assertEqual(rows[FIRST_DATA_ROW - 1:], expected)
+        last = FIRST_DATA_ROW - 1 + len(expected)
+        self.assertEqual(rows[1][3], f"=SUM(D{FIRST_DATA_ROW}:D{last})")
+
+    def test_no_match_sends_nothing(self):
+        self.assertEqual(self.gateway.delete_by_date("31.12"), 0)
+        self.assertEqual(self.fake.batches, [])
+
+    def test_append_after_delete_uses_new_last_row(self):
+        self.gateway.delete_by_date("02.01")
+        self.assertTrue(self.gateway.add_entry("05.01", "NEW", "Новая", 9.5))
+
+        rows = self.fake.sheet1.rows
+        self.assertEqual(rows[-1], ["05.01", "NEW", "Новая", "9.5"])
+        self.assertEqual(len(rows), FIRST_DATA_ROW - 1 + len(self.dates) - 4 + 1)
+        self.assertEqual(rows[1][3], f"=SUM(D{FIRST_DATA_ROW}:D{len(rows)})")
+
+
+class CoalescingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeSpreadsheet(sheet(["01.01"]))
+        self.gateway = SheetsGateway(client_factory=lambda: self.fake, coalesce_window=0.2)
+
+    def test_refuses_to_block_event_loop(self):
+        async def on_loop():
+            self.gateway.add_entry("05.01", "A", "A", 1)
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(on_loop())
+        self.assertEqual(self.fake.batches, [])
+
+    def test_entries_from_pool_threads_share_one_batch(self):
+        async def from_pool():
+            return await asyncio.gather(*(
+                asyncio.to_thread(self.gateway.add_entry, "05.01", f"W{i}", f"A{i}", i)
+                for i in range(3)
+            ))
+
+        self.assertEqual(asyncio.run(from_pool()), [True, True, True])
+        self.assertEqual(len(self.fake.batches), 1)
+        self.assertEqual(len(self.fake.sheet1.rows), FIRST_DATA_ROW + 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Externe Programme (ffmpeg, tesseract) finden und ihre Fähigkeiten
+zwischenspeichern.
+
+Reihenfolge beim Suchen: Umgebungsvariable (FFMPEG, FFPROBE, TESSERACT),
+dann PATH, dann die üblichen Windows-Installationspfade.
+
+Teure Abfragen (ffmpeg -protocols, tesseract --list-langs) werden einmal
+ausgeführt und in einer JSON-Datei im Cache-Verzeichnis gespeichert —
+gültig, solange sich Pfad, Größe und Änderungszeit des Programms nicht
+ändern. Ein normaler Start kostet damit nur ein paar stat()-Aufrufe.
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+WINDOWS_PATHS = {
+    'ffmpeg': (r'C:\ProgramData\chocolatey\bin\ffmpeg.exe',),
+    'ffprobe': (r'C:\ProgramData\chocolatey\bin\ffprobe.exe',),
+    'tesseract': (r'C:\Program Files\Tesseract-OCR\tesseract.exe',
+                  r'C:\ProgramData\chocolatey\bin\tesseract.exe'),
+}
+
+
+def cache_dir() -> Path:
+    if sys.platform.startswith('win'):
+        base = os.environ.get('LOCALAPPDATA') or Path.home() / 'AppData' / 'Local'
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'm3u-checker'
+
+
+CACHE_FILE = Path(os.environ.get('M3U_TOOL_CACHE') or cache_dir() / 'tools.json')
+
+_lock = threading.Lock()
+_memo = {}  # Name -> Info (pro Prozess)
+
+
+def find_tool(name: str, env_var: str = None):
+    """Pfad zu name oder None"""
+    configured = os.environ.get(env_var or name.upper())
+    if configured:
+        return configured if os.path.exists(configured) else shutil.which(configured)
+    found = shutil.which(name)
+    if found:
+        return found
+    if sys.platform.startswith('win'):
+        for path in WINDOWS_PATHS.get(name, ()):
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def _fingerprint(path):
+    st = os.stat(path)
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+
+def _load_cache() -> dict:
+    try:
+        with open(CACHE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache: dict):
+    """Atomar schreiben; ohne Schreibrechte wird eben jedes Mal neu abgefragt"""
+    try:
+        CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_FILE.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp, CACHE_FILE)
+    except OSError:
+        pass
+
+
+def _cached(name, path, probe, refresh=False):
+    """probe(path) -> dict, zwischengespeichert pro Programm-Fingerabdruck"""
+    with _lock:
+        if name in _memo and not refresh:
+            return _memo[name]
+        fingerprint = _fingerprint(path)
+        cache = _load_cache()
+        entry = cache.get(name)
+        if refresh or not entry or entry.get('fingerprint') != fingerprint:
+            entry = {'fingerprint': fingerprint, 'path': path, **probe(path)}
+            cache[name] = entry
+            _save_cache(cache)
+        _memo[name] = entry
+        return entry
+
+
+def _run_lines(cmd):
+    try:
+        out = subprocess.run(cmd, capture_output=True, text=True, errors='ignore', timeout=15)
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    return [l.strip() for l in (out.stdout + out.stderr).splitlines() if l.strip()]
+
+
+def _probe_ffmpeg(path):
+    lines = _run_lines([path, '-hide_banner', '-protocols'])
+    protocols, section = [], None
+    for line in lines:
+        if line.endswith(':'):
+            section = line[:-1].lower()
+        elif section == 'input':
+            protocols.append(line)
+    return {'input_protocols': sorted(protocols)}
+
+
+def _probe_tesseract(path):
+    lines = _run_lines([path, '--list-langs'])
+    return {'languages': sorted(l for l in lines if not l.lower().startswith('list of'))}
+
+
+def ffmpeg_info(refresh=False):
+    """{'path', 'input_protocols'} oder None, wenn ffmpeg fehlt"""
+    path = find_tool('ffmpeg', 'FFMPEG')
+    return _cached('ffmpeg', path, _probe_ffmpeg, refresh) if path else None
+
+
+def tesseract_info(refresh=False):
+    """{'path', 'languages'} oder None, wenn tesseract fehlt"""
+    path = find_tool('tesseract', 'TESSERACT')
+    return _cached('tesseract', path, _probe_tesseract, refresh) if path else None
+
+
+def supports_url(info, url: str) -> bool:
+    """Kann dieses ffmpeg die URL öffnen? Ohne Protokoll-Liste: ja"""
+    protocols = (info or {}).get('input_protocols')
+    if not protocols or '://' not in url:
+        return True
+    return url.split('://', 1)[0].lower() in protocols
@@ -0,0 +1,176 @@
+"""
+Приём апдейтов из webhook.
+
+Telegram повторяет доставку, если не получил ответ вовремя, поэтому один
+и тот же update_id может прийти несколько раз — такие повторы отсекаются
+по окну последних update_id. Очередь ограничена: когда она заполнена,
+endpoint отвечает 429 и Telegram сам откладывает повторную доставку.
+Фоновая задача забирает апдейты пачками и передаёт их в PTB с
+ограничением на число одновременно обрабатываемых.
+"""
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class IngestRejected(Exception):
+    """Очередь заполнена или приём остановлен"""
+
+    def __init__(self, message: str, status: int = 429, retry_after: int = 1):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class UpdateIngestor:
+
+    def __init__(self, process, max_queue: int = 200, dedup_window: int = 5000,
+                 batch_size: int = 20, max_concurrency: int = 16):
+        """
+        process — корутина process(payload), обрабатывающая один апдейт
+        (JSON от Telegram в виде dict).
+        """
+        self._process = process
+        self.max_queue = max_queue
+        self.dedup_window = dedup_window
+        self.batch_size = batch_size
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._seen = OrderedDict()  # update_id -> None, старые вытесняются
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks = set()
+        self._runner = None
+        self._accepting = False
+
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.last_lag = 0.0  # сек. от приёма до передачи в обработку (последний апдейт)
+
+    # ---------- Приём ----------
+
+    def _is_duplicate(self, update_id) -> bool:
+        if update_id is None:
+            return False
+        if update_id in self._seen:
+            self._seen.move_to_end(update_id)
+            return True
+        return False
+
+    def _remember(self, update_id):
+        if update_id is None:
+            return
+        self._seen[update_id] = None
+        while len(self._seen) > self.dedup_window:
+            self._seen.popitem(last=False)
+
+    def accept(self, payload: dict) -> bool:
+        """
+        Поставить апдейт в очередь. False — повтор уже принятого update_id.
+        IngestRejected — очередь полна (429) или приём остановлен (503).
+        """
+        if not self._accepting:
+            raise IngestRejected("Приём апдейтов остановлен", status=503, retry_after=5)
+
+        update_id = payload.get("update_id")
+        if self._is_duplicate(update_id):
+            self.duplicates += 1
+            return False
+
+        try:
+            self._queue.put_nowait((time.monotonic(), payload))
+        except asyncio.QueueFull:
+            # update_id не запоминаем: повторная доставка должна пройти
+            self.rejected += 1
+            raise IngestRejected("Очередь апдейтов заполнена", retry_after=self._retry_after())
+
+        self._remember(update_id)
+        self.accepted += 1
+        return True
+
+    def _retry_after(self) -> int:
+        # Грубая оценка: сколько секунд нужно, чтобы разобрать текущую очередь
+        return max(1, min(30, round(self.last_lag) or 1))
+
+    # ---------- Обработка ----------
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            for received_at, payload in batch:
+                await self._slots.acquire()
+                self.last_lag = time.monotonic() - received_at
+                task = asyncio.create_task(self._handle(payload))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                self._queue.task_done()
+
+    async def _handle(self, payload):
+        try:
+            await self._process(payload)
+            self.processed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception(f"Ошибка обработки апдейта {payload.get('update_id')}")
+        finally:
+            self._slots.release()
+
+    def start(self):
+        self._accepting = True
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10):
+        """
+        Перестать принимать апдейты (новые POST получают 503), разобрать
+        уже принятые из очереди и дождаться их обработки — всё в пределах
+        timeout. Эти апдейты Telegram уже подтвердил, повторно он их не пришлёт.
+        """
+        self._accepting = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        if self._runner:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            # Ещё в очереди или в недоразданной пачке — не будут обработаны
+            dropped = self.accepted - self.processed - self.failed - len(self._tasks)
+            if dropped:
+                logger.warning(f"Остановка: {dropped} принятых апдейтов не успели уйти в обработку за {timeout} с")
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=max(0, deadline - loop.time()))
+
+    # ---------- Мониторинг ----------
+
+    def stats(self) -> dict:
+        oldest = None
+        if not self._queue.empty():
+            # Самый старый апдейт в очереди — первый элемент
+            oldest = round(time.monotonic() - self._queue._queue[0][0], 3)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_max": self.max_queue,
+            "in_progress": len(self._tasks),
+            "oldest_queued_s": oldest,
+            "last_lag_s": round(self.last_lag, 3),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
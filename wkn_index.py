@@ -0,0 +1,142 @@
+"""
+Справочник ценных бумаг в памяти: поиск по WKN, ISIN и тикеру за O(1),
+поиск по префиксу (bisect по отсортированным ключам) и нечёткий поиск
+по названию через индекс триграмм (строится при первом нечётком поиске,
+чтобы загрузка справочника оставалась быстрой).
+"""
+import json
+import bisect
+from pathlib import Path
+from collections import defaultdict, Counter
+
+
+def _trigrams(text: str):
+    text = f"  {text.lower()} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class WknIndex:
+
+    def __init__(self, records=()):
+        self.records = []
+        self._by_code = {}                  # WKN/ISIN/тикер (верхний регистр) -> запись
+        self._sorted_keys = []              # [(ключ, номер записи)] для поиска по префиксу
+        self._trigrams = None               # триграмма -> номера записей (лениво)
+        self._name_grams = None             # триграммы названия каждой записи
+        self.add_many(records)
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def from_json(cls, path):
+        """
+        Загрузка из JSON: список объектов {name, ticker, wkn, isin, type}
+        (как wkn.json.txt) или старый формат {код: название}.
+        """
+        with open(Path(path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = [{"wkn": code, "name": name} for code, name in data.items()]
+        return cls(data)
+
+    def add_many(self, records):
+        by_code = self._by_code
+        keys = self._sorted_keys
+        for record in records:
+            name = (record.get("name") or "").strip()
+            if not name:
+                continue
+            entry = {
+                "name": name,
+                "wkn": (record.get("wkn") or "").upper(),
+                "isin": (record.get("isin") or "").upper(),
+                "ticker": (record.get("ticker") or "").upper(),
+                "type": record.get("type") or "",
+            }
+            idx = len(self.records)
+            self.records.append(entry)
+
+            # WKN и ISIN важнее тикера: тикер не перезаписывает чужой код
+            for key in (entry["wkn"], entry["isin"]):
+                if key:
+                    by_code[key] = entry
+                    keys.append((key, idx))
+            if entry["ticker"]:
+                by_code.setdefault(entry["ticker"], entry)
+                keys.append((entry["ticker"], idx))
+            keys.append((name.upper(), idx))
+
+        keys.sort()
+        self._trigrams = None
+
+    def _build_trigrams(self):
+        trigrams = defaultdict(list)
+        name_grams = []
+        for idx, entry in enumerate(self.records):
+            grams = _trigrams(entry["name"])
+            name_grams.append(len(grams))
+            for gram in grams:
+                trigrams[gram].append(idx)
+        self._trigrams, self._name_grams = trigrams, name_grams
+
+    # ---------- Поиск ----------
+
+    def get(self, code: str):
+        """Точный поиск по WKN, ISIN или тикеру"""
+        return self._by_code.get(code.strip().upper())
+
+    def prefix(self, prefix: str, limit: int = 10):
+        """Записи, у которых код или название начинается с prefix"""
+        prefix = prefix.strip().upper()
+        if not prefix:
+            return []
+        found, seen = [], set()
+        start = bisect.bisect_left(self._sorted_keys, (prefix,))
+        for key, idx in self._sorted_keys[start:]:
+            if not key.startswith(prefix):
+                break
+            if idx not in seen:
+                seen.add(idx)
+                found.append(self.records[idx])
+                if len(found) >= limit:
+                    break
+        return found
+
+    def fuzzy(self, query: str, limit: int = 5, min_score: float = 0.3):
+        """Нечёткий поиск по названию: [(сходство 0..1, запись)], лучшие первыми"""
+        grams = _trigrams(query.strip())
+        if not grams:
+            return []
+        if self._trigrams is None:
+            self._build_trigrams()
+        shared = Counter()
+        for gram in grams:
+            for idx in self._trigrams.get(gram, ()):
+                shared[idx] += 1
+        scored = []
+        for idx, common in shared.items():
+            score = common / (len(grams) + self._name_grams[idx] - common)
+            if score >= min_score:
+                scored.append((score, self.records[idx]))
+        scored.sort(key=lambda x: (-x[0], x[1]["name"]))
+        return scored[:limit]
+
+    def search(self, query: str, limit: int = 5):
+        """Точное совпадение, затем префикс, затем нечёткий поиск по названию"""
+        exact = self.get(query)
+        if exact:
+            return [exact]
+        found = self.prefix(query, limit)
+        if found:
+            return found
+        return [record for _, record in self.fuzzy(query, limit)]
+
+    def code_rows(self):
+        """Пары (код, название) для таблицы wkn_lookup: WKN и ISIN"""
+        rows = {}
+        for entry in self.records:
+            for key in (entry["wkn"], entry["isin"]):
+                if key:
+                    rows[key] = entry["name"]
+        return list(rows.items())